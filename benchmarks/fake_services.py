@@ -0,0 +1,179 @@
+"""خوادم HTTP محلية تحاكي ipify وواجهة DB-IP و Nominatim لقياس الأداء بدون إنترنت
+
+python benchmarks/fake_services.py --port 8080 --latency 0.05 --error-rate 0.01
+"""
+import argparse
+import hashlib
+import json
+import random
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+COUNTRIES = [
+    ("Egypt", "Cairo Governorate", "Cairo", "Africa/Cairo"),
+    ("Germany", "Hesse", "Frankfurt am Main", "Europe/Berlin"),
+    ("United States", "California", "Mountain View", "America/Los_Angeles"),
+    ("Japan", "Tokyo", "Tokyo", "Asia/Tokyo"),
+    ("Brazil", "Sao Paulo", "Sao Paulo", "America/Sao_Paulo"),
+]
+
+
+def fake_location(ip):
+    """موقع ثابت لكل عنوان (نفس العنوان يعطي نفس النتيجة دائماً)"""
+    digest = hashlib.blake2b(ip.encode("utf-8"), digest_size=8).digest()
+    a, b = struct.unpack(">II", digest)
+    country, region, city, time_zone = COUNTRIES[a % len(COUNTRIES)]
+    return {
+        "ipAddress": ip, "countryName": country, "stateProv": region, "city": city,
+        "latitude": round((a % 140000) / 1000.0 - 60.0, 4), "longitude": round((b % 360000) / 1000.0 - 180.0, 4),
+        "timeZone": time_zone, "isp": "Example Transit",
+    }
+
+
+class ServiceBehaviour:
+    """زمن الاستجابة ونسبة الأخطاء لخدمة واحدة"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+
+class FakeServices:
+    """خادم واحد بمسارات /ipify و /dbip/v2/{key}/{ip} و /reverse مع عدادات طلبات لكل خدمة"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0, seed=None,
+                 public_ip="203.0.113.7"):
+        self.behaviour = {name: ServiceBehaviour(latency, jitter, error_rate) for name in ("ipify", "dbip", "nominatim")}
+        self.public_ip = public_ip
+        self.random = random.Random(seed)
+        self.requests = {name: 0 for name in self.behaviour}
+        self.errors = {name: 0 for name in self.behaviour}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        host, port = self.server.server_address[:2]
+        return f"{host}:{port}"
+
+    @property
+    def url(self):
+        return f"http://{self.address}"
+
+    def configure(self, service, latency=None, jitter=None, error_rate=None):
+        """تعديل سلوك خدمة واحدة أثناء التشغيل"""
+        behaviour = self.behaviour[service]
+        if latency is not None:
+            behaviour.latency = latency
+        if jitter is not None:
+            behaviour.jitter = jitter
+        if error_rate is not None:
+            behaviour.error_rate = error_rate
+
+    def _decide(self, service):
+        behaviour = self.behaviour[service]
+        with self._lock:
+            self.requests[service] += 1
+            delay = max(0.0, behaviour.latency + self.random.uniform(-behaviour.jitter, behaviour.jitter))
+            failed = self.random.random() < behaviour.error_rate
+            if failed:
+                self.errors[service] += 1
+        return delay, failed
+
+    def _handler(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # الترويسة والجسم يُرسلان في استدعاءين؛ بدون هذا يضيف Nagle مع ACK المؤجل ~40ms لكل طلب
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status, body):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                parts = [part for part in url.path.split("/") if part]
+                if parts[:1] == ["ipify"]:
+                    service, body = "ipify", lambda: {"ip": services.public_ip}
+                elif parts[:2] == ["dbip", "v2"] and len(parts) == 4:
+                    service, body = "dbip", lambda: fake_location(parts[3])
+                elif parts[:1] == ["reverse"]:
+                    query = parse_qs(url.query)
+                    service, body = "nominatim", lambda: self.reverse(query)
+                else:
+                    self.send_json(404, {"error": "not found"})
+                    return
+                delay, failed = services._decide(service)
+                if delay:
+                    time.sleep(delay)
+                if failed:
+                    self.send_json(503, {"error": "injected failure"})
+                else:
+                    self.send_json(200, body())
+
+            def reverse(self, query):
+                latitude = float(query["lat"][0])
+                longitude = float(query["lon"][0])
+                return {
+                    "place_id": 1, "lat": str(latitude), "lon": str(longitude),
+                    "display_name": f"Example Street, District {int(abs(latitude * 10)) % 97}, Example City",
+                    "address": {"road": "Example Street", "city": "Example City"},
+                }
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-services", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self):
+        with self._lock:
+            return {name: {"requests": self.requests[name], "errors": self.errors[name]} for name in self.requests}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="خوادم محلية وهمية لـ ipify و DB-IP و Nominatim")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="زمن الاستجابة بالثواني")
+    parser.add_argument("--jitter", type=float, default=0.0, help="تذبذب زمن الاستجابة بالثواني")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="نسبة الطلبات التي تفشل بخطأ 503")
+    args = parser.parse_args()
+
+    services = FakeServices(port=args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    print(f"ipify:     {services.url}/ipify?format=json")
+    print(f"DB-IP:     {services.url}/dbip/v2/free/{{ip}}")
+    print(f"Nominatim: domain={services.address} scheme=http")
+    try:
+        services.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
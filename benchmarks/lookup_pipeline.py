@@ -0,0 +1,388 @@
+"""قياس أداء سلسلة تحديد الموقع كاملة مقابل خوادم محلية وهمية (بدون إنترنت)
+
+python benchmarks/lookup_pipeline.py --targets 2000 --unique 500 --latency 0.02 --error-rate 0.01
+python benchmarks/lookup_pipeline.py --save-baseline benchmarks/baseline.json
+python benchmarks/lookup_pipeline.py --compare benchmarks/baseline.json --max-regression 0.25
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_services import FakeServices  # noqa: E402
+
+from bulk_lookup import run_bulk  # noqa: E402
+from geo_providers import DbIpApiProvider  # noqa: E402
+from geo_service import GeoService  # noqa: E402
+from lookup_cache import GeoLookupCache  # noqa: E402
+from map_builder import MapBuilder  # noqa: E402
+from result_store import ResultStore, make_record  # noqa: E402
+from reverse_geocoder import ReverseGeocoder  # noqa: E402
+
+STAGES = ("public_ip", "get_ip_info", "get_address_details", "create_map", "save_report")
+# المقاييس التي تُقارن بخط الأساس: (الاسم، الأعلى أفضل؟)
+COMPARED = (("throughput", True), ("p50_ms", False), ("p95_ms", False), ("p99_ms", False))
+# خيارات الإخراج والمقارنة لا تُحفظ مع النتائج، وإعدادات لا تغير ما يُقاس لا تمنع المقارنة إن اختلفت
+OUTPUT_OPTIONS = ("save_baseline", "compare", "json", "max_regression", "noise_floor_ms")
+UNCOMPARED_CONFIG = ("repeat", "no_memory")
+
+
+def percentile(samples, p):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, max(0, int(round(p / 100.0 * (len(samples) - 1)))))]
+
+
+def summarize(latencies, seconds, errors=0, peak=None, percentiles=True):
+    """ملخص مرحلة؛ percentiles=False للمراحل المقاسة دفعة واحدة (لا زمن حقيقي لكل عملية)"""
+    return {
+        "ops": len(latencies),
+        "errors": errors,
+        "seconds": seconds,
+        "throughput": len(latencies) / seconds if seconds else None,
+        "p50_ms": _ms(percentile(latencies, 50)) if percentiles else None,
+        "p95_ms": _ms(percentile(latencies, 95)) if percentiles else None,
+        "p99_ms": _ms(percentile(latencies, 99)) if percentiles else None,
+        "peak_kb": peak,
+    }
+
+
+def _ms(value):
+    return None if value is None else value * 1000
+
+
+def make_targets(count, unique, seed=0):
+    """عناوين الاختبار: count طلباً من مجموعة unique عنواناً (التكرار يقيس الذاكرة المؤقتة)"""
+    rng = random.Random(seed)
+    pool = [f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+            for _ in range(unique)]
+    return [rng.choice(pool) for _ in range(count)]
+
+
+class Pipeline:
+    """الخدمة ومكوناتها موجهة إلى الخوادم الوهمية، مع ملفات مؤقتة معزولة لكل تشغيل"""
+
+    def __init__(self, services, directory, use_cache=True, workers=8):
+        self.directory = directory
+        self.cache = GeoLookupCache(os.path.join(directory, "cache.sqlite")) if use_cache else None
+        self.reverse_geocoder = ReverseGeocoder("geo_locator_bench", domain=services.address, scheme="http",
+                                                rate=100000, timeout=10)
+        provider = DbIpApiProvider(url=f"{services.url}/dbip/v2/{{api_key}}/{{ip}}", pool_size=workers)
+        self.service = GeoService(user_agent="geo_locator_bench", cache=self.cache,
+                                  reverse_geocoder=self.reverse_geocoder, provider=provider,
+                                  public_ip_url=f"{services.url}/ipify?format=json")
+        self.store = ResultStore(os.path.join(directory, "results.sqlite"))
+        self.map_file = os.path.join(directory, "map.html")
+        self.reverse_calls = 0
+
+    def close(self):
+        self.store.close()
+        self.service.provider.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    def cache_stats(self):
+        stats = {}
+        if self.cache is not None:
+            stats["ip_cache_hit_rate"] = self.cache.stats()["hit_rate"]
+        if self.reverse_calls:
+            stats["reverse_hit_rate"] = 1 - self.reverse_geocoder.requests / self.reverse_calls
+        return stats
+
+
+def timed_calls(fn, items, latencies):
+    """استدعاء fn لكل عنصر وقياس زمن كل استدعاء؛ يرجع (النتائج الناجحة، عدد الأخطاء)"""
+    results, errors = [], 0
+    for item in items:
+        started = time.perf_counter()
+        try:
+            results.append(fn(item))
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - started)
+    return results, errors
+
+
+def run_single(pipeline, targets, public_ip_calls, track_memory=False):
+    """عمليات متتالية واحدة تلو الأخرى كما في الواجهة الرسومية"""
+    service = pipeline.service
+    stages = {}
+
+    def stage(name, fn, items):
+        if track_memory:
+            tracemalloc.reset_peak()
+        latencies = []
+        started = time.perf_counter()
+        results, errors = timed_calls(fn, items, latencies)
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] // 1024 if track_memory else None
+        stages[name] = summarize(latencies, seconds, errors, peak)
+        return results
+
+    stage("public_ip", lambda _: service.get_public_ip(), range(public_ip_calls))
+    locations = stage("get_ip_info", service.get_ip_info, targets)
+    pipeline.reverse_calls += len(locations)
+    addresses = stage("get_address_details",
+                      lambda location: service.get_address_details(location.latitude, location.longitude), locations)
+
+    def create_map(location):
+        builder = MapBuilder(cache_dir=os.path.join(pipeline.directory, "map_cache"))
+        builder.add(location.latitude, location.longitude, location.ip_address)
+        return builder.save(pipeline.map_file, zoom_start=12)
+
+    stage("create_map", create_map, locations)
+
+    def save_report(item):
+        location, address = item
+        pipeline.store.add(make_record(location, address=address))
+        pipeline.store.flush()
+
+    stage("save_report", save_report, list(zip(locations, addresses)))
+    return stages
+
+
+def run_bulk_workload(pipeline, targets, workers, track_memory=False):
+    """دفعة كاملة عبر bulk_lookup ثم خريطة مجمعة وحفظ كل النتائج دفعة واحدة"""
+    service = pipeline.service
+    stages = {}
+    lookup_latencies, reverse_latencies = [], []
+    get_ip_info, get_many = service.get_ip_info, service.get_address_details_many
+
+    def timed_lookup(target):
+        started = time.perf_counter()
+        try:
+            return get_ip_info(target)
+        finally:
+            lookup_latencies.append(time.perf_counter() - started)
+
+    def timed_reverse(coordinates):
+        started = time.perf_counter()
+        try:
+            return get_many(coordinates)
+        finally:
+            # زمن الدفعة موزع على عناصرها
+            share = (time.perf_counter() - started) / max(1, len(coordinates))
+            reverse_latencies.extend([share] * len(coordinates))
+
+    rows = []
+
+    class Collector:
+        stream = open(os.devnull, "w")
+
+        def write(self, row):
+            rows.append(row)
+
+    service.get_ip_info, service.get_address_details_many = timed_lookup, timed_reverse
+    if track_memory:
+        tracemalloc.reset_peak()
+    started = time.perf_counter()
+    try:
+        stats = run_bulk(service, targets, Collector(), workers=workers, with_address=True)
+    finally:
+        service.get_ip_info, service.get_address_details_many = get_ip_info, get_many
+        Collector.stream.close()
+    seconds = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] // 1024 if track_memory else None
+    located = [row for row in rows if not row["error"]]
+    pipeline.reverse_calls += len(located)
+    # مرحلتا البحث والبحث العكسي تتداخلان في الدفعة، لذا يُنسب الزمن الكلي لكل منهما
+    stages["get_ip_info"] = summarize(lookup_latencies, seconds, stats.errors, peak)
+    stages["get_address_details"] = summarize(reverse_latencies, seconds, 0, peak, percentiles=False)
+
+    for name, fn in (("create_map", lambda: _bulk_map(pipeline, located)),
+                     ("save_report", lambda: _bulk_store(pipeline, located))):
+        if track_memory:
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        fn()
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] // 1024 if track_memory else None
+        stages[name] = summarize([seconds / max(1, len(located))] * len(located), seconds, 0, peak,
+                                 percentiles=False)
+    return stages
+
+
+def _bulk_map(pipeline, rows):
+    builder = MapBuilder(cache_dir=os.path.join(pipeline.directory, "map_cache"))
+    builder.add_rows(rows)
+    builder.save(pipeline.map_file)
+
+
+def _bulk_store(pipeline, rows):
+    pipeline.store.add_many(make_record(row) for row in rows)
+    pipeline.store.flush()
+
+
+def run_workload(name, args, services, track_memory):
+    with tempfile.TemporaryDirectory() as directory:
+        pipeline = Pipeline(services, directory, use_cache=not args.no_cache, workers=args.workers)
+        targets = make_targets(args.targets, args.unique, args.seed)
+        try:
+            if name == "single":
+                stages = run_single(pipeline, targets[:args.single_targets], args.public_ip_calls, track_memory)
+            else:
+                stages = run_bulk_workload(pipeline, targets, args.workers, track_memory)
+            return stages, pipeline.cache_stats()
+        finally:
+            pipeline.close()
+
+
+def median_stages(runs):
+    """وسيط كل مقياس عبر التكرارات (أثبت من تشغيل واحد أمام ضجيج الجدولة وجمع المهملات)"""
+    stages = {}
+    for stage in runs[0]:
+        stages[stage] = {}
+        for metric in runs[0][stage]:
+            values = [run[stage][metric] for run in runs if run[stage][metric] is not None]
+            stages[stage][metric] = statistics.median(values) if values else None
+    return stages
+
+
+def run_config(args):
+    return {key: value for key, value in vars(args).items() if key not in OUTPUT_OPTIONS}
+
+
+def run(args):
+    results = {"config": run_config(args), "workloads": {}, "cache": {}, "outbound": {}}
+    with FakeServices(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=args.seed) as services:
+        for name in args.workloads:
+            runs = []
+            for _ in range(max(1, args.repeat)):
+                before = services.stats()
+                stages, cache = run_workload(name, args, services, track_memory=False)
+                after = services.stats()
+                runs.append(stages)
+            stages = median_stages(runs)
+            # كل تكرار يبدأ بملفات مؤقتة جديدة، فالذاكرة المؤقتة والطلبات الصادرة متماثلة بينها
+            results["cache"][name] = cache
+            results["outbound"][name] = {service: after[service]["requests"] - before[service]["requests"]
+                                         for service in after}
+            if not args.no_memory:
+                # القياس مع tracemalloc أبطأ بكثير، لذا يُعاد التشغيل منفصلاً لقياس الذاكرة فقط
+                tracemalloc.start()
+                memory_stages, _ = run_workload(name, args, services, track_memory=True)
+                tracemalloc.stop()
+                for stage, summary in memory_stages.items():
+                    stages[stage]["peak_kb"] = summary["peak_kb"]
+            results["workloads"][name] = stages
+    return results
+
+
+def config_differences(config, baseline):
+    """إعدادات القياس المختلفة عن خط الأساس (المقارنة بينها لا معنى لها)"""
+    new, old = config, baseline.get("config", {})
+    return sorted(key for key in set(new) | set(old)
+                  if key not in UNCOMPARED_CONFIG and new.get(key) != old.get(key))
+
+
+def compare(results, baseline, max_regression, noise_floor_ms=1.0):
+    """مقارنة بخط الأساس؛ يرجع قائمة المقاييس التي تراجعت أكثر من الحد المسموح
+
+    التغير الأصغر من noise_floor_ms (في الزمن، أو في زمن العملية الواحدة للإنتاجية) يُعد ضجيجاً مهما كانت نسبته.
+    """
+    regressions = []
+    print(f"\nComparison with baseline (regression threshold {max_regression:.0%}, noise floor {noise_floor_ms} ms):")
+    for workload, stages in results["workloads"].items():
+        for stage, summary in stages.items():
+            old = baseline.get("workloads", {}).get(workload, {}).get(stage)
+            if not old:
+                continue
+            for metric, higher_is_better in COMPARED:
+                new_value, old_value = summary.get(metric), old.get(metric)
+                if not new_value or not old_value:
+                    continue
+                change = (new_value - old_value) / old_value
+                worse = -change if higher_is_better else change
+                if higher_is_better:
+                    delta_ms = abs(1000 / new_value - 1000 / old_value)
+                else:
+                    delta_ms = abs(new_value - old_value)
+                flag = "REGRESSION" if worse > max_regression and delta_ms >= noise_floor_ms else ""
+                if flag:
+                    regressions.append(f"{workload}/{stage}/{metric}")
+                print(f"  {workload:>6} {stage:<20} {metric:<10} {old_value:10.2f} -> {new_value:10.2f} "
+                      f"({change:+.1%}) {flag}")
+    return regressions
+
+
+def print_results(results):
+    for workload, stages in results["workloads"].items():
+        print(f"\n[{workload}]")
+        print(f"  {'stage':<20} {'ops':>6} {'err':>5} {'ops/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak KB':>9}")
+        for stage in STAGES:
+            summary = stages.get(stage)
+            if summary is None:
+                continue
+            print(f"  {stage:<20} {summary['ops']:>6} {summary['errors']:>5} {_fmt(summary['throughput']):>10} "
+                  f"{_fmt(summary['p50_ms']):>9} {_fmt(summary['p95_ms']):>9} {_fmt(summary['p99_ms']):>9} "
+                  f"{_fmt(summary['peak_kb'], 0):>9}")
+        print(f"  cache: {results['cache'][workload]}")
+        print(f"  outbound requests: {results['outbound'][workload]}")
+
+
+def _fmt(value, digits=2):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس أداء سلسلة تحديد الموقع مقابل خوادم وهمية محلية")
+    parser.add_argument("--workloads", nargs="+", choices=("single", "bulk"), default=["single", "bulk"])
+    parser.add_argument("--targets", type=int, default=2000, help="عدد عمليات البحث في الدفعة")
+    parser.add_argument("--single-targets", type=int, default=200, help="عدد العمليات المتتالية")
+    parser.add_argument("--unique", type=int, default=500, help="عدد العناوين المختلفة (الباقي تكرار)")
+    parser.add_argument("--public-ip-calls", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.01, help="زمن استجابة الخوادم الوهمية بالثواني")
+    parser.add_argument("--jitter", type=float, default=0.005)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="نسبة الأخطاء المحقونة (503)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="عدد تكرارات كل حمل؛ النتيجة وسيط التكرارات")
+    parser.add_argument("--no-cache", action="store_true", help="بدون الذاكرة المؤقتة الدائمة")
+    parser.add_argument("--no-memory", action="store_true", help="تخطي قياس الذاكرة (tracemalloc)")
+    parser.add_argument("--json", action="store_true", help="إخراج النتائج بصيغة JSON")
+    parser.add_argument("--save-baseline", help="حفظ النتائج كخط أساس للمقارنة لاحقاً")
+    parser.add_argument("--compare", help="مقارنة النتائج بملف خط أساس")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="أقصى تراجع مسموح عند المقارنة")
+    parser.add_argument("--noise-floor-ms", type=float, default=1.0,
+                        help="أصغر تغير بالمللي ثانية يُعد تراجعاً (ما دونه ضجيج قياس)")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        # التحقق قبل التشغيل: لا فائدة من قياس طويل لا يمكن مقارنته
+        differences = config_differences(run_config(args), baseline)
+        if differences:
+            print(f"baseline {args.compare} was recorded with different settings: {', '.join(differences)}; "
+                  f"re-run with the same settings or save a new baseline", file=sys.stderr)
+            return 2
+
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nbaseline saved to {args.save_baseline}")
+    if baseline is not None:
+        regressions = compare(results, baseline, args.max_regression, args.noise_floor_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regressions: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""زمن سلسلة تحديد الموقع وعدد الطلبات الخارجية لكل مستوى خصوصية مقابل خوادم محلية وهمية (بدون إنترنت)
+
+python benchmarks/privacy_levels.py --targets 20 --latency 0.05
+python benchmarks/privacy_levels.py --reverse-rate 1000 --json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_services import FakeServices  # noqa: E402
+from lookup_pipeline import percentile  # noqa: E402
+
+from geo_providers import DbIpApiProvider  # noqa: E402
+from geo_service import GeoService  # noqa: E402
+from map_builder import MapBuilder  # noqa: E402
+from privacy import LEVELS  # noqa: E402
+from reverse_geocoder import ReverseGeocoder  # noqa: E402
+
+
+def distinct_targets(count, seed=0):
+    """عناوين عامة مختلفة: كل بحث يصل فعلاً إلى الخدمات فتظهر كلفة كل مرحلة كاملة"""
+    rng = random.Random(seed)
+    targets = set()
+    while len(targets) < count:
+        # 11-99 و 128-191 خارج النطاقات الخاصة والمحجوزة
+        targets.add(f"{rng.choice([rng.randint(11, 99), rng.randint(128, 191)])}.{rng.randint(0, 255)}."
+                    f"{rng.randint(0, 255)}.{rng.randint(1, 254)}")
+    return sorted(targets)
+
+
+def run_level(services, level, targets, directory, reverse_rate):
+    """بحث متتالٍ كما في الواجهة (نتيجة، عنوان، خريطة) بخدمة جديدة بلا ذاكرة مؤقتة دائمة"""
+    reverse_geocoder = ReverseGeocoder("geo_locator_bench", domain=services.address, scheme="http",
+                                       rate=reverse_rate, timeout=10)
+    provider = DbIpApiProvider(url=f"{services.url}/dbip/v2/{{api_key}}/{{ip}}")
+    service = GeoService(user_agent="geo_locator_bench", reverse_geocoder=reverse_geocoder, provider=provider)
+    policy = LEVELS[level]
+    map_file = os.path.join(directory, f"map_{level}.html")
+    before = services.stats()
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    try:
+        for target in targets:
+            began = time.perf_counter()
+            try:
+                location, _ = service.locate(target, policy)
+                label = service.describe(location, policy)
+                builder = MapBuilder(cache_dir=os.path.join(directory, "map_cache"))
+                builder.add(location.latitude, location.longitude, label)
+                builder.save(map_file, zoom_start=policy.zoom)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - began)
+    finally:
+        provider.close()
+    seconds = time.perf_counter() - started
+    after = services.stats()
+    calls = {name: after[name]["requests"] - before[name]["requests"] for name in after}
+    return {
+        "lookups": len(targets),
+        "errors": errors,
+        "seconds": seconds,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "dbip_calls": calls["dbip"],
+        "nominatim_calls": calls["nominatim"],
+        "calls_per_lookup": sum(calls.values()) / len(targets),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="قياس كلفة كل مستوى خصوصية في سلسلة تحديد الموقع")
+    parser.add_argument("--targets", type=int, default=20, help="عدد العناوين المختلفة لكل مستوى")
+    parser.add_argument("--latency", type=float, default=0.05, help="زمن استجابة الخوادم الوهمية بالثواني")
+    parser.add_argument("--reverse-rate", type=float, default=1.0,
+                        help="حد طلبات البحث العكسي في الثانية (سياسة Nominatim: 1)")
+    parser.add_argument("--json", action="store_true", help="إخراج JSON بدلاً من الجدول")
+    args = parser.parse_args(argv)
+
+    targets = distinct_targets(args.targets)
+    results = {}
+    with FakeServices(latency=args.latency) as services, tempfile.TemporaryDirectory() as directory:
+        for level in LEVELS:
+            results[level] = run_level(services, level, targets, directory, args.reverse_rate)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{'level':<8}{'lookups':>8}{'errors':>8}{'total s':>9}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'dbip':>6}{'nominatim':>11}{'calls/op':>10}")
+    for level, row in results.items():
+        print(f"{level:<8}{row['lookups']:>8}{row['errors']:>8}{row['seconds']:>9.2f}{row['p50_ms']:>9.1f}"
+              f"{row['p95_ms']:>9.1f}{row['dbip_calls']:>6}{row['nominatim_calls']:>11}{row['calls_per_lookup']:>10.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
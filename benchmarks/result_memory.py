@@ -0,0 +1,128 @@
+"""ذاكرة وسرعة تمثيلات النتائج لمليون نتيجة أو أكثر: كائنات بقاموس، IpLocation بـ __slots__، صفوف قواميس، GeoResultBatch
+
+python benchmarks/result_memory.py --rows 1000000
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from geo_batch import GeoResultBatch  # noqa: E402
+from geo_result import IpLocation  # noqa: E402
+
+REPRESENTATIONS = ("dict_objects", "slots_objects", "row_dicts", "columnar_batch")
+
+
+class DictLocation:
+    """IpLocation كما كان قبل __slots__ (قاموس سمات لكل نتيجة) للمقارنة"""
+
+    def __init__(self, ip_address, country=None, region=None, city=None,
+                 latitude=None, longitude=None, time_zone=None, isp=None, provider=None):
+        self.ip_address = ip_address
+        self.country = country
+        self.region = region
+        self.city = city
+        self.latitude = latitude
+        self.longitude = longitude
+        self.time_zone = time_zone
+        self.isp = isp
+        self.provider = provider
+
+
+def _fresh(text):
+    # كل استجابة من المزود تحمل نصوصاً جديدة (من تحليل JSON)، لا مراجع لنص مشترك
+    return (text + " ")[:-1]
+
+
+def make_rows(count, countries=240, cities=20000, seed=0):
+    """نتائج اصطناعية بتوزيع واقعي تقريباً: دول ومدن متكررة وعناوين وإحداثيات فريدة"""
+    rng = random.Random(seed)
+    country_names = [f"Country {index}" for index in range(countries)]
+    city_names = [(f"City {index}", f"Region {index % 3000}", country_names[index % countries],
+                   f"Zone/{index % 400}") for index in range(cities)]
+    isps = [f"ISP {index}" for index in range(5000)]
+    for _ in range(count):
+        city, region, country, time_zone = city_names[min(cities - 1, int(rng.paretovariate(1.2)) - 1)]
+        yield (f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+               _fresh(country), _fresh(region), _fresh(city), rng.uniform(-60, 70), rng.uniform(-180, 180),
+               _fresh(time_zone), _fresh(rng.choice(isps)), "dbip")
+
+
+def build(representation, rows):
+    if representation == "dict_objects":
+        return [DictLocation(*row) for row in rows]
+    if representation == "slots_objects":
+        return [IpLocation(*row) for row in rows]
+    if representation == "row_dicts":
+        names = IpLocation.FIELDS + ("provider",)
+        return [dict(zip(names, row)) for row in rows]
+    batch = GeoResultBatch()
+    names = IpLocation.FIELDS + ("provider",)
+    for row in rows:
+        batch.add(dict(zip(names, row)))
+    batch.columns
+    return batch
+
+
+def query(representation, data, country, bbox):
+    """نفس التحليل لكل تمثيل: عدد النتائج لكل دولة، وعدد نتائج دولة داخل صندوق إحداثيات"""
+    south, west, north, east = bbox
+    if representation == "columnar_batch":
+        counts = data.group_counts("country")
+        inside = int(data.mask(country=country, bbox=bbox).sum())
+        return len(counts), inside
+    get = (lambda row, name: row[name]) if representation == "row_dicts" else getattr
+    counts = Counter(get(row, "country") for row in data)
+    inside = sum(1 for row in data if get(row, "country") == country
+                 and south <= get(row, "latitude") <= north and west <= get(row, "longitude") <= east)
+    return len(counts), inside
+
+
+def measure(representation, count, seed=0):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    data = build(representation, make_rows(count, seed=seed))
+    built = time.perf_counter() - started
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    started = time.perf_counter()
+    groups, inside = query(representation, data, "Country 0", (-10.0, -90.0, 40.0, 90.0))
+    queried = time.perf_counter() - started
+    del data
+    gc.collect()
+    return {"representation": representation, "rows": count, "memory_mb": current / 2 ** 20,
+            "bytes_per_row": current / count, "peak_mb": peak / 2 ** 20, "build_s": built,
+            "query_s": queried, "groups": groups, "inside": inside}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="مقارنة ذاكرة وسرعة تمثيلات نتائج تحديد الموقع")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--representations", default=",".join(REPRESENTATIONS))
+    parser.add_argument("--json", action="store_true", help="إخراج JSON بدلاً من الجدول")
+    args = parser.parse_args(argv)
+
+    results = [measure(name, args.rows) for name in args.representations.split(",")]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{'representation':<16}{'rows':>10}{'MB':>10}{'B/row':>9}{'peak MB':>10}{'build s':>9}{'query ms':>10}")
+    for result in results:
+        print(f"{result['representation']:<16}{result['rows']:>10}{result['memory_mb']:>10.1f}"
+              f"{result['bytes_per_row']:>9.0f}{result['peak_mb']:>10.1f}{result['build_s']:>9.2f}"
+              f"{result['query_s'] * 1000:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
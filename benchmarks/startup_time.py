@@ -0,0 +1,110 @@
+"""قياس زمن بدء تشغيل الواجهتين: تفصيل زمن الاستيراد والزمن حتى ظهور أول نافذة
+
+python benchmarks/startup_time.py --app advanced --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APPS = {
+    "main": ("main.py", "GeoLocatorApp"),
+    "advanced": ("متقدمه  main.py", "AdvancedGeoLocator"),
+}
+
+# يُشغَّل في عملية منفصلة: تحميل الوحدة ثم بناء النافذة ورسمها مرة واحدة
+CHILD = r"""
+import importlib.util, json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+spec = importlib.util.spec_from_file_location("app_under_test", {path!r})
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+imported = time.perf_counter()
+result = {{"import_s": imported - started}}
+if {window!r}:
+    import tkinter as tk
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        result["window_error"] = str(e)
+    else:
+        getattr(module, {cls!r})(root)
+        root.update()
+        result["first_window_s"] = time.perf_counter() - started
+        root.destroy()
+print(json.dumps(result))
+"""
+
+
+def run_child(app, window=True, importtime=False):
+    path, cls = APPS[app]
+    code = CHILD.format(root=ROOT, path=os.path.join(ROOT, path), cls=cls, window=window)
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    started = time.perf_counter()
+    completed = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr else "child failed")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["process_wall_s"] = wall
+    return result, completed.stderr
+
+
+def import_breakdown(stderr, top=15):
+    """أثقل الحزم من مخرجات python -X importtime (الزمن التراكمي لكل حزمة من المستوى الأعلى)"""
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split(":", 1)[1].split("|")
+        # المستوى الأعلى فقط (مسافة بادئة واحدة) لتفادي العد المزدوج
+        if len(name) - len(name.lstrip()) == 1:
+            name = name.strip()
+            totals[name] = totals.get(name, 0) + int(cumulative_us)
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس زمن بدء تشغيل الواجهة")
+    parser.add_argument("--app", choices=sorted(APPS), default="advanced")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--no-window", action="store_true", help="قياس الاستيراد فقط (بدون شاشة)")
+    parser.add_argument("--json", action="store_true", help="إخراج النتائج بصيغة JSON")
+    args = parser.parse_args()
+
+    _, stderr = run_child(args.app, window=False, importtime=True)
+    breakdown = import_breakdown(stderr)
+
+    runs = [run_child(args.app, window=not args.no_window)[0] for _ in range(args.runs)]
+    summary = {"app": args.app, "runs": args.runs, "import_breakdown_ms": {n: us / 1000 for n, us in breakdown}}
+    for key in ("import_s", "first_window_s", "process_wall_s"):
+        values = [run[key] for run in runs if key in run]
+        if values:
+            summary[key] = {"median": statistics.median(values), "min": min(values), "max": max(values)}
+    errors = {run["window_error"] for run in runs if "window_error" in run}
+    if errors:
+        summary["window_error"] = errors.pop()
+
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+        return
+
+    print(f"Import-time breakdown ({args.app}, top-level packages, cumulative):")
+    for name, ms in summary["import_breakdown_ms"].items():
+        print(f"  {ms:9.1f} ms  {name}")
+    for key, label in (("import_s", "module import"), ("first_window_s", "time to first window"),
+                       ("process_wall_s", "process wall time")):
+        if key in summary:
+            print(f"{label:>22}: median {summary[key]['median'] * 1000:.1f} ms "
+                  f"(min {summary[key]['min'] * 1000:.1f}, max {summary[key]['max'] * 1000:.1f})")
+    if "window_error" in summary:
+        print(f"window not measured: {summary['window_error']}")
+
+
+if __name__ == "__main__":
+    main()
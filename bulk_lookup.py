@@ -0,0 +1,335 @@
+import argparse
+import csv
+import json
+import sys
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from contextlib import nullcontext
+from itertools import islice
+
+import numpy as np
+
+import metrics
+from gazetteer import OfflineReverseGeocoder
+from geo_providers import HedgedGeoProvider, build_provider
+from geo_result import IpLocation
+from geo_service import GeoService
+from ip_array import CATEGORIES, PUBLIC, IpArray
+from lookup_cache import GeoLookupCache
+from map_builder import MODES as MAP_MODES, MapBuilder
+from privacy import LEVELS as PRIVACY_LEVELS, get_policy
+from result_store import ResultStore, make_record
+from request_scheduler import BULK, RequestScheduler
+from reverse_geocoder import ReverseGeocoder
+
+COLUMNS = ("target",) + IpLocation.FIELDS + ("provider", "address", "error")
+
+
+def iter_targets(stream):
+    """قراءة الأهداف سطراً بسطر من ملف أو stdin دون تحميلها كاملة في الذاكرة"""
+    for line in stream:
+        target = line.strip()
+        if target and not target.startswith("#"):
+            yield target.split()[0]
+
+
+def screen_targets(targets, skip_bogons=True):
+    """فحص دفعة أهداف متجهياً: لكل هدف (مفتاح الدمج، الهدف المرسل، الخطأ)
+
+    العناوين المكررة تشترك في مفتاح واحد، والعناوين الخاصة أو المحجوزة أو التالفة لها خطأ
+    بدلاً من مفتاح فلا تكلف طلباً للمزود ولا استعلام DNS.
+    """
+    array = IpArray.parse(targets)
+    category = array.classify()
+    lookup = category == PUBLIC if skip_bogons else array.valid
+    first, inverse = array.unique(lookup)
+    canonical = [array.format(index) for index in first.tolist()]
+    groups = dict(zip(np.flatnonzero(lookup & array.valid).tolist(), inverse.tolist()))
+    malformed = array.malformed()
+    screened = []
+    for index, target in enumerate(targets):
+        group = groups.get(index)
+        if group is not None:
+            # المفتاح هو العنوان بصيغته القياسية فيبقى صالحاً للدمج عبر الدفعات
+            screened.append((("ip", canonical[group]), canonical[group], None))
+        elif array.version[index]:
+            screened.append((None, target, f"{CATEGORIES[category[index]]} address is not routable"))
+        elif malformed[index]:
+            screened.append((None, target, f"invalid IP address: {target}"))
+        else:
+            screened.append((("name", target.lower()), target, None))
+    return screened
+
+
+def priority_context(service, priority):
+    """أولوية طلبات الخيط الحالي في مجدول الخدمة إن وُجد (خيوط العمال لا ترث أولوية الخيط المنشئ)"""
+    scheduler = getattr(service, "scheduler", None)
+    if priority is None or scheduler is None:
+        return nullcontext()
+    return scheduler.priority(priority)
+
+
+def lookup_target(service, target, priority=None, policy=None):
+    """تحديد موقع هدف واحد وإرجاع صف نتيجة (الأخطاء تُسجل في الصف بدلاً من إيقاف الدفعة)"""
+    row = {"target": target, "error": None}
+    try:
+        with priority_context(service, priority):
+            location = service.get_ip_info(target)
+        row.update((location if policy is None else policy.apply(location)).to_dict())
+    except Exception as e:
+        row["error"] = str(e) or type(e).__name__
+    return row
+
+
+def add_addresses(service, rows):
+    """إضافة العناوين المقدرة لمجموعة صفوف باستدعاء بحث عكسي واحد"""
+    located = [row for row in rows if row.get("latitude") is not None and row.get("longitude") is not None]
+    if not located:
+        return
+    try:
+        addresses = service.get_address_details_many([(row["latitude"], row["longitude"]) for row in located])
+    except Exception:
+        # خطأ في إحداثية واحدة لا يُسقط الدفعة: إعادة المحاولة صفاً صفاً (الناجحة تأتي من الذاكرة المؤقتة)
+        for row in located:
+            try:
+                row["address"] = service.get_address_details(row["latitude"], row["longitude"])
+            except Exception as e:
+                row["error"] = f"reverse geocoding failed: {e}"
+        return
+    for row, address in zip(located, addresses):
+        row["address"] = address
+
+
+class CsvResultWriter:
+    """كتابة النتائج بصيغة CSV صفاً بصف"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.writer = csv.DictWriter(stream, fieldnames=COLUMNS, extrasaction="ignore")
+        self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+
+class JsonlResultWriter:
+    """كتابة النتائج بصيغة JSON Lines سطراً بسطر"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, row):
+        self.stream.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+WRITERS = {"csv": CsvResultWriter, "jsonl": JsonlResultWriter}
+
+
+class QueueResultWriter:
+    """تسليم النتائج على دفعات إلى طابور (لواجهة تعرضها أثناء التنفيذ)؛ ضبط stop يوقف التشغيل عند الكتابة التالية"""
+
+    def __init__(self, queue, chunk_size=500, stop=None):
+        self.queue = queue
+        self.chunk_size = chunk_size
+        self.stop = stop
+        self.rows = []
+        # run_bulk يستدعي stream.flush() دورياً وفي النهاية: التفريغ هنا يسلم الدفعة الجزئية
+        self.stream = self
+
+    def write(self, row):
+        if self.stop is not None and self.stop.is_set():
+            raise CancelledError("Batch lookup cancelled")
+        self.rows.append(row)
+        if len(self.rows) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.queue.put(self.rows)
+            self.rows = []
+
+
+class BulkStats:
+    """إحصاءات تشغيل دفعة البحث"""
+
+    def __init__(self):
+        self.total = 0
+        self.errors = 0
+        self.skipped = 0
+        self.deduplicated = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def rate(self):
+        return self.total / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        return (f"{self.total} lookups ({self.errors} errors, {self.skipped} skipped without a request, "
+                f"{self.deduplicated} duplicates) in {self.elapsed:.2f}s - {self.rate:.1f} lookups/s")
+
+
+def run_bulk(service, targets, writer, workers=8, with_address=False, window=None, flush_every=1000,
+             map_builder=None, store=None, skip_bogons=True, priority=None, privacy=None, screen_size=10000,
+             max_shared=65536):
+    """تنفيذ عمليات البحث بالتوازي عبر مجموعة عمال محدودة مع كتابة النتائج بترتيب الإدخال
+
+    الأهداف تُفحص متجهياً على دفعات من screen_size هدفاً (مستقلة عن نافذة الطلبات المعلقة)، وغير
+    القابل للتوجيه (خاص، محجوز، تالف) يُكتب بخطأ دون أي طلب. المكرر في أي موضع من المهمة يشارك
+    طلباً واحداً عبر آخر max_shared مفتاحاً (الفاشل يُعاد طلبه). priority تحدد فئة الطلبات في مجدول الخدمة،
+    و privacy مستوى الخصوصية (النتائج تُقرب، والعنوان يُبنى من الحقول بلا بحث عكسي في المستويات الأعلى).
+    """
+    policy = get_policy(privacy) if privacy is not None else None
+    window = window or workers * 4
+    stats = BulkStats()
+    pending = deque()
+    batch = []
+    # المفتاح -> مستقبل الطلب، بترتيب آخر استخدام (الأقدم يُحذف أولاً)
+    submitted = OrderedDict()
+
+    def write_batch():
+        if with_address and policy is not None and not policy.reverse_geocode:
+            for row in batch:
+                if not row["error"]:
+                    row["address"] = policy.describe(IpLocation.from_dict(row))
+        elif with_address:
+            with priority_context(service, priority):
+                add_addresses(service, batch)
+        if map_builder is not None:
+            map_builder.add_rows(batch)
+        if store is not None:
+            store.add_many(make_record(row) for row in batch if not row["error"])
+        for row in batch:
+            writer.write(row)
+            stats.total += 1
+            if row["error"]:
+                stats.errors += 1
+            if stats.total % flush_every == 0:
+                writer.stream.flush()
+        batch.clear()
+
+    def drain_one():
+        target, future, error = pending.popleft()
+        if future is None:
+            row = {"target": target, "error": error}
+        else:
+            row = dict(future.result())
+            row["target"] = target
+        batch.append(row)
+        if len(batch) >= window:
+            write_batch()
+
+    targets = iter(targets)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            chunk = list(islice(targets, screen_size))
+            if not chunk:
+                break
+            for target, (key, send, error) in zip(chunk, screen_targets(chunk, skip_bogons)):
+                # نافذة محدودة من الطلبات المعلقة حتى لا تُقرأ المدخلات كلها مسبقاً
+                while len(pending) >= 2 * window:
+                    drain_one()
+                if key is None:
+                    stats.skipped += 1
+                    pending.append((target, None, error))
+                    continue
+                future = submitted.get(key)
+                if future is None or (future.done() and future.result()["error"]):
+                    future = submitted[key] = executor.submit(lookup_target, service, send, priority, policy)
+                    if len(submitted) > max_shared:
+                        submitted.popitem(last=False)
+                else:
+                    submitted.move_to_end(key)
+                    stats.deduplicated += 1
+                pending.append((target, future, None))
+        while pending:
+            drain_one()
+    write_batch()
+
+    writer.stream.flush()
+    stats.elapsed = time.perf_counter() - stats.started
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="تحديد مواقع عناوين IP أو نطاقات من ملف دون واجهة رسومية")
+    parser.add_argument("input", nargs="?", default="-", help="ملف الأهداف (سطر لكل هدف) أو - للإدخال القياسي")
+    parser.add_argument("-o", "--output", default="-", help="ملف النتائج أو - للإخراج القياسي")
+    parser.add_argument("-f", "--format", choices=sorted(WRITERS), help="صيغة الإخراج (تُستنتج من امتداد الملف)")
+    parser.add_argument("-w", "--workers", type=int, default=8, help="عدد العمال المتزامنين")
+    parser.add_argument("--ip-database", help="قاعدة بيانات نطاقات IP محلية بدلاً من المزود البعيد")
+    parser.add_argument("--address", action="store_true", help="إضافة العنوان المقدر (بحث عكسي)")
+    parser.add_argument("--privacy", choices=list(PRIVACY_LEVELS), default="low",
+                        help="مستوى الخصوصية: medium حتى المدينة و high الدولة والمنطقة فقط، وكلاهما بلا بحث عكسي")
+    parser.add_argument("--providers", default="dbip",
+                        help="المزودون البعيدون مفصولين بفواصل (مثل dbip,ipapi,ipwhois)؛ أكثر من مزود يعني طلبات متحوطة")
+    parser.add_argument("--cache", help="ملف SQLite لذاكرة مؤقتة دائمة لنتائج المزود البعيد والبحث العكسي")
+    parser.add_argument("--gazetteer", help="ملف أماكن GeoNames للبحث العكسي المحلي بدون شبكة (مع --address)")
+    parser.add_argument("--reverse-rate", type=float, default=1.0,
+                        help="الحد الأقصى لطلبات البحث العكسي في الثانية (سياسة Nominatim: 1)")
+    parser.add_argument("--no-prefix-aggregation", action="store_true",
+                        help="تخزين كل عنوان على حدة بدلاً من تجميعه حسب الشبكة")
+    parser.add_argument("--store", help="إضافة النتائج الناجحة إلى سجل نتائج SQLite (انظر result_store.py)")
+    parser.add_argument("--map", help="ملف HTML لخريطة مجمعة لكل النتائج")
+    parser.add_argument("--map-mode", choices=MAP_MODES, default="cluster", help="نمط الخريطة: تجميع أو خريطة حرارية")
+    parser.add_argument("--include-bogons", action="store_true",
+                        help="إرسال العناوين الخاصة والمحجوزة للمزود أيضاً (مفيد مع قاعدة بيانات محلية)")
+    parser.add_argument("--quota", default="geolocator_quota.sqlite", help="ملف الحصص اليومية للخدمات الخارجية")
+    parser.add_argument("--metrics", help="كتابة مقاييس زمن المراحل بصيغة Prometheus في هذا الملف عند الانتهاء")
+    args = parser.parse_args(argv)
+
+    output_format = args.format
+    if output_format is None:
+        output_format = "jsonl" if args.output.endswith((".jsonl", ".json")) else "csv"
+
+    cache = GeoLookupCache(args.cache, aggregate=not args.no_prefix_aggregation) if args.cache else None
+    if args.gazetteer:
+        reverse_geocoder = OfflineReverseGeocoder(args.gazetteer)
+    else:
+        reverse_geocoder = ReverseGeocoder("geo_locator_bulk", cache=args.cache, rate=args.reverse_rate)
+    provider = build_provider(args.providers, pool_size=max(1, args.workers))
+    # المهام الجماعية بأولوية منخفضة: بحث الواجهة في عملية أخرى لا يتأثر، والحصة اليومية مشتركة عبر الملف
+    scheduler = RequestScheduler({"nominatim": {"rate": args.reverse_rate, "burst": 1, "daily_limit": None}},
+                                 quota_path=args.quota, default_priority=BULK)
+    service = GeoService(args.ip_database, user_agent="geo_locator_bulk", cache=cache,
+                         reverse_geocoder=reverse_geocoder, provider=provider, scheduler=scheduler)
+    map_builder = MapBuilder(mode=args.map_mode, cache_dir="map_cache") if args.map else None
+    store = ResultStore(args.store) if args.store else None
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    sink = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+    try:
+        writer = WRITERS[output_format](sink)
+        stats = run_bulk(service, iter_targets(source), writer,
+                         workers=max(1, args.workers), with_address=args.address, map_builder=map_builder,
+                         store=store, skip_bogons=not args.include_bogons, privacy=args.privacy)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+        if store is not None:
+            store.close()
+
+    print(stats.summary(), file=sys.stderr)
+    if map_builder is not None and len(map_builder):
+        map_builder.save(args.map)
+        print(f"map: {len(map_builder)} points written to {args.map}", file=sys.stderr)
+    if isinstance(provider, HedgedGeoProvider):
+        for name, provider_stats in provider.stats().items():
+            print(f"provider {name}: {provider_stats}", file=sys.stderr)
+    if cache is not None:
+        cache_stats = cache.stats()
+        print(f"cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+              f"({cache_stats['hit_rate']:.1%} hit rate, {cache_stats['entries']} entries)", file=sys.stderr)
+    summary = scheduler.summary()
+    if summary:
+        print(summary, file=sys.stderr)
+    scheduler.close()
+    if args.metrics:
+        metrics.REGISTRY.write(args.metrics)
+    return 0 if stats.errors < stats.total or not stats.total else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
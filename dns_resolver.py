@@ -0,0 +1,157 @@
+import ipaddress
+import socket
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+try:
+    import dns.exception
+    import dns.resolver
+except ImportError:  # dnspython اختياري: بدونه تُستخدم مدة صلاحية ثابتة
+    dns = None
+
+
+def _completed(result=None, error=None):
+    future = Future()
+    if error is not None:
+        # الخطأ محفوظ كنوع ورسالة: استثناء جديد لكل مستدعٍ حتى لا تتشارك الخيوط traceback واحداً
+        error_type, args = error
+        try:
+            exception = error_type(*args)
+        except Exception:
+            exception = RuntimeError(*args)
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+    return future
+
+
+def ip_literal(value):
+    """إرجاع العنوان بصيغته القياسية إن كانت القيمة عنوان IP حرفياً، وإلا None"""
+    try:
+        return str(ipaddress.ip_address(value.strip().strip("[]")))
+    except ValueError:
+        return None
+
+
+class CachingResolver:
+    """محلل أسماء نطاقات متزامن مع دمج الاستعلامات المتطابقة وذاكرة مؤقتة محدودة تحترم TTL"""
+
+    def __init__(self, max_entries=4096, default_ttl=300, negative_ttl=30, max_workers=16):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.negative_ttl = negative_ttl
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dns")
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def submit(self, name):
+        """بدء تحليل الاسم وإرجاع Future بقائمة كل عناوين A/AAAA"""
+        literal = ip_literal(name)
+        if literal is not None:
+            return _completed([literal])
+
+        key = name.strip().lower().rstrip(".")
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                expires, addresses, error = entry
+                if expires > time.monotonic():
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return _completed(list(addresses) if addresses else None, error)
+                del self._cache[key]
+
+            future = self._inflight.get(key)
+            if future is not None:
+                # استعلام جارٍ لنفس الاسم: ننتظر نتيجته بدلاً من تكراره
+                self.coalesced += 1
+                return future
+
+            self.misses += 1
+            future = self._executor.submit(self._query, key)
+            self._inflight[key] = future
+            return future
+
+    def _query(self, key):
+        try:
+            addresses, ttl = self._lookup(key)
+        except Exception as e:
+            self._store(key, None, (type(e), e.args), self.negative_ttl)
+            raise
+        self._store(key, addresses, None, ttl)
+        return list(addresses)
+
+    def _store(self, key, addresses, error, ttl):
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._cache[key] = (time.monotonic() + ttl, tuple(addresses) if addresses else None, error)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def _lookup(self, name):
+        """الاستعلام الفعلي: عبر dnspython إن توفر (مع TTL حقيقي) وإلا عبر getaddrinfo"""
+        if dns is not None:
+            addresses, ttl = [], None
+            for rdtype in ("A", "AAAA"):
+                # فشل نوع واحد (مهلة، لا خوادم) لا يلغي عناوين النوع الآخر
+                try:
+                    answer = dns.resolver.resolve(name, rdtype)
+                except dns.exception.DNSException:
+                    continue
+                addresses.extend(record.address for record in answer)
+                ttl = answer.rrset.ttl if ttl is None else min(ttl, answer.rrset.ttl)
+            if addresses:
+                return addresses, ttl
+            # لا شيء من DNS: getaddrinfo يقرأ /etc/hosts وإعدادات محلل النظام كما كان قبل dnspython
+
+        infos = socket.getaddrinfo(name, None, type=socket.SOCK_STREAM)
+        addresses = []
+        # IPv4 أولاً لأن أغلب المزودين يدعمونه
+        for family in (socket.AF_INET, socket.AF_INET6):
+            for info_family, _, _, _, sockaddr in infos:
+                if info_family == family and sockaddr[0] not in addresses:
+                    addresses.append(sockaddr[0])
+        return addresses, self.default_ttl
+
+    def resolve_all(self, name, timeout=None):
+        """إرجاع كل عناوين الاسم (A ثم AAAA)"""
+        return self.submit(name).result(timeout)
+
+    def resolve(self, name, timeout=None):
+        """إرجاع أول عنوان للاسم"""
+        return self.resolve_all(name, timeout)[0]
+
+    def resolve_many(self, names, timeout=None):
+        """تحليل عدة أسماء بالتوازي؛ الأسماء التي فشل تحليلها قيمتها None"""
+        futures = {name: self.submit(name) for name in set(names)}
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result(timeout)
+            except Exception:
+                results[name] = None
+        return results
+
+    async def aresolve_all(self, name):
+        """نسخة asyncio من resolve_all"""
+        import asyncio
+        return await asyncio.wrap_future(self.submit(name))
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._cache), "inflight": len(self._inflight),
+                    "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
+
+    def close(self):
+        self._executor.shutdown(wait=False)
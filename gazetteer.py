@@ -0,0 +1,109 @@
+import csv
+import sys
+
+import numpy as np
+
+import metrics
+from spatial_index import GridIndex
+
+# أعمدة ملفات GeoNames (cities500/1000/5000/15000.txt) المفصولة بعلامة جدولة وبدون ترويسة
+GEONAMES_NAME = 1
+GEONAMES_LATITUDE = 4
+GEONAMES_LONGITUDE = 5
+GEONAMES_COUNTRY = 8
+GEONAMES_ADMIN1 = 10
+
+
+class OfflineReverseGeocoder:
+    """بحث عكسي محلي عن أقرب مكان مأهول من ملف GeoNames دون أي اتصال بالشبكة"""
+
+    def __init__(self, path, max_distance_km=None, cell_deg=1.0):
+        self.path = path
+        self.max_distance_km = max_distance_km
+        if path.endswith(".npz"):
+            names, countries, regions, latitudes, longitudes = self._load_npz(path)
+        else:
+            names, countries, regions, latitudes, longitudes = self._load_text(path)
+        self.names = names
+        self.countries = countries
+        self.regions = regions
+        self.index = GridIndex(latitudes, longitudes, cell_deg=cell_deg)
+
+    @staticmethod
+    def _load_text(path):
+        names, countries, regions, latitudes, longitudes = [], [], [], [], []
+        csv.field_size_limit(sys.maxsize)
+        with open(path, newline="", encoding="utf-8") as f:
+            first = f.readline()
+            f.seek(0)
+            if "\t" in first:
+                reader = csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE)
+                columns = (GEONAMES_NAME, GEONAMES_LATITUDE, GEONAMES_LONGITUDE, GEONAMES_COUNTRY, GEONAMES_ADMIN1)
+            else:
+                # CSV بترويسة: name, latitude, longitude, country_code, admin1
+                reader = csv.reader(f)
+                header = [column.strip().lower() for column in next(reader)]
+                columns = tuple(header.index(name) if name in header else None
+                                for name in ("name", "latitude", "longitude", "country_code", "admin1"))
+            name_col, lat_col, lon_col, country_col, region_col = columns
+
+            # النصوص المتكررة (الدول والمناطق) تُخزن مرة واحدة
+            interned = {}
+            for row in reader:
+                try:
+                    latitude = float(row[lat_col])
+                    longitude = float(row[lon_col])
+                except (IndexError, ValueError):
+                    continue
+                names.append(row[name_col])
+                country = row[country_col] if country_col is not None and country_col < len(row) else ""
+                region = row[region_col] if region_col is not None and region_col < len(row) else ""
+                countries.append(interned.setdefault(country, country))
+                regions.append(interned.setdefault(region, region))
+                latitudes.append(latitude)
+                longitudes.append(longitude)
+        return (names, countries, regions,
+                np.array(latitudes, dtype=np.float32), np.array(longitudes, dtype=np.float32))
+
+    @staticmethod
+    def _load_npz(path):
+        data = np.load(path, allow_pickle=False)
+        return (data["names"].tolist(), data["countries"].tolist(), data["regions"].tolist(),
+                data["latitudes"], data["longitudes"])
+
+    def save(self, path):
+        """حفظ المكان المُحمَّل بصيغة npz لتحميل أسرع لاحقاً"""
+        np.savez_compressed(
+            path,
+            names=np.array(self.names),
+            countries=np.array(self.countries),
+            regions=np.array(self.regions),
+            latitudes=self.index.latitudes,
+            longitudes=self.index.longitudes,
+        )
+
+    def __len__(self):
+        return len(self.names)
+
+    def _format(self, index, distance):
+        if index < 0 or (self.max_distance_km is not None and distance > self.max_distance_km):
+            return None
+        parts = [self.names[index], self.regions[index], self.countries[index]]
+        return ", ".join(part for part in parts if part)
+
+    def nearest(self, latitudes, longitudes):
+        """أقرب الأماكن لمصفوفة إحداثيات: (أرقام الأماكن، المسافات بالكيلومتر)"""
+        return self.index.nearest(latitudes, longitudes)
+
+    def reverse(self, latitude, longitude):
+        """نفس واجهة ReverseGeocoder.reverse: العنوان المقدر أو None"""
+        return self.reverse_many([(latitude, longitude)])[0]
+
+    def reverse_many(self, coordinates):
+        """بحث عكسي متجه لآلاف الإحداثيات في استدعاء واحد"""
+        if not len(coordinates):
+            return []
+        points = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        with metrics.span("gazetteer"):
+            indices, distances = self.nearest(points[:, 0], points[:, 1])
+        return [self._format(index, distance) for index, distance in zip(indices.tolist(), distances.tolist())]
@@ -0,0 +1,255 @@
+import sys
+
+import numpy as np
+
+from geo_result import IpLocation
+from ip_array import IpArray
+from spatial_index import GridIndex, haversine_km
+
+# الأعمدة النصية المرمزة بقاموس: (الاسم، نوع الرمز)؛ الرمز 0 يعني قيمة فارغة
+ENCODED_COLUMNS = (
+    ("country", np.uint16),
+    ("region", np.uint32),
+    ("city", np.uint32),
+    ("time_zone", np.uint16),
+    ("isp", np.uint32),
+    ("provider", np.uint16),
+)
+
+
+class Dictionary:
+    """ترميز قيم نصية متكررة إلى أعداد صغيرة (كل نص مخزن مرة واحدة)"""
+
+    def __init__(self, dtype=np.uint32):
+        self.dtype = np.dtype(dtype)
+        self.values = [None]
+        self.codes = {None: 0}
+
+    def __len__(self):
+        return len(self.values)
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            if code > np.iinfo(self.dtype).max:
+                raise ValueError(f"Too many distinct values for {self.dtype} codes")
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def encode(self, values):
+        return np.fromiter((self.code(value or None) for value in values), dtype=self.dtype, count=len(values))
+
+    def lookup(self, value):
+        """رمز القيمة أو -1 إن لم تظهر أبداً"""
+        return self.codes.get(value, -1)
+
+    def decode(self, code):
+        return self.values[code]
+
+    def nbytes(self):
+        return sys.getsizeof(self.values) + sys.getsizeof(self.codes) + sum(
+            sys.getsizeof(value) for value in self.values if value is not None)
+
+
+class GeoResultBatch:
+    """نتائج كثيرة في أعمدة مصفوفات: عنوان IP معبأ، نصوص مرمزة بقاموس، وإحداثيات float32
+
+    الإضافة تتراكم في قوائم صغيرة تُحول إلى مصفوفات كل chunk_size صف، والتصفية والتجميع متجهان.
+    """
+
+    def __init__(self, chunk_size=65536, dictionaries=None):
+        self.chunk_size = chunk_size
+        self.dictionaries = dictionaries or {name: Dictionary(dtype) for name, dtype in ENCODED_COLUMNS}
+        self._chunks = []
+        self._columns = None
+        self._staged = []
+        self._index = None
+
+    @classmethod
+    def from_locations(cls, locations, **kwargs):
+        batch = cls(**kwargs)
+        for location in locations:
+            batch.add(location)
+        return batch
+
+    @classmethod
+    def from_rows(cls, rows, **kwargs):
+        """من صفوف قواميس (نتائج bulk_lookup أو سجلات ResultStore)؛ الصفوف بلا إحداثيات تُتجاهل"""
+        batch = cls(**kwargs)
+        for row in rows:
+            # صفوف CSV تحمل نصاً فارغاً بدلاً من None
+            if not row.get("error") and row.get("latitude") not in (None, "") and row.get("longitude") not in (None, ""):
+                batch.add(row)
+        return batch
+
+    def add(self, location):
+        """إضافة IpLocation أو قاموس بنفس الحقول"""
+        if isinstance(location, IpLocation):
+            values = tuple(getattr(location, field) for field in IpLocation.FIELDS) + (location.provider,)
+        else:
+            values = tuple(location.get(field) for field in IpLocation.FIELDS) + (location.get("provider"),)
+        self._staged.append(values)
+        if len(self._staged) >= self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._staged:
+            return
+        staged, self._staged = self._staged, []
+        columns = dict(zip(IpLocation.FIELDS + ("provider",), zip(*staged)))
+        ips = IpArray.parse([ip or "" for ip in columns["ip_address"]])
+        chunk = {"ip_version": ips.version, "ip_high": ips.high, "ip_low": ips.low}
+        for name, _ in ENCODED_COLUMNS:
+            chunk[name] = self.dictionaries[name].encode(columns[name])
+        for name in ("latitude", "longitude"):
+            chunk[name] = np.array([np.nan if value is None else value for value in columns[name]], dtype=np.float32)
+        self._chunks.append(chunk)
+        self._columns = None
+        self._index = None
+
+    @property
+    def columns(self):
+        """كل الأعمدة كمصفوفات متصلة (تُدمج القطع عند أول قراءة بعد الإضافة)"""
+        self._flush()
+        if self._columns is None:
+            if len(self._chunks) == 1:
+                self._columns = self._chunks[0]
+            elif self._chunks:
+                self._columns = {name: np.concatenate([chunk[name] for chunk in self._chunks])
+                                 for name in self._chunks[0]}
+                self._chunks = [self._columns]
+            else:
+                self._columns = self._empty_columns()
+        return self._columns
+
+    def _empty_columns(self):
+        columns = {"ip_version": np.zeros(0, np.uint8), "ip_high": np.zeros(0, np.uint64),
+                   "ip_low": np.zeros(0, np.uint64), "latitude": np.zeros(0, np.float32),
+                   "longitude": np.zeros(0, np.float32)}
+        for name, dtype in ENCODED_COLUMNS:
+            columns[name] = np.zeros(0, dtype)
+        return columns
+
+    def __len__(self):
+        return sum(len(chunk["latitude"]) for chunk in self._chunks) + len(self._staged)
+
+    def __getitem__(self, index):
+        """صف واحد كـ IpLocation"""
+        columns = self.columns
+        ips = IpArray(columns["ip_version"], columns["ip_high"], columns["ip_low"])
+        values = {name: self.dictionaries[name].decode(columns[name][index]) for name, _ in ENCODED_COLUMNS}
+        latitude, longitude = columns["latitude"][index], columns["longitude"][index]
+        values["latitude"] = None if np.isnan(latitude) else round(float(latitude), 5)
+        values["longitude"] = None if np.isnan(longitude) else round(float(longitude), 5)
+        return IpLocation(ips.format(index), **values)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    @property
+    def nbytes(self):
+        """حجم الأعمدة والقواميس بالبايت"""
+        return (sum(column.nbytes for column in self.columns.values())
+                + sum(dictionary.nbytes() for dictionary in self.dictionaries.values()))
+
+    def codes(self, name, values):
+        """رموز قيم نصية في عمود مرمز (القيم غير الموجودة تُهمل)"""
+        if isinstance(values, str) or values is None:
+            values = [values]
+        codes = [self.dictionaries[name].lookup(value) for value in values]
+        return np.array([code for code in codes if code >= 0], dtype=self.dictionaries[name].dtype)
+
+    def mask(self, country=None, region=None, city=None, provider=None, bbox=None, near=None):
+        """قناع الصفوف المطابقة لكل الشروط؛ كل شرط نصي قيمة أو قائمة قيم، و bbox = (جنوب، غرب، شمال، شرق)
+
+        near = (خط العرض، خط الطول، نصف القطر بالكيلومتر) يقصر الصفوف على دائرة حول نقطة.
+        """
+        columns = self.columns
+        mask = np.ones(len(columns["latitude"]), bool)
+        for name, values in (("country", country), ("region", region), ("city", city), ("provider", provider)):
+            if values is not None:
+                mask &= np.isin(columns[name], self.codes(name, values))
+        if bbox is not None:
+            south, west, north, east = bbox
+            latitude, longitude = columns["latitude"], columns["longitude"]
+            mask &= (latitude >= south) & (latitude <= north)
+            # صندوق يعبر خط التاريخ (الغرب أكبر من الشرق)
+            if west <= east:
+                mask &= (longitude >= west) & (longitude <= east)
+            else:
+                mask &= (longitude >= west) | (longitude <= east)
+        if near is not None:
+            inside = np.zeros(len(mask), bool)
+            inside[self.spatial_index().within_radius(*near)[0]] = True
+            mask &= inside
+        return mask
+
+    def filter(self, mask=None, **conditions):
+        """دفعة جديدة بالصفوف المطابقة (تشارك القواميس نفسها)"""
+        if mask is None:
+            mask = self.mask(**conditions)
+        batch = GeoResultBatch(self.chunk_size, self.dictionaries)
+        batch._chunks = [{name: column[mask] for name, column in self.columns.items()}]
+        return batch
+
+    def group_counts(self, by="country", mask=None):
+        """(القيمة، العدد) لكل مجموعة مرتبة تنازلياً"""
+        codes = self.columns[by] if mask is None else self.columns[by][mask]
+        counts = np.bincount(codes, minlength=len(self.dictionaries[by]))
+        order = np.argsort(-counts, kind="stable")
+        return [(self.dictionaries[by].decode(code), int(counts[code])) for code in order.tolist() if counts[code]]
+
+    def centroids(self, by="country", mask=None):
+        """القيمة -> (متوسط خط العرض، متوسط خط الطول، العدد) لكل مجموعة"""
+        columns = self.columns
+        valid = ~np.isnan(columns["latitude"]) & ~np.isnan(columns["longitude"])
+        if mask is not None:
+            valid &= mask
+        codes = columns[by][valid]
+        size = len(self.dictionaries[by])
+        counts = np.bincount(codes, minlength=size)
+        latitudes = np.bincount(codes, weights=columns["latitude"][valid].astype(np.float64), minlength=size)
+        longitudes = np.bincount(codes, weights=columns["longitude"][valid].astype(np.float64), minlength=size)
+        return {self.dictionaries[by].decode(code): (float(latitudes[code] / counts[code]),
+                                                     float(longitudes[code] / counts[code]), int(counts[code]))
+                for code in np.flatnonzero(counts).tolist()}
+
+    def spatial_index(self):
+        """فهرس مكاني (GridIndex) على إحداثيات الصفوف؛ يُبنى عند أول استعلام ويُعاد بعد إضافة صفوف"""
+        columns = self.columns
+        if self._index is None:
+            self._index = GridIndex(columns["latitude"], columns["longitude"])
+        return self._index
+
+    def within_radius(self, latitude, longitude, radius_km):
+        """(أرقام الصفوف، المسافات بالكيلومتر) ضمن دائرة حول نقطة، من الأقرب"""
+        return self.spatial_index().within_radius(latitude, longitude, radius_km)
+
+    def k_nearest(self, latitude, longitude, k):
+        """(أرقام الصفوف، المسافات) لأقرب k نتيجة من نقطة"""
+        return self.spatial_index().k_nearest(latitude, longitude, k)
+
+    def distances(self, latitude, longitude):
+        """مسافة كل صف عن نقطة بالكيلومتر (NaN للصفوف بلا إحداثيات)"""
+        columns = self.columns
+        return haversine_km(latitude, longitude, columns["latitude"], columns["longitude"])
+
+    def nearest(self, latitudes, longitudes, mask=None):
+        """لكل صف: رقم أقرب نقطة من قائمة مراكز (مراكز بيانات أو مناطق) والمسافة إليها؛ -1 للصفوف بلا إحداثيات"""
+        columns = self.columns
+        valid = ~np.isnan(columns["latitude"]) & ~np.isnan(columns["longitude"])
+        if mask is not None:
+            valid &= mask
+        nearest = np.full(len(valid), -1, np.int64)
+        distances = np.full(len(valid), np.nan)
+        nearest[valid], distances[valid] = GridIndex(latitudes, longitudes).nearest(
+            columns["latitude"][valid], columns["longitude"][valid])
+        return nearest, distances
+
+    def values(self, name):
+        """عمود نصي مفكوك كقائمة (للعرض أو التصدير)"""
+        dictionary = self.dictionaries[name]
+        return [dictionary.values[code] for code in self.columns[name].tolist()]
@@ -0,0 +1,374 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from geo_result import IpLocation
+from ip_range_db import IpRangeDatabase
+
+
+# أخطاء ip2geotools لا تحمل رمز حالة HTTP: رمز تقريبي لكل نوع حتى يصنفها مجدول الطلبات
+# (ServiceError تغطي انقطاع الشبكة وكل رد غير 200 بما فيه 429 في DbIpCity)
+IP2GEOTOOLS_STATUS = {"LimitExceededError": 429, "ServiceError": 503}
+
+
+class ProviderError(RuntimeError):
+    """فشل طلب مزود مع رمز حالة HTTP (حقيقي أو تقريبي) يقرأه مجدول الطلبات لإعادة المحاولة"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class LatencyHistogram:
+    """نافذة متحركة لأزمنة الاستجابة الأخيرة مع حساب النسب المئوية"""
+
+    def __init__(self, size=256):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, p, default=None):
+        """النسبة المئوية p (0-100) من العينات أو default إن لم توجد عينات"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return default
+        index = min(len(samples) - 1, max(0, int(round(p / 100.0 * (len(samples) - 1)))))
+        return samples[index]
+
+
+class CircuitBreaker:
+    """قاطع دائرة: يوقف إرسال الطلبات لمزود يفشل باستمرار ثم يجربه مجدداً بعد مهلة"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        # في الحالة نصف المفتوحة يمر طلب تجريبي واحد فقط حتى تُعرف نتيجته
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        """هل يقبل المزود طلباً الآن (دون حجز الطلب التجريبي)"""
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self.probing)
+
+    def acquire(self):
+        """حجز إذن إرسال طلب: دائماً في الحالة المغلقة، ولطلب واحد فقط في الحالة نصف المفتوحة"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.probing = False
+            self.failures += 1
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+
+class GeoProvider:
+    """مزود بيانات موقع عام: يقيس زمن الاستجابة ويدير قاطع الدائرة حول _fetch"""
+
+    name = "provider"
+    # اسم النقطة في مجدول الطلبات (افتراضياً اسم المزود)؛ None للمزودين المحليين بلا شبكة
+    endpoint = ""
+
+    def __init__(self, timeout=5.0, pool_size=10, failure_threshold=5, reset_timeout=30.0):
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.scheduler = None
+        self._session = None
+        self.latency = LatencyHistogram()
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def session(self):
+        """جلسة requests بمجموعة اتصالات خاصة بالمزود (تُنشأ عند أول استخدام)"""
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._session = session
+        return self._session
+
+    def _fetch(self, ip):
+        raise NotImplementedError
+
+    @property
+    def available(self):
+        return self.breaker.allow()
+
+    def get(self, ip):
+        """تحديد موقع العنوان؛ يرفع استثناء عند الفشل أو إن كانت الدائرة مفتوحة"""
+        if not self.breaker.acquire():
+            raise RuntimeError(f"Provider {self.name} is temporarily disabled after repeated failures")
+        self.requests += 1
+        started = time.perf_counter()
+        try:
+            if self.scheduler is not None and self.endpoint is not None:
+                location = self.scheduler.call(self.endpoint or self.name, self._fetch, ip)
+            else:
+                location = self._fetch(ip)
+            if location is None or location.latitude is None or location.longitude is None:
+                raise LookupError(f"Provider {self.name} returned no coordinates for {ip}")
+        except Exception:
+            self.errors += 1
+            self.breaker.record_failure()
+            self.latency.record(time.perf_counter() - started)
+            raise
+        self.breaker.record_success()
+        self.latency.record(time.perf_counter() - started)
+        return location
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "p50": self.latency.percentile(50),
+            "p95": self.latency.percentile(95),
+            "p99": self.latency.percentile(99),
+            "circuit": self.breaker.state,
+        }
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+
+
+class Ip2GeoToolsProvider(GeoProvider):
+    """مزود من قواعد ip2geotools المجانية (تستخدم طلبات HTTP خاصة بها خارج الجلسة المشتركة)"""
+
+    def __init__(self, database, name, api_key="free", **kwargs):
+        super().__init__(**kwargs)
+        # اسم الصنف في ip2geotools.databases.noncommercial؛ الوحدة تُحمَّل عند أول طلب
+        self.database = database
+        self.name = name
+        self.api_key = api_key
+
+    def _fetch(self, ip):
+        from ip2geotools.databases import noncommercial
+        database = getattr(noncommercial, self.database)
+        try:
+            response = database.get(ip, api_key=self.api_key)
+        except Exception as e:
+            status = IP2GEOTOOLS_STATUS.get(type(e).__name__)
+            if status is None:
+                raise
+            raise ProviderError(f"{self.name}: {type(e).__name__} {e}".strip(), status) from e
+        return IpLocation.from_response(response, provider=self.name)
+
+
+class DbIpCityProvider(Ip2GeoToolsProvider):
+    """مزود DB-IP City المجاني (المزود الافتراضي)"""
+
+    def __init__(self, **kwargs):
+        super().__init__("DbIpCity", "dbip", **kwargs)
+
+
+class HttpJsonProvider(GeoProvider):
+    """مزود يعيد JSON عبر HTTP باستخدام جلسة requests ذات اتصالات معاد استخدامها"""
+
+    url = None
+
+    def __init__(self, url=None, **kwargs):
+        super().__init__(**kwargs)
+        if url:
+            self.url = url
+
+    def _fetch(self, ip):
+        response = self.session.get(self.url.format(ip=ip), timeout=self.timeout)
+        response.raise_for_status()
+        return self.parse(ip, response.json())
+
+    def parse(self, ip, data):
+        raise NotImplementedError
+
+
+class IpApiProvider(HttpJsonProvider):
+    """ip-api.com (مجاني لغير الاستخدام التجاري، 45 طلباً في الدقيقة)"""
+
+    name = "ipapi"
+    url = "http://ip-api.com/json/{ip}?fields=status,message,country,regionName,city,lat,lon,timezone,isp,query"
+
+    def parse(self, ip, data):
+        if data.get("status") != "success":
+            raise LookupError(data.get("message", "ip-api lookup failed"))
+        return IpLocation(
+            data.get("query", ip), country=data.get("country"), region=data.get("regionName"),
+            city=data.get("city"), latitude=data.get("lat"), longitude=data.get("lon"),
+            time_zone=data.get("timezone"), isp=data.get("isp"), provider=self.name)
+
+
+class DbIpApiProvider(HttpJsonProvider):
+    """واجهة DB-IP الرسمية بمفتاح (الخطط المدفوعة تعيد الإحداثيات؛ المجانية لا تعيدها)"""
+
+    name = "dbipapi"
+    # المفتاح المجاني يشارك DbIpCity الحصة اليومية نفسها
+    endpoint = "dbip"
+    url = "https://api.db-ip.com/v2/{api_key}/{ip}"
+
+    def __init__(self, api_key="free", **kwargs):
+        super().__init__(**kwargs)
+        self.url = self.url.replace("{api_key}", api_key)
+
+    def parse(self, ip, data):
+        if "error" in data:
+            raise LookupError(data["error"])
+        return IpLocation(
+            data.get("ipAddress", ip), country=data.get("countryName"), region=data.get("stateProv"),
+            city=data.get("city"), latitude=data.get("latitude"), longitude=data.get("longitude"),
+            time_zone=data.get("timeZone"), isp=data.get("isp"), provider=self.name)
+
+
+class IpWhoisProvider(HttpJsonProvider):
+    """ipwho.is"""
+
+    name = "ipwhois"
+    url = "https://ipwho.is/{ip}"
+
+    def parse(self, ip, data):
+        if not data.get("success", False):
+            raise LookupError(data.get("message", "ipwho.is lookup failed"))
+        return IpLocation(
+            data.get("ip", ip), country=data.get("country"), region=data.get("region"),
+            city=data.get("city"), latitude=data.get("latitude"), longitude=data.get("longitude"),
+            time_zone=(data.get("timezone") or {}).get("id"), isp=(data.get("connection") or {}).get("isp"),
+            provider=self.name)
+
+
+class LocalDatabaseProvider(GeoProvider):
+    """قاعدة بيانات النطاقات المحلية كمزود (لا شبكة)"""
+
+    name = "local"
+    endpoint = None
+
+    def __init__(self, database, **kwargs):
+        super().__init__(**kwargs)
+        self.database = database
+
+    def _fetch(self, ip):
+        return self.database.get(ip)
+
+    def close(self):
+        super().close()
+        self.database.close()
+
+
+PROVIDERS = {
+    "dbip": DbIpCityProvider,
+    "dbipapi": DbIpApiProvider,
+    "ipapi": IpApiProvider,
+    "ipwhois": IpWhoisProvider,
+    "hostip": lambda **kwargs: Ip2GeoToolsProvider("HostIP", "hostip", **kwargs),
+    "freegeoip": lambda **kwargs: Ip2GeoToolsProvider("Freegeoip", "freegeoip", **kwargs),
+}
+
+
+class HedgedGeoProvider:
+    """إرسال الطلب لأسرع مزود أولاً ثم لمزود احتياطي بعد مهلة متكيفة، وقبول أول إجابة صالحة"""
+
+    name = "hedged"
+
+    def __init__(self, providers, hedge_percentile=95, min_delay=0.05, max_delay=2.0,
+                 default_delay=0.5, max_workers=16):
+        self.providers = list(providers)
+        self.hedge_percentile = hedge_percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.default_delay = default_delay
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+        self.hedges = 0
+
+    def ranked(self):
+        """المزودون المتاحون مرتبين حسب الوسيط الحالي لزمن الاستجابة (غير المقاسين أولاً لتجربتهم)"""
+        available = [provider for provider in self.providers if provider.available] or self.providers
+        # المزود الذي فشل مؤخراً يتأخر في الترتيب حتى لو كان فشله سريعاً
+        return sorted(available, key=lambda provider: (provider.breaker.failures > 0,
+                                                        provider.latency.percentile(50, default=0.0)))
+
+    def hedge_delay(self, provider):
+        delay = provider.latency.percentile(self.hedge_percentile, default=self.default_delay)
+        return min(self.max_delay, max(self.min_delay, delay))
+
+    def get(self, ip):
+        """أول إجابة صالحة من المزودين؛ يرفع آخر خطأ إن فشلوا جميعاً"""
+        queue = self.ranked()
+        pending = {}
+        last_error = None
+        while queue or pending:
+            if queue:
+                provider = queue.pop(0)
+                if pending:
+                    self.hedges += 1
+                pending[self._executor.submit(provider.get, ip)] = provider
+                timeout = self.hedge_delay(provider) if queue else None
+            else:
+                timeout = None
+
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    last_error = e
+                    # فشل سريع: لا داعي لانتظار مهلة التحوط قبل المزود التالي
+        raise last_error or LookupError(f"No provider could locate {ip}")
+
+    def stats(self):
+        stats = {provider.name: provider.stats() for provider in self.providers}
+        stats["hedges"] = self.hedges
+        return stats
+
+    def close(self):
+        for provider in self.providers:
+            provider.close()
+        self._executor.shutdown(wait=False)
+
+
+def build_provider(names, **kwargs):
+    """إنشاء مزود واحد أو مزود متحوط من قائمة أسماء مثل "dbip,ipapi" أو "local:ip_ranges.bin,dbip" """
+    if isinstance(names, str):
+        names = [name.strip() for name in names.split(",") if name.strip()]
+    providers = []
+    for name in names or ["dbip"]:
+        if name.startswith("local:"):
+            providers.append(LocalDatabaseProvider(IpRangeDatabase(name[len("local:"):]), **kwargs))
+            continue
+        if name not in PROVIDERS:
+            raise ValueError(f"Unknown provider: {name} (available: {', '.join(sorted(PROVIDERS))})")
+        providers.append(PROVIDERS[name](**kwargs))
+    return providers[0] if len(providers) == 1 else HedgedGeoProvider(providers)
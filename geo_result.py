@@ -0,0 +1,42 @@
+class IpLocation:
+    """نتيجة موحدة لتحديد موقع عنوان IP بغض النظر عن مزود البيانات"""
+
+    FIELDS = ("ip_address", "country", "region", "city", "latitude", "longitude", "time_zone", "isp")
+    # بدون __dict__ لكل نتيجة: أصغر بكثير عند الاحتفاظ بعدد كبير منها
+    __slots__ = FIELDS + ("provider",)
+
+    def __init__(self, ip_address, country=None, region=None, city=None,
+                 latitude=None, longitude=None, time_zone=None, isp=None, provider=None):
+        self.ip_address = ip_address
+        self.country = country
+        self.region = region
+        self.city = city
+        self.latitude = latitude
+        self.longitude = longitude
+        self.time_zone = time_zone
+        self.isp = isp
+        self.provider = provider
+
+    @classmethod
+    def from_response(cls, response, provider=None):
+        """تحويل استجابة مزود خارجي (مثل DbIpCity) إلى نتيجة موحدة"""
+        if isinstance(response, cls):
+            return response
+        values = {field: getattr(response, field, None) for field in cls.FIELDS}
+        return cls(provider=provider, **values)
+
+    @classmethod
+    def from_dict(cls, data):
+        """إنشاء نتيجة من قاموس"""
+        values = {field: data.get(field) for field in cls.FIELDS}
+        return cls(provider=data.get("provider"), **values)
+
+    def to_dict(self):
+        """تحويل النتيجة إلى قاموس قابل للتخزين"""
+        data = {field: getattr(self, field) for field in self.FIELDS}
+        data["provider"] = self.provider
+        return data
+
+    def __repr__(self):
+        return (f"IpLocation({self.ip_address!r}, country={self.country!r}, "
+                f"city={self.city!r}, latitude={self.latitude}, longitude={self.longitude})")
@@ -0,0 +1,368 @@
+"""خدمة HTTP محلية (asyncio) تعرض تحديد الموقع كـ JSON لأدوات أخرى بدون الواجهة الرسومية
+
+GET  /lookup?target=8.8.8.8&address=1      نتيجة واحدة
+POST /lookup  {"targets": [...], "address": true}  دفعة نتائج بنفس الترتيب
+GET  /stats   GET /metrics   GET /health
+"""
+import argparse
+import asyncio
+import ipaddress
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import metrics
+from rate_limit import TokenBucket
+from request_scheduler import BULK, INTERACTIVE, RequestScheduler
+from result_store import make_record
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 502: "Bad Gateway", 503: "Service Unavailable"}
+
+
+class Overloaded(Exception):
+    """الطلبات المعلقة بلغت الحد الأقصى؛ يُرد بـ 503 بدلاً من تكديسها"""
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _retrieve(future):
+    # لا أحد ينتظر النتيجة أحياناً: منع تحذير "exception was never retrieved"
+    if not future.cancelled():
+        future.exception()
+
+
+class LookupServer:
+    """منطق GeoService خلف خادم asyncio مع دمج الطلبات المتطابقة وحد للتزامن ورفض عند الضغط الزائد"""
+
+    def __init__(self, service, max_concurrency=8, max_pending=256, max_batch=1000, rate=None,
+                 store=None, coalesce_prefix=True, ipv4_prefix=24, ipv6_prefix=48,
+                 max_body=1024 * 1024, idle_timeout=30.0):
+        self.service = service
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.max_batch = max_batch
+        self.store = store
+        self.coalesce_prefix = coalesce_prefix
+        self.ipv4_prefix = ipv4_prefix
+        self.ipv6_prefix = ipv6_prefix
+        self.max_body = max_body
+        self.idle_timeout = idle_timeout
+        # حصة المزود: عدد الطلبات الصادرة في الثانية (None بلا حد)
+        self.bucket = TokenBucket(rate, capacity=max(1.0, rate)) if rate else None
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="geo-server")
+        self._inflight = {}
+        self._semaphore = None
+        self._server = None
+        self.pending = 0
+        self.requests = 0
+        self.lookups = 0
+        self.upstream = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    def key(self, ip):
+        """مفتاح الدمج: الشبكة (/24، /48) إن كان الدمج بالبادئة مفعلاً وإلا العنوان
+
+        مع قاعدة نطاقات محلية يُدمج العنوان نفسه فقط: النطاقات أدق من /24 والبحث المحلي لا يكلف شيئاً.
+        """
+        if not self.coalesce_prefix or self.service.ip_database is not None:
+            return ip
+        address = ipaddress.ip_address(ip)
+        prefix = self.ipv4_prefix if address.version == 4 else self.ipv6_prefix
+        return str(ipaddress.ip_network(f"{address}/{prefix}", strict=False))
+
+    async def _single_flight(self, key, fn, *args, owner=None):
+        """تنفيذ fn في خيط عامل مرة واحدة لكل مفتاح؛ الطلبات المتزامنة لنفس المفتاح تنتظر النتيجة نفسها
+
+        owner العنوان الفعلي خلف المفتاح: النتيجة الناجحة تُشارك داخل الشبكة، أما خطأ عنوان آخر فلا
+        يُنسب لهذا العنوان بل يُعاد البحث عنه منفرداً.
+        """
+        entry = self._inflight.get(key)
+        if entry is not None:
+            future, leader = entry
+            self.coalesced += 1
+            if leader == owner:
+                return await asyncio.shield(future)
+            try:
+                return await asyncio.shield(future)
+            except Exception:
+                self.coalesced -= 1
+                return await self._single_flight((key, owner), fn, *args, owner=owner)
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise Overloaded(f"Too many pending lookups ({self.pending})")
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        future.add_done_callback(_retrieve)
+        self._inflight[key] = (future, owner)
+        self.pending += 1
+        try:
+            async with self._semaphore:
+                result = await loop.run_in_executor(self._executor, fn, *args)
+        except BaseException as e:
+            future.set_exception(e if isinstance(e, Exception) else RuntimeError("Lookup cancelled"))
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
+            self.pending -= 1
+
+    def _locate(self, ip):
+        if self.bucket is not None and not self._cached(ip):
+            self.bucket.acquire()
+        self.upstream += 1
+        return self.service.get_ip_info(ip)
+
+    def _prioritized(self, priority, fn, *args):
+        """تنفيذ fn بأولوية في مجدول الطلبات (طلب مفرد قبل الدفعات) إن كان للخدمة مجدول"""
+        scheduler = self.service.scheduler
+        if scheduler is None:
+            return fn(*args)
+        with scheduler.priority(priority):
+            return fn(*args)
+
+    def _cached(self, ip):
+        """هل الإجابة محلية (قاعدة النطاقات أو الذاكرة المؤقتة) فلا تستهلك من حصة المزود"""
+        service = self.service
+        if service.ip_database is not None:
+            return True
+        return service.cache is not None and service.cache.get(ip, service.provider_name) is not None
+
+    async def lookup(self, target, with_address=False, priority=INTERACTIVE):
+        """صف نتيجة لهدف واحد (بنفس أعمدة bulk_lookup مع all_ips)؛ يرفع الاستثناء عند الفشل"""
+        self.lookups += 1
+        addresses = await self.service.resolver.aresolve_all(target)
+        ip = addresses[0]
+        location = await self._single_flight(("ip", self.key(ip)), self._prioritized, priority, self._locate, ip,
+                                             owner=ip)
+        row = {"target": target}
+        row.update(location.to_dict())
+        # نتيجة مدموجة من عنوان آخر في نفس الشبكة
+        row["ip_address"] = ip
+        row["all_ips"] = addresses
+        if with_address and location.latitude is not None and location.longitude is not None:
+            coordinates = (round(location.latitude, 3), round(location.longitude, 3))
+            row["address"] = await self._single_flight(("address", coordinates), self._prioritized, priority,
+                                                       self.service.get_address_details,
+                                                       location.latitude, location.longitude)
+        row["error"] = None
+        if self.store is not None:
+            self.store.add(make_record(row))
+        return row
+
+    async def lookup_many(self, targets, with_address=False):
+        """نتائج دفعة بنفس ترتيب الأهداف؛ الأخطاء تُسجل في الصف كما في bulk_lookup"""
+        if len(targets) > self.max_batch:
+            raise HttpError(413, f"Batch too large ({len(targets)} > {self.max_batch})")
+        if not all(isinstance(target, str) for target in targets):
+            raise HttpError(400, "Every target must be a string")
+        # قبول الدفعة كاملة أو رفضها: لا نبدأ عملاً لن يكتمل
+        if self.pending + len(set(targets)) > self.max_pending:
+            self.rejected += 1
+            raise Overloaded(f"Too many pending lookups ({self.pending})")
+
+        async def one(target):
+            try:
+                return await self.lookup(target, with_address, BULK)
+            except Overloaded:
+                raise
+            except Exception as e:
+                return {"target": target, "error": str(e) or type(e).__name__}
+
+        return await asyncio.gather(*(one(target) for target in targets))
+
+    def stats(self):
+        stats = {"requests": self.requests, "lookups": self.lookups, "upstream": self.upstream,
+                 "coalesced": self.coalesced, "rejected": self.rejected, "pending": self.pending,
+                 "inflight": len(self._inflight), "provider": self.service.provider_name}
+        if self.service.cache is not None:
+            stats["cache"] = self.service.cache.stats()
+        if self.service.scheduler is not None:
+            stats["scheduler"] = self.service.scheduler.stats()
+        return stats
+
+    async def route(self, method, target, body):
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        if url.path == "/lookup" and method == "GET":
+            if not query.get("target"):
+                raise HttpError(400, "Missing target parameter")
+            with_address = query.get("address", ["0"])[0].lower() in ("1", "true", "yes")
+            try:
+                return 200, await self.lookup(query["target"][0], with_address)
+            except Overloaded:
+                raise
+            except Exception as e:
+                return 502, {"target": query["target"][0], "error": str(e) or type(e).__name__}
+        if url.path == "/lookup" and method == "POST":
+            try:
+                request = json.loads(body or b"{}")
+            except ValueError as e:
+                raise HttpError(400, f"Invalid JSON: {e}")
+            targets = request.get("targets") if isinstance(request, dict) else request
+            if not isinstance(targets, list):
+                raise HttpError(400, "Expected {\"targets\": [...]}")
+            with_address = bool(request.get("address")) if isinstance(request, dict) else False
+            return 200, {"results": await self.lookup_many(targets, with_address)}
+        if url.path == "/stats" and method == "GET":
+            return 200, self.stats()
+        if url.path == "/metrics" and method == "GET":
+            return 200, metrics.REGISTRY.render()
+        if url.path == "/health" and method == "GET":
+            return 200, {"status": "ok"}
+        if url.path in ("/lookup", "/stats", "/metrics", "/health"):
+            raise HttpError(405, f"{method} not allowed on {url.path}")
+        raise HttpError(404, f"Unknown path {url.path}")
+
+    async def handle(self, reader, writer):
+        """اتصال HTTP/1.1 واحد مع دعم keep-alive"""
+        try:
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    break
+                if not line:
+                    break
+                try:
+                    method, target, version = line.decode("latin-1").split()
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "Malformed request line"}, False)
+                    break
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = (version == "HTTP/1.1" and headers.get("connection", "").lower() != "close")
+                length = headers.get("content-length") or "0"
+                if not length.isdigit():
+                    await self.respond(writer, 400, {"error": "Invalid Content-Length"}, False)
+                    break
+                length = int(length)
+                if length > self.max_body:
+                    await self.respond(writer, 413, {"error": "Request body too large"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                self.requests += 1
+                headers_out = {}
+                try:
+                    status, payload = await self.route(method.upper(), target, body)
+                except HttpError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except Overloaded as e:
+                    status, payload = 503, {"error": str(e)}
+                    headers_out["Retry-After"] = "1"
+                except Exception as e:
+                    print(f"Error handling {method} {target}: {e}")
+                    status, payload = 502, {"error": str(e) or type(e).__name__}
+                await self.respond(writer, status, payload, keep_alive, headers_out)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive, headers=None):
+        if isinstance(payload, str):
+            data, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            data, content_type = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json"
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", f"Content-Type: {content_type}",
+                 f"Content-Length: {len(data)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + data)
+        await writer.drain()
+
+    async def start(self, host="127.0.0.1", port=8080):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._server = await asyncio.start_server(self.handle, host, port)
+        return self._server
+
+    @property
+    def address(self):
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"{host}:{port}"
+
+    async def serve_forever(self, host="127.0.0.1", port=8080):
+        server = await self.start(host, port)
+        print(f"Serving lookups on http://{self.address}", file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+        self._executor.shutdown(wait=False)
+        if self.store is not None:
+            self.store.close()
+
+
+def serve(service, host="127.0.0.1", port=8080, **kwargs):
+    """تشغيل الخدمة حتى Ctrl+C"""
+    server = LookupServer(service, **kwargs)
+    try:
+        asyncio.run(server.serve_forever(host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
+
+
+def main(argv=None):
+    from geo_providers import build_provider
+    from geo_service import GeoService
+    from lookup_cache import GeoLookupCache
+    from reverse_geocoder import ReverseGeocoder
+
+    parser = argparse.ArgumentParser(description="خدمة HTTP محلية لتحديد الموقع الجغرافي (JSON)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--ip-database", help="قاعدة بيانات نطاقات IP محلية بدلاً من المزود البعيد")
+    parser.add_argument("--providers", default="dbip", help="مزود أو أكثر مفصولين بفاصلة (مثل dbip,ipapi)")
+    parser.add_argument("--cache", default="geolocator_cache.sqlite", help="ملف الذاكرة المؤقتة الدائمة (فارغ لتعطيلها)")
+    parser.add_argument("--gazetteer", help="ملف أماكن GeoNames للبحث العكسي المحلي بدون شبكة")
+    parser.add_argument("--concurrency", type=int, default=8, help="أقصى عدد لعمليات البحث المتزامنة")
+    parser.add_argument("--max-pending", type=int, default=256, help="أقصى عدد لعمليات البحث المعلقة قبل الرد بـ 503")
+    parser.add_argument("--max-batch", type=int, default=1000, help="أقصى عدد أهداف في طلب دفعة واحد")
+    parser.add_argument("--rate", type=float, help="أقصى عدد طلبات للمزود البعيد في الثانية")
+    parser.add_argument("--no-prefix-coalescing", action="store_true", help="دمج الطلبات حسب العنوان فقط")
+    parser.add_argument("--store", help="إضافة النتائج الناجحة إلى سجل نتائج SQLite (انظر result_store.py)")
+    parser.add_argument("--quota", default="geolocator_quota.sqlite", help="ملف الحصص اليومية للخدمات الخارجية")
+    args = parser.parse_args(argv)
+
+    cache = GeoLookupCache(args.cache) if args.cache else None
+    if args.gazetteer:
+        from gazetteer import OfflineReverseGeocoder
+        reverse_geocoder = OfflineReverseGeocoder(args.gazetteer)
+    else:
+        reverse_geocoder = ReverseGeocoder("geo_locator_server", cache=args.cache or None)
+    provider = build_provider(args.providers, pool_size=max(1, args.concurrency))
+    service = GeoService(args.ip_database, user_agent="geo_locator_server", cache=cache,
+                         reverse_geocoder=reverse_geocoder, provider=provider,
+                         scheduler=RequestScheduler(quota_path=args.quota))
+    store = None
+    if args.store:
+        from result_store import ResultStore
+        store = ResultStore(args.store)
+    return serve(service, args.host, args.port, max_concurrency=max(1, args.concurrency),
+                 max_pending=args.max_pending, max_batch=args.max_batch, rate=args.rate, store=store,
+                 coalesce_prefix=not args.no_prefix_coalescing)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+import metrics
+from dns_resolver import CachingResolver
+from geo_providers import DbIpCityProvider
+from ip_range_db import IpRangeDatabase
+from lookup_cache import GeoLookupCache
+from privacy import get_policy
+from reverse_geocoder import ReverseGeocoder
+
+PUBLIC_IP_URL = "https://api.ipify.org?format=json"
+
+
+class GeoService:
+    """منطق تحديد الموقع المشترك بين الواجهات الرسومية والاستخدام بدون واجهة"""
+
+    def __init__(self, ip_database=None, user_agent="geo_locator_app", resolver=None, cache=None,
+                 reverse_geocoder=None, provider=None, public_ip_url=PUBLIC_IP_URL, scheduler=None):
+        self.user_agent = user_agent
+        self.public_ip_url = public_ip_url
+        # المزود البعيد: DbIpCity افتراضياً أو مزود متحوط من عدة مزودين (انظر geo_providers)
+        self.provider = provider or DbIpCityProvider()
+        self.resolver = resolver or CachingResolver()
+        self.reverse_geocoder = reverse_geocoder or ReverseGeocoder(user_agent)
+        self.ip_database = None
+        self.set_ip_database(ip_database)
+        self.cache = None
+        self.set_cache(cache)
+        self.scheduler = None
+        self.set_scheduler(scheduler)
+
+    def set_ip_database(self, ip_database):
+        """اختيار قاعدة بيانات النطاقات المحلية (مسار أو كائن) أو None للمزود البعيد"""
+        if self.ip_database is not None and self.ip_database is not ip_database:
+            self.ip_database.close()
+        if isinstance(ip_database, str):
+            ip_database = IpRangeDatabase(ip_database) if ip_database else None
+        self.ip_database = ip_database
+
+    def set_cache(self, cache):
+        """تفعيل الذاكرة المؤقتة الدائمة لنتائج المزود البعيد (مسار أو كائن) أو None لتعطيلها"""
+        if self.cache is not None and self.cache is not cache:
+            self.cache.close()
+        if isinstance(cache, str):
+            cache = GeoLookupCache(cache) if cache else None
+        self.cache = cache
+
+    @property
+    def provider_name(self):
+        return "local" if self.ip_database is not None else self.provider.name
+
+    def set_provider(self, provider):
+        """استبدال المزود البعيد
+
+        المزود السابق لا يُغلق هنا: عمليات بحث خلفية قد تستخدم جلسته بعد، وتُغلق اتصالاته عند تحريره.
+        """
+        self.provider = provider
+        self._attach_scheduler()
+
+    def set_scheduler(self, scheduler):
+        """تنسيق كل الطلبات الخارجية (المزودون و Nominatim و ipify) عبر مجدول مشترك أو None"""
+        self.scheduler = scheduler
+        self._attach_scheduler()
+
+    def _attach_scheduler(self):
+        for provider in getattr(self.provider, "providers", [self.provider]):
+            provider.scheduler = self.scheduler
+        if hasattr(self.reverse_geocoder, "scheduler"):
+            self.reverse_geocoder.scheduler = self.scheduler
+
+    def _public_ip(self):
+        import requests
+        response = requests.get(self.public_ip_url, timeout=5)
+        response.raise_for_status()
+        return response.json()['ip']
+
+    def get_public_ip(self):
+        """الحصول على عنوان IP العام"""
+        with metrics.span("public_ip"):
+            if self.scheduler is not None:
+                return self.scheduler.call("ipify", self._public_ip)
+            return self._public_ip()
+
+    def resolve(self, ip_or_domain):
+        """تحويل اسم النطاق إلى عنوان IP (العناوين تُعاد كما هي)"""
+        with metrics.span("dns"):
+            return self.resolver.resolve(ip_or_domain)
+
+    def resolve_all(self, ip_or_domain):
+        """كل عناوين A/AAAA للنطاق (من الذاكرة المؤقتة إن سبق تحليله)"""
+        with metrics.span("dns"):
+            return self.resolver.resolve_all(ip_or_domain)
+
+    def get_ip_info(self, ip_or_domain):
+        """الحصول على معلومات الموقع من عنوان IP أو النطاق"""
+        ip = self.resolve(ip_or_domain)
+        if self.ip_database is not None:
+            # البحث المحلي أسرع من أي ذاكرة مؤقتة
+            with metrics.span("local_db"):
+                return self.ip_database.get(ip)
+
+        if self.cache is not None:
+            cached = self.cache.get(ip, self.provider_name)
+            metrics.cache_result("ip", cached is not None)
+            if cached is not None:
+                return cached
+
+        # العناوين الخاصة والمحجوزة لا موقع عاماً لها: لا داعي لإهدار طلب من حصة المزود
+        from ip_array import ip_category
+        category = ip_category(ip)
+        if category != "public":
+            raise LookupError(f"{ip} is a {category} address and has no public location")
+
+        with metrics.span("provider", provider=self.provider_name):
+            location = self.provider.get(ip)
+        if self.cache is not None:
+            self.cache.set(ip, self.provider_name, location)
+        return location
+
+    def locate(self, ip_or_domain, privacy=None):
+        """(النتيجة بعد تطبيق مستوى الخصوصية، كل عناوين النطاق أو None)
+
+        المستويات الأعلى تكشف أقل وتكلف أقل: لا بحث عكسي بعد هذه الخطوة (انظر privacy.py).
+        """
+        policy = get_policy(privacy)
+        location = policy.apply(self.get_ip_info(ip_or_domain))
+        all_ips = self.resolve_all(ip_or_domain) if policy.all_ips else None
+        return location, all_ips
+
+    def describe(self, location, privacy=None):
+        """العنوان المقدر: بحث عكسي إن سمح به المستوى، وإلا نص من حقول النتيجة بلا أي طلب"""
+        policy = get_policy(privacy)
+        if policy.reverse_geocode and location.latitude is not None and location.longitude is not None:
+            return self.get_address_details(location.latitude, location.longitude)
+        return policy.describe(location)
+
+    def get_address_details(self, latitude, longitude):
+        """الحصول على تفاصيل العنوان من الإحداثيات"""
+        address = self.reverse_geocoder.reverse(latitude, longitude)
+        return address or "تفاصيل العنوان غير متوفرة"
+
+    def get_address_details_many(self, coordinates):
+        """تفاصيل العناوين لقائمة إحداثيات دفعة واحدة (متجهة عند استخدام المعجم الجغرافي المحلي)"""
+        addresses = self.reverse_geocoder.reverse_many(coordinates)
+        return [address or "تفاصيل العنوان غير متوفرة" for address in addresses]
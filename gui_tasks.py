@@ -0,0 +1,82 @@
+import queue
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TaskRunner:
+    """تشغيل المهام البطيئة في خيوط خلفية وإعادة نتائجها إلى خيط Tk عبر طابور يُفحص بـ after()"""
+
+    def __init__(self, master, max_workers=4, poll_ms=50, on_change=None):
+        self.master = master
+        self.poll_ms = poll_ms
+        self.on_change = on_change
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gui-task")
+        self._results = queue.Queue()
+        # المهام الجارية: المفتاح -> (المستقبل، قائمة دوال الاستدعاء)
+        self._active = {}
+        self._generation = 0
+        self._closed = False
+        self.master.after(self.poll_ms, self._poll)
+
+    @property
+    def active(self):
+        return len(self._active)
+
+    def submit(self, key, fn, *args, on_success=None, on_error=None):
+        """تشغيل fn(*args) في الخلفية؛ الطلبات المتطابقة (نفس المفتاح) تُدمج في مهمة واحدة"""
+        callbacks = (on_success, on_error)
+        if key in self._active:
+            self._active[key][1].append(callbacks)
+            return False
+
+        generation = self._generation
+        future = self._executor.submit(fn, *args)
+        self._active[key] = (future, [callbacks])
+        future.add_done_callback(lambda f: self._results.put((generation, key, f)))
+        self._changed()
+        return True
+
+    def cancel_all(self):
+        """إلغاء كل المهام: غير المبدوءة لن تبدأ، ونتائج الجارية ستُهمل"""
+        self._generation += 1
+        for future, _ in self._active.values():
+            future.cancel()
+        self._active.clear()
+        self._changed()
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change(len(self._active))
+
+    def _poll(self):
+        if self._closed:
+            return
+        finished = False
+        while True:
+            try:
+                generation, key, future = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if generation != self._generation or future.cancelled():
+                continue
+            _, callbacks = self._active.pop(key, (None, []))
+            finished = True
+            error = future.exception()
+            for on_success, on_error in callbacks:
+                # خطأ في دالة استدعاء واحدة لا يوقف الفحص ولا يمنع بقية الدوال
+                try:
+                    if error is None:
+                        if on_success is not None:
+                            on_success(future.result())
+                    elif on_error is not None:
+                        on_error(error)
+                except Exception:
+                    self.master.report_callback_exception(*sys.exc_info())
+        if finished:
+            self._changed()
+        self.master.after(self.poll_ms, self._poll)
+
+    def close(self):
+        self._closed = True
+        self.cancel_all()
+        self._executor.shutdown(wait=False)
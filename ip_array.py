@@ -0,0 +1,214 @@
+import ipaddress
+import socket
+import sys
+
+import numpy as np
+
+# تصنيف العناوين: العامة فقط تستحق طلباً للمزود
+PUBLIC, INVALID, PRIVATE, LOOPBACK, LINK_LOCAL, MULTICAST, RESERVED = range(7)
+CATEGORIES = ("public", "invalid", "private", "loopback", "link_local", "multicast", "reserved")
+
+# نطاقات الاستخدام الخاص (سجلات IANA)؛ أول نطاق مطابق يحدد التصنيف
+SPECIAL_RANGES = (
+    ("0.0.0.0/8", RESERVED),
+    ("10.0.0.0/8", PRIVATE),
+    ("100.64.0.0/10", PRIVATE),
+    ("127.0.0.0/8", LOOPBACK),
+    ("169.254.0.0/16", LINK_LOCAL),
+    ("172.16.0.0/12", PRIVATE),
+    ("192.0.0.0/24", RESERVED),
+    ("192.0.2.0/24", RESERVED),
+    ("192.168.0.0/16", PRIVATE),
+    ("198.18.0.0/15", RESERVED),
+    ("198.51.100.0/24", RESERVED),
+    ("203.0.113.0/24", RESERVED),
+    ("224.0.0.0/4", MULTICAST),
+    ("240.0.0.0/4", RESERVED),
+    ("::/128", RESERVED),
+    ("::1/128", LOOPBACK),
+    ("100::/64", RESERVED),
+    ("2001::/23", RESERVED),
+    ("2001:db8::/32", RESERVED),
+    ("fc00::/7", PRIVATE),
+    ("fe80::/10", LINK_LOCAL),
+    ("ff00::/8", MULTICAST),
+)
+MAX_LENGTH = 45
+_DIGITS = np.arange(48, 58)
+
+
+def _split(network):
+    """الشبكة كـ (الإصدار، النصف الأعلى، النصف الأدنى، قناع الأعلى، قناع الأدنى) بأعداد 64 بت"""
+    network = ipaddress.ip_network(network)
+    if network.version == 4:
+        return 4, 0, int(network.network_address), 0, int(network.netmask)
+    address, mask = int(network.network_address), int(network.netmask)
+    return 6, address >> 64, address & (2 ** 64 - 1), mask >> 64, mask & (2 ** 64 - 1)
+
+
+_RANGES = [(_split(network), category) for network, category in SPECIAL_RANGES]
+
+
+def _parse_ipv4(codes, lengths):
+    """تحليل متجه لعناوين IPv4 العشرية: عمود حرف في كل خطوة لكل الصفوف معاً"""
+    rows = len(codes)
+    ok = (lengths >= 7) & (lengths <= 15)
+    value = np.zeros(rows, np.int32)
+    digits = np.zeros(rows, np.int32)
+    octet = np.zeros(rows, np.int32)
+    address = np.zeros(rows, np.int64)
+    ended = np.zeros(rows, bool)
+    # العمود 15 صفر دائماً للعناوين الصالحة فيغلق آخر خانة
+    for column in range(16):
+        char = codes[:, column].astype(np.int32)
+        digit = (char >= 48) & (char <= 57) & ~ended
+        dot = (char == 46) & ~ended
+        end = (char == 0) & ~ended
+        ok &= digit | dot | end | ended
+        # أصفار بادئة مثل 010 مرفوضة (كما في inet_pton) لأنها تُفهم أحياناً كنظام ثماني
+        ok &= ~(digit & (digits == 1) & (value == 0))
+        value = np.where(digit, value * 10 + (char - 48), value)
+        digits += digit
+        closed = dot | end
+        ok &= ~(closed & ((digits == 0) | (value > 255)))
+        ok &= ~(dot & (octet >= 3))
+        address = np.where(closed, (address << 8) | value, address)
+        octet += dot
+        value[closed] = 0
+        digits[closed] = 0
+        ended |= end
+    ok &= ended & (octet == 3)
+    return ok, address.astype(np.uint64)
+
+
+class IpArray:
+    """عناوين IP نصية محولة في تمريرة واحدة إلى مصفوفات أعداد: الإصدار (0 لغير الصالح) ونصفا العنوان"""
+
+    def __init__(self, version, high, low, texts=None):
+        self.version = version
+        self.high = high
+        self.low = low
+        self.texts = texts
+
+    @classmethod
+    def parse(cls, addresses):
+        """تحليل قائمة نصوص؛ IPv4 متجه بالكامل، و IPv6 عبر inet_pton للصفوف التي فيها ':' فقط"""
+        texts = np.char.strip(np.asarray(addresses, dtype=str))
+        if texts.ndim != 1:
+            texts = texts.reshape(-1)
+        rows = len(texts)
+        lengths = np.char.str_len(texts) if rows else np.zeros(0, np.int64)
+        codes = texts.astype(f"U{MAX_LENGTH}").view(np.uint32).reshape(rows, MAX_LENGTH)
+        lengths = np.where(lengths > MAX_LENGTH, 0, lengths)
+
+        version = np.zeros(rows, np.uint8)
+        high = np.zeros(rows, np.uint64)
+        low = np.zeros(rows, np.uint64)
+
+        ipv4, address = _parse_ipv4(codes, lengths)
+        version[ipv4] = 4
+        low[ipv4] = address[ipv4]
+
+        colon = (codes == 58).any(axis=1) & (lengths > 0)
+        for index in np.flatnonzero(colon).tolist():
+            try:
+                packed = socket.inet_pton(socket.AF_INET6, str(texts[index]).strip("[]"))
+            except (OSError, ValueError):
+                continue
+            number = int.from_bytes(packed, "big")
+            if number >> 32 == 0xFFFF:
+                # IPv4-mapped (::ffff:a.b.c.d) يُعامل كعنوان IPv4
+                version[index], low[index] = 4, number & 0xFFFFFFFF
+            else:
+                version[index], high[index], low[index] = 6, number >> 64, number & (2 ** 64 - 1)
+        return cls(version, high, low, texts)
+
+    def __len__(self):
+        return len(self.version)
+
+    @property
+    def valid(self):
+        return self.version != 0
+
+    def malformed(self):
+        """نصوص تبدو كعناوين (أرقام ونقاط فقط أو فيها ':') لكنها غير صالحة؛ لا معنى لإرسالها إلى DNS"""
+        codes = self.texts.astype(f"U{MAX_LENGTH}").view(np.uint32).reshape(len(self), MAX_LENGTH)
+        numeric = np.isin(codes, _DIGITS) | (codes == 46) | (codes == 0)
+        looks_like_ip = numeric.all(axis=1) | (codes == 58).any(axis=1)
+        return ~self.valid & looks_like_ip & (np.char.str_len(self.texts) > 0)
+
+    def classify(self):
+        """تصنيف كل عنوان (PUBLIC أو PRIVATE أو LOOPBACK ...) كمصفوفة أعداد"""
+        category = np.where(self.valid, PUBLIC, INVALID).astype(np.uint8)
+        for (version, high, low, mask_high, mask_low), range_category in _RANGES:
+            match = ((category == PUBLIC) & (self.version == version)
+                     & ((self.high & np.uint64(mask_high)) == np.uint64(high))
+                     & ((self.low & np.uint64(mask_low)) == np.uint64(low)))
+            category[match] = range_category
+        # خارج 2000::/3 لا توجد عناوين IPv6 عامة مخصصة
+        unicast = (self.high >> np.uint64(61)) == np.uint64(1)
+        category[(category == PUBLIC) & (self.version == 6) & ~unicast] = RESERVED
+        return category
+
+    def routable(self):
+        """قناع العناوين العامة فقط"""
+        return self.classify() == PUBLIC
+
+    def unique(self, mask=None):
+        """(فهارس أول ظهور لكل عنوان مختلف، وفهرس التمثيل لكل صف) للصفوف المحددة بالقناع"""
+        selected = np.flatnonzero(self.valid if mask is None else mask & self.valid)
+        # lexsort مستقر: أول صف في كل مجموعة متطابقة هو أول ظهور (np.unique على المفاتيح المركبة أبطأ بكثير)
+        order = selected[np.lexsort((self.low[selected], self.high[selected], self.version[selected]))]
+        starts = np.ones(len(order), bool)
+        starts[1:] = ((self.low[order[1:]] != self.low[order[:-1]]) | (self.high[order[1:]] != self.high[order[:-1]])
+                      | (self.version[order[1:]] != self.version[order[:-1]]))
+        groups = np.cumsum(starts) - 1
+        inverse = np.empty(len(order), np.int64)
+        inverse[np.searchsorted(selected, order)] = groups
+        return order[starts], inverse
+
+    def format(self, index):
+        """العنوان بصيغته القياسية"""
+        if self.version[index] == 4:
+            return socket.inet_ntop(socket.AF_INET, int(self.low[index]).to_bytes(4, "big"))
+        if self.version[index] == 6:
+            number = (int(self.high[index]) << 64) | int(self.low[index])
+            return socket.inet_ntop(socket.AF_INET6, number.to_bytes(16, "big"))
+        return None
+
+
+def ip_category(ip):
+    """تصنيف عنوان واحد باسم (public أو private أو ...)"""
+    array = IpArray.parse([ip])
+    return CATEGORIES[array.classify()[0]]
+
+
+def main(argv=None):
+    import argparse
+    from collections import Counter
+
+    parser = argparse.ArgumentParser(description="تصنيف عناوين IP في ملف (سطر لكل عنوان) وإزالة المكرر")
+    parser.add_argument("input", nargs="?", default="-", help="ملف العناوين أو - للإدخال القياسي")
+    parser.add_argument("--public", action="store_true", help="طباعة العناوين العامة الفريدة فقط")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    with source:
+        lines = [line.split()[0] for line in source if line.strip()]
+    array = IpArray.parse(lines)
+    category = array.classify()
+    if args.public:
+        first, _ = array.unique(category == PUBLIC)
+        for index in first.tolist():
+            print(array.format(index))
+        return 0
+    counts = Counter(CATEGORIES[value] for value in category.tolist())
+    first, _ = array.unique(category == PUBLIC)
+    for name in CATEGORIES:
+        print(f"{name}: {counts.get(name, 0)}")
+    print(f"unique public: {len(first)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
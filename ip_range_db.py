@@ -0,0 +1,303 @@
+import argparse
+import bisect
+import csv
+import ipaddress
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+
+from geo_result import IpLocation
+
+MAGIC = b"IPRDB1\0\0"
+HEADER = struct.Struct("<8sIIII")
+RECORD = struct.Struct("<IIIIff")
+STRING_LEN = struct.Struct("<H")
+U64_MASK = (1 << 64) - 1
+
+# أسماء الأعمدة المقبولة في ملفات CSV ذات الترويسة (DB-IP / GeoLite)
+COLUMN_ALIASES = {
+    "start": ("ip_start", "start_ip", "range_start", "first_ip"),
+    "end": ("ip_end", "end_ip", "range_end", "last_ip"),
+    "network": ("network", "cidr", "prefix"),
+    "country": ("country", "country_code", "country_iso_code", "country_name"),
+    "region": ("region", "stateprov", "subdivision_1_name", "region_name"),
+    "city": ("city", "city_name"),
+    "latitude": ("latitude", "lat"),
+    "longitude": ("longitude", "lon", "lng"),
+    "time_zone": ("time_zone", "timezone", "tz"),
+}
+
+# ترتيب أعمدة ملف DB-IP City Lite الذي يأتي بدون ترويسة
+DBIP_LITE_COLUMNS = ("start", "end", "continent", "country", "region", "city", "latitude", "longitude", "time_zone")
+
+
+def _aligned(offset):
+    return (offset + 7) & ~7
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+class IpRangeDatabase:
+    """قاعدة بيانات محلية لنطاقات IP مرتبة وقابلة للبحث الثنائي عبر ملف مُعيَّن في الذاكرة"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+
+        magic, v4_count, v6_count, record_count, strings_size = HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"Not an IP range database: {path}")
+
+        self.v4_count = v4_count
+        self.v6_count = v6_count
+        self.record_count = record_count
+
+        offset = _aligned(HEADER.size)
+        self._v4_starts, offset = self._section("I", offset, v4_count)
+        self._v4_ends, offset = self._section("I", offset, v4_count)
+        self._v4_records, offset = self._section("I", offset, v4_count)
+        self._v6_starts_hi, offset = self._section("Q", offset, v6_count)
+        self._v6_starts_lo, offset = self._section("Q", offset, v6_count)
+        self._v6_ends_hi, offset = self._section("Q", offset, v6_count)
+        self._v6_ends_lo, offset = self._section("Q", offset, v6_count)
+        self._v6_records, offset = self._section("I", offset, v6_count)
+        self._records_offset = offset
+        self._strings_offset = _aligned(offset + record_count * RECORD.size)
+        self._strings_size = strings_size
+        self._string_cache = {}
+
+    def _section(self, typecode, offset, count):
+        """قراءة مصفوفة أعداد من الملف (مباشرة من الذاكرة المُعيَّنة إن أمكن)"""
+        size = array(typecode).itemsize * count
+        raw = self._buffer[offset:offset + size]
+        if sys.byteorder == "little":
+            values = raw.cast(typecode)
+        else:
+            values = array(typecode, raw.tobytes())
+            values.byteswap()
+        return values, _aligned(offset + size)
+
+    def close(self):
+        """إغلاق الملف وتحرير الذاكرة المُعيَّنة"""
+        for name in ("_v4_starts", "_v4_ends", "_v4_records", "_v6_starts_hi", "_v6_starts_lo",
+                     "_v6_ends_hi", "_v6_ends_lo", "_v6_records"):
+            values = self.__dict__.pop(name, None)
+            if isinstance(values, memoryview):
+                values.release()
+        if self._buffer is not None:
+            self._buffer.release()
+            self._buffer = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.v4_count + self.v6_count
+
+    def _string(self, offset):
+        value = self._string_cache.get(offset)
+        if value is None:
+            start = self._strings_offset + offset
+            (length,) = STRING_LEN.unpack_from(self._buffer, start)
+            value = bytes(self._buffer[start + STRING_LEN.size:start + STRING_LEN.size + length]).decode("utf-8")
+            self._string_cache[offset] = value
+        return value
+
+    def _find_v4(self, value):
+        index = bisect.bisect_right(self._v4_starts, value) - 1
+        if index >= 0 and value <= self._v4_ends[index]:
+            return self._v4_records[index]
+        return None
+
+    def _find_v6(self, value):
+        hi, lo = value >> 64, value & U64_MASK
+        starts_hi, starts_lo = self._v6_starts_hi, self._v6_starts_lo
+        left, right = 0, self.v6_count
+        while left < right:
+            middle = (left + right) // 2
+            if (starts_hi[middle], starts_lo[middle]) <= (hi, lo):
+                left = middle + 1
+            else:
+                right = middle
+        index = left - 1
+        if index >= 0 and (hi, lo) <= (self._v6_ends_hi[index], self._v6_ends_lo[index]):
+            return self._v6_records[index]
+        return None
+
+    def lookup(self, ip):
+        """البحث عن عنوان IP وإرجاع النتيجة أو None إن لم يكن ضمن أي نطاق"""
+        address = ipaddress.ip_address(ip)
+        if address.version == 4:
+            record = self._find_v4(int(address))
+        else:
+            record = self._find_v6(int(address))
+        if record is None:
+            return None
+
+        country, region, city, time_zone, latitude, longitude = RECORD.unpack_from(
+            self._buffer, self._records_offset + record * RECORD.size)
+        return IpLocation(
+            str(address),
+            country=self._string(country) or None,
+            region=self._string(region) or None,
+            city=self._string(city) or None,
+            latitude=None if latitude != latitude else round(latitude, 4),
+            longitude=None if longitude != longitude else round(longitude, 4),
+            time_zone=self._string(time_zone) or None,
+            provider="local",
+        )
+
+    def get(self, ip):
+        """مثل DbIpCity.get: إرجاع النتيجة أو رفع استثناء إن لم يُعثر على العنوان"""
+        result = self.lookup(ip)
+        if result is None:
+            raise LookupError(f"IP address {ip} is not covered by {self.path}")
+        return result
+
+    @staticmethod
+    def _read_rows(csv_path):
+        """قراءة صفوف ملف CSV وتحويلها إلى قواميس بأسماء أعمدة موحدة"""
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            first = next(reader, None)
+            if first is None:
+                return
+            lowered = [column.strip().lower() for column in first]
+            columns = {}
+            for name, aliases in COLUMN_ALIASES.items():
+                for alias in aliases:
+                    if alias in lowered:
+                        columns[name] = lowered.index(alias)
+                        break
+
+            if "network" not in columns and "start" not in columns:
+                # ملف DB-IP بدون ترويسة: الصف الأول بيانات
+                columns = {name: index for index, name in enumerate(DBIP_LITE_COLUMNS)}
+                yield {name: first[index] for name, index in columns.items() if index < len(first)}
+
+            for row in reader:
+                if not row:
+                    continue
+                yield {name: row[index] for name, index in columns.items() if index < len(row)}
+
+    @classmethod
+    def build(cls, csv_path, db_path):
+        """استيراد ملف CSV لنطاقات IP وكتابته كملف ثنائي مضغوط ومرتب"""
+        strings = {"": 0}
+        string_blob = bytearray(STRING_LEN.pack(0))
+        records = {}
+        record_blob = bytearray()
+        v4_ranges = []
+        v6_ranges = []
+
+        def intern(text):
+            text = (text or "").strip()
+            offset = strings.get(text)
+            if offset is None:
+                encoded = text.encode("utf-8")[:0xFFFF]
+                offset = len(string_blob)
+                string_blob.extend(STRING_LEN.pack(len(encoded)))
+                string_blob.extend(encoded)
+                strings[text] = offset
+            return offset
+
+        for row in cls._read_rows(csv_path):
+            try:
+                if row.get("network"):
+                    network = ipaddress.ip_network(row["network"].strip(), strict=False)
+                    start, end = network.network_address, network.broadcast_address
+                else:
+                    start = ipaddress.ip_address(row["start"].strip())
+                    end = ipaddress.ip_address(row["end"].strip())
+            except (KeyError, ValueError):
+                continue
+            if start.version != end.version:
+                continue
+
+            key = (
+                intern(row.get("country")),
+                intern(row.get("region")),
+                intern(row.get("city")),
+                intern(row.get("time_zone")),
+                _to_float(row.get("latitude")),
+                _to_float(row.get("longitude")),
+            )
+            record = records.get(key)
+            if record is None:
+                record = len(records)
+                records[key] = record
+                record_blob.extend(RECORD.pack(*key))
+
+            target = v4_ranges if start.version == 4 else v6_ranges
+            target.append((int(start), int(end), record))
+
+        v4_ranges.sort()
+        v6_ranges.sort()
+
+        sections = [
+            array("I", (r[0] for r in v4_ranges)),
+            array("I", (r[1] for r in v4_ranges)),
+            array("I", (r[2] for r in v4_ranges)),
+            array("Q", (r[0] >> 64 for r in v6_ranges)),
+            array("Q", (r[0] & U64_MASK for r in v6_ranges)),
+            array("Q", (r[1] >> 64 for r in v6_ranges)),
+            array("Q", (r[1] & U64_MASK for r in v6_ranges)),
+            array("I", (r[2] for r in v6_ranges)),
+        ]
+
+        tmp_path = db_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            def pad():
+                f.write(b"\0" * (_aligned(f.tell()) - f.tell()))
+
+            f.write(HEADER.pack(MAGIC, len(v4_ranges), len(v6_ranges), len(records), len(string_blob)))
+            pad()
+            for values in sections:
+                if sys.byteorder != "little":
+                    values.byteswap()
+                values.tofile(f)
+                pad()
+            f.write(record_blob)
+            pad()
+            f.write(string_blob)
+        os.replace(tmp_path, db_path)
+
+        return cls(db_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="استيراد ملف نطاقات IP (DB-IP/GeoLite CSV) إلى قاعدة بيانات محلية")
+    parser.add_argument("csv_file", help="ملف CSV للنطاقات")
+    parser.add_argument("db_file", help="مسار الملف الثنائي الناتج")
+    parser.add_argument("--test-ip", action="append", default=[], help="عنوان IP للتجربة بعد الاستيراد")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with IpRangeDatabase.build(args.csv_file, args.db_file) as db:
+        elapsed = time.perf_counter() - started
+        print(f"Imported {db.v4_count} IPv4 and {db.v6_count} IPv6 ranges "
+              f"({db.record_count} distinct locations) in {elapsed:.2f}s")
+        for ip in args.test_ip:
+            print(f"{ip}: {db.lookup(ip)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""متابعة سجلات وصول nginx/Apache مباشرة وتجميع الزيارات حسب الدولة والمدينة في نافذة زمنية
+
+python log_stream.py /var/log/nginx/access.log --window 300 --snapshot live_geo.json
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import metrics
+from ip_array import PUBLIC, IpArray
+
+UNKNOWN = "unknown"
+
+
+class LogFollower:
+    """متابعة ملف ينمو (مثل tail -F): يكمل من آخر موضع ويعيد الفتح عند التدوير أو القص"""
+
+    def __init__(self, path, from_start=False, chunk_size=1024 * 1024, max_line=64 * 1024):
+        self.path = path
+        self.from_start = from_start
+        self.chunk_size = chunk_size
+        self.max_line = max_line
+        self.rotations = 0
+        self.truncated_lines = 0
+        self._file = None
+        self._identity = None
+        self._buffer = b""
+        self._opened = False
+
+    def _open(self):
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return False
+        # أول فتح يبدأ من النهاية (الجديد فقط)، أما الملف الجديد بعد التدوير فيُقرأ من أوله
+        if not self._opened and not self.from_start:
+            f.seek(0, os.SEEK_END)
+        stat = os.fstat(f.fileno())
+        self._file, self._identity, self._opened = f, (stat.st_dev, stat.st_ino), True
+        self._buffer = b""
+        return True
+
+    def _read(self):
+        """قطعة واحدة محدودة الحجم مقسمة إلى أسطر كاملة؛ (الأسطر، هل وصلنا إلى نهاية الملف)"""
+        data = self._file.read(self.chunk_size)
+        if not data:
+            return [], True
+        lines = (self._buffer + data).split(b"\n")
+        self._buffer = lines.pop()
+        if len(self._buffer) > self.max_line:
+            # سطر بلا نهاية (ملف تالف): لا نسمح له بتضخيم الذاكرة
+            self._buffer = b""
+            self.truncated_lines += 1
+        return lines, len(data) < self.chunk_size
+
+    def read_lines(self):
+        """الأسطر الكاملة الجديدة منذ آخر استدعاء (قائمة bytes، بحد أقصى قطعة واحدة تقريباً)"""
+        if self._file is None and not self._open():
+            return []
+        lines, at_end = self._read()
+        if not at_end:
+            return lines
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            # بين نقل الملف القديم وإنشاء الجديد
+            return lines
+        if (stat.st_dev, stat.st_ino) != self._identity:
+            # التدوير: ما تبقى في الملف القديم قُرئ أعلاه، ونكمل من بداية الملف الجديد
+            self._file.close()
+            self.rotations += 1
+            if self._open():
+                lines += self._read()[0]
+        elif stat.st_size < self._file.tell():
+            # قص الملف في مكانه (copytruncate)
+            self._file.seek(0)
+            self._buffer = b""
+            self.rotations += 1
+            lines += self._read()[0]
+        return lines
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def client_addresses(lines):
+    """عنوان العميل من كل سطر: الحقل الأول في صيغتي common و combined لـ nginx و Apache"""
+    return [line.split(b" ", 1)[0].decode("latin-1") for line in lines]
+
+
+class WindowedCounts:
+    """عدادات لآخر window ثانية في حلقة من الدلاء الزمنية؛ الذاكرة محدودة بعدد الدلاء والمفاتيح"""
+
+    def __init__(self, window=300, bucket=10, max_keys=10000):
+        self.window = window
+        self.bucket = bucket
+        self.max_keys = max_keys
+        self.buckets = deque()
+
+    def _expire(self, now):
+        while self.buckets and self.buckets[0][0] <= now - self.window:
+            self.buckets.popleft()
+
+    def add(self, key, count=1, now=None):
+        now = time.time() if now is None else now
+        start = now - now % self.bucket
+        if not self.buckets or self.buckets[-1][0] != start:
+            self._expire(now)
+            self.buckets.append((start, Counter()))
+        counter = self.buckets[-1][1]
+        # مفاتيح كثيرة جداً في دلو واحد (مدن نادرة مثلاً) تُجمع تحت "other"
+        if key not in counter and len(counter) >= self.max_keys:
+            key = "other"
+        counter[key] += count
+
+    def totals(self, now=None):
+        self._expire(time.time() if now is None else now)
+        total = Counter()
+        for _, counter in self.buckets:
+            total.update(counter)
+        return total
+
+
+class LogAggregator:
+    """إثراء عناوين السجل بالموقع عبر get_ip_info مرة واحدة لكل عنوان جديد وتجميعها حسب الدولة والمدينة"""
+
+    def __init__(self, service, window=300, bucket=10, max_seen=100000, max_pending=1000, workers=8,
+                 skip_bogons=True, retry_after=60.0):
+        self.service = service
+        self.skip_bogons = skip_bogons
+        self.max_seen = max_seen
+        self.retry_after = retry_after
+        self.max_pending = max_pending
+        self.countries = WindowedCounts(window, bucket)
+        self.cities = WindowedCounts(window, bucket)
+        # ذاكرة العناوين المعروفة (LRU محدودة): العنوان -> (الدولة، المدينة)
+        self._seen = OrderedDict()
+        # العناوين التي فشل تحديدها -> وقت إعادة المحاولة (لا تُحفظ في _seen: الفشل قد يكون عابراً)
+        self._failed = OrderedDict()
+        # العنوان -> (المستقبل، عدد الأسطر التي تنتظر نتيجته)
+        self._pending = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="log-enrich")
+        self._lock = threading.Lock()
+        self.lines = 0
+        self.skipped = 0
+        self.lookups = 0
+        self.errors = 0
+        self.last_error = None
+
+    def _count(self, place, count, now):
+        country, city = place
+        self.countries.add(country or UNKNOWN, count, now)
+        self.cities.add(f"{city or UNKNOWN}, {country or UNKNOWN}", count, now)
+
+    def feed(self, lines, now=None):
+        """عدّ دفعة أسطر؛ العناوين غير المعروفة تُرسل للإثراء في الخلفية"""
+        now = time.time() if now is None else now
+        self.lines += len(lines)
+        if not lines:
+            return
+        with self._lock:
+            array = IpArray.parse(client_addresses(lines))
+            usable = array.classify() == PUBLIC if self.skip_bogons else array.valid
+            self.skipped += len(lines) - int(usable.sum())
+            first, inverse = array.unique(usable)
+            counts = np.bincount(inverse, minlength=len(first)) if len(first) else []
+            for ip, count in zip(array.texts[first].tolist(), np.asarray(counts).tolist()):
+                place = self._seen.get(ip)
+                metrics.cache_result("log_seen", place is not None)
+                if place is not None:
+                    self._seen.move_to_end(ip)
+                    self._count(place, count, now)
+                elif ip in self._pending:
+                    future, waiting = self._pending[ip]
+                    self._pending[ip] = (future, waiting + count)
+                elif self._failed.get(ip, now) > now:
+                    # فشل قريب: "غير معروف" حتى تنتهي المهلة بدلاً من إغراق مزود متعطل بالطلبات
+                    self._count((None, None), count, now)
+                else:
+                    self._failed.pop(ip, None)
+                    self._enrich(ip, count)
+        self.collect(now)
+
+    def _enrich(self, ip, count):
+        while len(self._pending) >= self.max_pending:
+            # ضغط عكسي: ننتظر أقدم إثراء بدلاً من تكديس الطلبات بلا حد
+            oldest = next(iter(self._pending.values()))[0]
+            oldest.exception()
+            self._collect_done(time.time())
+        self.lookups += 1
+        self._pending[ip] = (self._executor.submit(self._locate, ip), count)
+
+    def _locate(self, ip):
+        location = self.service.get_ip_info(ip)
+        return location.country, location.city
+
+    def collect(self, now=None):
+        """إضافة نتائج الإثراء المكتملة إلى العدادات"""
+        with self._lock:
+            self._collect_done(time.time() if now is None else now)
+
+    def _collect_done(self, now):
+        for ip in [ip for ip, (future, _) in self._pending.items() if future.done()]:
+            future, count = self._pending.pop(ip)
+            try:
+                place = future.result()
+            except Exception as e:
+                # العنوان الذي فشل تحديده يُعد "غير معروف" ويُعاد طلبه بعد retry_after ثانية
+                self.errors += 1
+                self.last_error = f"{ip}: {e}"
+                self._failed[ip] = now + self.retry_after
+                while len(self._failed) > self.max_seen:
+                    self._failed.popitem(last=False)
+                self._count((None, None), count, now)
+                continue
+            self._seen[ip] = place
+            while len(self._seen) > self.max_seen:
+                self._seen.popitem(last=False)
+            self._count(place, count, now)
+
+    def snapshot(self, top=20, now=None):
+        """لقطة قابلة للتحويل إلى JSON: أكثر الدول والمدن في النافذة مع إحصاءات التشغيل"""
+        now = time.time() if now is None else now
+        with self._lock:
+            countries = self.countries.totals(now)
+            cities = self.cities.totals(now)
+            return {
+                "time": now,
+                "window": self.countries.window,
+                "lines": self.lines,
+                "skipped": self.skipped,
+                "lookups": self.lookups,
+                "errors": self.errors,
+                "last_error": self.last_error,
+                "pending": len(self._pending),
+                "known_addresses": len(self._seen),
+                "requests": sum(countries.values()),
+                "countries": countries.most_common(top),
+                "cities": cities.most_common(top),
+            }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+def write_snapshot(snapshot, path):
+    """كتابة اللقطة بشكل ذري حتى لا تقرأ أداة أخرى ملفاً نصف مكتوب"""
+    partial = f"{path}.tmp"
+    with open(partial, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+    os.replace(partial, path)
+
+
+def run(followers, aggregator, snapshot_every=10.0, poll_interval=0.5, on_snapshot=None, stop=None, top=20):
+    """حلقة المتابعة: قراءة الأسطر الجديدة وتجميعها ونشر لقطة كل snapshot_every ثانية"""
+    stop = stop or threading.Event()
+    next_snapshot = time.monotonic() + snapshot_every
+    while not stop.is_set():
+        idle = True
+        for follower in followers:
+            lines = follower.read_lines()
+            if lines:
+                idle = False
+                aggregator.feed(lines)
+        aggregator.collect()
+        if time.monotonic() >= next_snapshot:
+            next_snapshot = time.monotonic() + snapshot_every
+            if on_snapshot is not None:
+                on_snapshot(aggregator.snapshot(top))
+        if idle:
+            stop.wait(poll_interval)
+
+
+def main(argv=None):
+    from geo_providers import build_provider
+    from geo_service import GeoService
+    from lookup_cache import GeoLookupCache
+    from request_scheduler import BULK, RequestScheduler
+
+    parser = argparse.ArgumentParser(description="متابعة سجلات وصول nginx/Apache وتجميع الزيارات حسب الموقع")
+    parser.add_argument("logs", nargs="+", help="ملفات السجل المتابعة")
+    parser.add_argument("--from-start", action="store_true", help="قراءة الملفات من أولها بدلاً من الجديد فقط")
+    parser.add_argument("--window", type=float, default=300, help="طول نافذة العدادات بالثواني")
+    parser.add_argument("--interval", type=float, default=10, help="الفاصل بين اللقطات بالثواني")
+    parser.add_argument("--snapshot", help="ملف JSON يُستبدل بآخر لقطة")
+    parser.add_argument("--top", type=int, default=10, help="عدد الدول والمدن في كل لقطة")
+    parser.add_argument("--ip-database", help="قاعدة بيانات نطاقات IP محلية بدلاً من المزود البعيد")
+    parser.add_argument("--providers", default="dbip", help="مزود أو أكثر مفصولين بفاصلة (مثل dbip,ipapi)")
+    parser.add_argument("--cache", default="geolocator_cache.sqlite", help="ملف الذاكرة المؤقتة الدائمة (فارغ لتعطيلها)")
+    parser.add_argument("--workers", type=int, default=8, help="عدد عمليات الإثراء المتزامنة")
+    parser.add_argument("--max-seen", type=int, default=100000, help="أقصى عدد للعناوين المعروفة في الذاكرة")
+    parser.add_argument("--retry-after", type=float, default=60, help="مهلة إعادة تحديد عنوان فشل تحديده بالثواني")
+    parser.add_argument("--quota", default="geolocator_quota.sqlite", help="ملف الحصص اليومية للخدمات الخارجية")
+    args = parser.parse_args(argv)
+
+    cache = GeoLookupCache(args.cache) if args.cache else None
+    service = GeoService(args.ip_database, user_agent="geo_locator_logs", cache=cache,
+                         provider=build_provider(args.providers, pool_size=max(1, args.workers)),
+                         scheduler=RequestScheduler(quota_path=args.quota, default_priority=BULK))
+    aggregator = LogAggregator(service, window=args.window, bucket=max(1.0, args.window / 30),
+                               max_seen=args.max_seen, workers=max(1, args.workers), retry_after=args.retry_after)
+    followers = [LogFollower(path, from_start=args.from_start) for path in args.logs]
+
+    def publish(snapshot):
+        if args.snapshot:
+            write_snapshot(snapshot, args.snapshot)
+        countries = ", ".join(f"{name} {count}" for name, count in snapshot["countries"][:5])
+        print(f"{time.strftime('%H:%M:%S')} {snapshot['requests']} requests in window "
+              f"({snapshot['lookups']} lookups, {snapshot['pending']} pending): {countries}", file=sys.stderr)
+
+    try:
+        run(followers, aggregator, snapshot_every=args.interval, on_snapshot=publish, top=args.top)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for follower in followers:
+            follower.close()
+        aggregator.close()
+        service.scheduler.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import ipaddress
+import json
+import sqlite3
+import threading
+import time
+
+from geo_result import IpLocation
+
+
+class SqliteCache:
+    """ذاكرة مؤقتة دائمة (مفتاح/قيمة JSON) على SQLite مع إزالة حسب العمر والأقل استخداماً"""
+
+    def __init__(self, path, table="cache", max_entries=100000, ttl=7 * 24 * 3600, prune_every=500):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)")
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table}(accessed)")
+
+    def get(self, key):
+        """إرجاع القيمة المخزنة أو None إن لم توجد أو انتهت صلاحيتها"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, created FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                if row is not None:
+                    self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        """تخزين قيمة قابلة للتحويل إلى JSON"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now))
+            self._writes += 1
+            if self._writes % self.prune_every == 0:
+                self._prune(now)
+
+    def _prune(self, now):
+        if self.ttl:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE created < ?", (now - self.ttl,))
+        (count,) = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY accessed LIMIT ?)", (count - self.max_entries,))
+
+    def prune(self):
+        """إزالة المدخلات المنتهية والزائدة عن الحد الأقصى فوراً"""
+        with self._lock:
+            self._prune(time.time())
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class GeoLookupCache:
+    """ذاكرة مؤقتة لنتائج تحديد الموقع، مع تجميع اختياري للمفاتيح حسب بادئة الشبكة"""
+
+    def __init__(self, path="geolocator_cache.sqlite", aggregate=True, ipv4_prefix=24, ipv6_prefix=48, **kwargs):
+        self.cache = SqliteCache(path, table="ip_locations", **kwargs)
+        self.aggregate = aggregate
+        self.ipv4_prefix = ipv4_prefix
+        self.ipv6_prefix = ipv6_prefix
+
+    def key(self, ip, provider):
+        """مفتاح التخزين: الشبكة (مثل 8.8.8.0/24) أو العنوان نفسه"""
+        address = ipaddress.ip_address(ip)
+        if self.aggregate:
+            prefix = self.ipv4_prefix if address.version == 4 else self.ipv6_prefix
+            return f"{provider}:{ipaddress.ip_network(f'{address}/{prefix}', strict=False)}"
+        return f"{provider}:{address}"
+
+    def get(self, ip, provider):
+        data = self.cache.get(self.key(ip, provider))
+        if data is None:
+            return None
+        location = IpLocation.from_dict(data)
+        # النتيجة قد تكون لعنوان مجاور في نفس الشبكة
+        location.ip_address = ip
+        return location
+
+    def set(self, ip, provider, location):
+        self.cache.set(self.key(ip, provider), location.to_dict())
+
+    def stats(self):
+        return self.cache.stats()
+
+    def clear(self):
+        self.cache.clear()
+
+    def close(self):
+        self.cache.close()
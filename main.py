@@ -1,17 +1,34 @@
-import requests
-import json
-import socket
+import argparse
+import os
 import webbrowser
-from ip2geotools.databases.noncommercial import DbIpCity
-from geopy.geocoders import Nominatim
-import folium
 import platform
 import tkinter as tk
 from tkinter import messagebox
 
+import metrics
+from geo_service import GeoService
+from request_scheduler import INTERACTIVE, RequestScheduler
+from reverse_geocoder import ReverseGeocoder
+
+def create_service(ip_database=None, gazetteer=None):
+    """خدمة تحديد الموقع بإعدادات التطبيق (مشتركة بين الواجهة ووضع الخادم)"""
+    service = GeoService(
+        ip_database,
+        user_agent="geo_locator_app",
+        cache="geolocator_cache.sqlite",
+        reverse_geocoder=ReverseGeocoder("geo_locator_app", cache="geolocator_cache.sqlite"),
+        scheduler=RequestScheduler(default_priority=INTERACTIVE)
+    )
+    if gazetteer:
+        from gazetteer import OfflineReverseGeocoder
+        service.reverse_geocoder = OfflineReverseGeocoder(gazetteer)
+    return service
+
 class GeoLocatorApp:
-    def __init__(self, master):
+    def __init__(self, master, ip_database=None, gazetteer=None, metrics_file=None):
         self.master = master
+        self.metrics_file = metrics_file
+        self.service = create_service(ip_database, gazetteer)
         master.title("أداة تحديد الموقع الجغرافي - للاستخدام القانوني فقط")
         
         # تحذير قانوني
@@ -49,8 +66,7 @@ class GeoLocatorApp:
     def get_public_ip(self):
         """الحصول على عنوان IP العام"""
         try:
-            response = requests.get('https://api.ipify.org?format=json')
-            return response.json()['ip']
+            return self.service.get_public_ip()
         except Exception as e:
             print(f"Error getting public IP: {e}")
             return None
@@ -58,12 +74,9 @@ class GeoLocatorApp:
     def get_ip_info(self, ip_or_domain):
         """الحصول على معلومات الموقع من عنوان IP أو النطاق"""
         try:
-            # إذا كان نطاق، نحوله إلى IP
-            if not ip_or_domain.replace('.', '').isdigit():
-                ip_or_domain = socket.gethostbyname(ip_or_domain)
-            
-            response = DbIpCity.get(ip_or_domain, api_key='free')
-            self.last_ip = ip_or_domain
+            # قاعدة البيانات المحلية إن وُجدت وإلا المزود البعيد
+            response = self.service.get_ip_info(ip_or_domain)
+            self.last_ip = response.ip_address
             self.last_location = response
             return response
         except Exception as e:
@@ -72,27 +85,28 @@ class GeoLocatorApp:
     
     def get_address_details(self, latitude, longitude):
         """الحصول على تفاصيل العنوان من الإحداثيات"""
-        geolocator = Nominatim(user_agent="geo_locator_app")
-        location = geolocator.reverse(f"{latitude}, {longitude}")
-        return location.address if location else "تفاصيل العنوان غير متوفرة"
+        return self.service.get_address_details(latitude, longitude)
     
     def create_map(self, latitude, longitude):
-        """إنشاء خريطة HTML باستخدام folium"""
+        """إنشاء خريطة HTML من القالب الأساسي المخزن"""
         try:
-            m = folium.Map(location=[latitude, longitude], zoom_start=12)
-            folium.Marker(
-                [latitude, longitude],
-                popup=f"الموقع المقدر: {latitude}, {longitude}",
-                icon=folium.Icon(color='red')
-            ).add_to(m)
+            from map_builder import MapBuilder
             
-            map_file = "location_map.html"
-            m.save(map_file)
-            return map_file
+            builder = MapBuilder(cache_dir="map_cache")
+            builder.add(latitude, longitude, f"الموقع المقدر: {latitude}, {longitude}")
+            return builder.save("location_map.html", zoom_start=12)
         except Exception as e:
             print(f"Error creating map: {e}")
             return None
     
+    def write_metrics(self):
+        """تحديث ملف المقاييس بصيغة Prometheus إن كان مفعلاً"""
+        if self.metrics_file:
+            try:
+                metrics.REGISTRY.write(self.metrics_file)
+            except Exception as e:
+                print(f"Error writing metrics: {e}")
+    
     def locate(self):
         """تحديد الموقع بناء على المدخلات"""
         target = self.entry.get().strip()
@@ -101,21 +115,24 @@ class GeoLocatorApp:
             return
         
         try:
-            result = self.get_ip_info(target)
+            with metrics.trace() as trace:
+                result = self.get_ip_info(target)
+                if result:
+                    address = self.get_address_details(result.latitude, result.longitude)
+            self.write_metrics()
             if not result:
                 messagebox.showerror("خطأ", "تعذر تحديد الموقع. تأكد من صحة المدخلات.")
                 return
             
-            address = self.get_address_details(result.latitude, result.longitude)
-            
             info = (
                 f"عنوان IP: {result.ip_address}\n"
                 f"الدولة: {result.country}\n"
                 f"المدينة: {result.city}\n"
                 f"الإحداثيات: {result.latitude}, {result.longitude}\n"
                 f"المنطقة الزمنية: {result.time_zone}\n"
-                f"مزود الخدمة: {result.isp if hasattr(result, 'isp') else 'غير معروف'}\n"
-                f"العنوان المقدر: {address}"
+                f"مزود الخدمة: {result.isp or 'غير معروف'}\n"
+                f"العنوان المقدر: {address}\n"
+                f"⏱ {trace.format()}"
             )
             
             self.result_label.config(text=info)
@@ -145,14 +162,29 @@ class GeoLocatorApp:
             return
         
         map_file = self.create_map(self.last_location.latitude, self.last_location.longitude)
+        self.write_metrics()
         if map_file:
             webbrowser.open(f"file://{os.path.abspath(map_file)}")
         else:
             messagebox.showerror("خطأ", "تعذر إنشاء الخريطة")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="أداة تحديد الموقع الجغرافي")
+    parser.add_argument("ip_database", nargs="?", help="قاعدة بيانات نطاقات IP محلية (انظر ip_range_db.py)")
+    parser.add_argument("--gazetteer", help="ملف أماكن GeoNames للبحث العكسي المحلي")
+    parser.add_argument("--metrics-file", help="كتابة مقاييس الأداء بصيغة Prometheus في هذا الملف")
+    parser.add_argument("--metrics-port", type=int, help="نقطة /metrics محلية على هذا المنفذ")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="تشغيل خدمة HTTP (JSON) على هذا المنفذ بدلاً من الواجهة")
+    args = parser.parse_args()
+    if args.metrics_port:
+        metrics.REGISTRY.serve(args.metrics_port)
+    if args.serve:
+        from geo_server import serve
+        raise SystemExit(serve(create_service(args.ip_database, args.gazetteer), port=args.serve))
+    
     root = tk.Tk()
-    app = GeoLocatorApp(root)
+    app = GeoLocatorApp(root, ip_database=args.ip_database, gazetteer=args.gazetteer,
+                        metrics_file=args.metrics_file)
     
     # إضافة تذييل
     footer = tk.Label(
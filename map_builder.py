@@ -0,0 +1,297 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+import metrics
+
+# مزودو البلاطات المدعومون: (الرابط، الإسناد)؛ None يعني بلاطات folium الافتراضية
+TILE_PROVIDERS = {
+    "openstreetmap": ("OpenStreetMap", None),
+    "google": ("https://mt1.google.com/vt/lyrs=m&x={x}&y={y}&z={z}", "Google"),
+    "mapbox": ("https://api.mapbox.com/styles/v1/mapbox/streets-v11/tiles/{z}/{x}/{y}?access_token=YOUR_MAPBOX_TOKEN",
+               "Mapbox"),
+}
+
+MODES = ("cluster", "heatmap")
+DATA_MARKER = "/*__GEO_MAP_DATA__*/null"
+MAX_MERCATOR_LATITUDE = 85.05112878
+
+# يُضاف إلى القالب مرة واحدة؛ يرسم مستوى التجميع المناسب للتكبير الحالي وداخل حدود العرض فقط
+CLIENT_SCRIPT = """
+<style>
+.geo-cluster {
+    background: rgba(220, 53, 69, 0.75); border: 2px solid #fff; border-radius: 50%;
+    color: #fff; font: bold 11px sans-serif; text-align: center; box-shadow: 0 0 4px rgba(0,0,0,0.4);
+}
+</style>
+<script>
+(function () {
+    var map = __MAP__;
+    var data = __DATA__;
+    if (!data) { return; }
+    var layer = L.layerGroup().addTo(map);
+    var heat = null;
+
+    function levelFor(zoom) {
+        var chosen = data.levels[0];
+        for (var i = 0; i < data.levels.length; i++) {
+            if (data.levels[i].zoom <= zoom) { chosen = data.levels[i]; }
+        }
+        return chosen;
+    }
+
+    function clusterIcon(count) {
+        var size = Math.round(22 + 8 * Math.log(count) / Math.LN10);
+        return L.divIcon({
+            html: "<div class='geo-cluster' style='width:" + size + "px;height:" + size + "px;line-height:" +
+                  (size - 4) + "px'>" + count + "</div>",
+            className: "", iconSize: [size, size]
+        });
+    }
+
+    function draw() {
+        var level = levelFor(map.getZoom());
+        if (data.mode === "heatmap") {
+            var max = 1;
+            for (var j = 0; j < level.cells.length; j++) { max = Math.max(max, level.cells[j][2]); }
+            if (heat) { map.removeLayer(heat); }
+            heat = L.heatLayer(level.cells, {radius: 25, blur: 15, max: max}).addTo(map);
+            return;
+        }
+        layer.clearLayers();
+        var bounds = map.getBounds().pad(0.25);
+        for (var i = 0; i < level.cells.length; i++) {
+            var cell = level.cells[i];
+            if (!bounds.contains([cell[0], cell[1]])) { continue; }
+            if (cell[2] > 1) {
+                var marker = L.marker([cell[0], cell[1]], {icon: clusterIcon(cell[2])});
+                marker.on("click", function (e) { map.setView(e.latlng, map.getZoom() + 2); });
+                layer.addLayer(marker);
+            } else {
+                var point = L.circleMarker([cell[0], cell[1]], {radius: 6, color: "#dc3545", fillOpacity: 0.8});
+                if (cell.length > 3 && cell[3] !== null) {
+                    // التسمية من ملفات المدخلات: تُعرض كنص لا كـ HTML
+                    var popup = document.createElement("div");
+                    popup.textContent = String(cell[3]);
+                    point.bindPopup(popup);
+                }
+                layer.addLayer(point);
+            }
+        }
+    }
+
+    if (data.view) {
+        map.setView([data.view[0], data.view[1]], data.view[2]);
+    } else if (data.bounds) {
+        map.fitBounds(data.bounds, {maxZoom: 12});
+    }
+    map.on("zoomend moveend", draw);
+    draw();
+})();
+</script>
+"""
+
+
+def mercator(latitudes, longitudes):
+    """إسقاط ميركاتور للويب على المربع [0, 1) (نفس شبكة بلاطات الخريطة)"""
+    latitudes = np.radians(np.clip(latitudes, -MAX_MERCATOR_LATITUDE, MAX_MERCATOR_LATITUDE))
+    x = (np.asarray(longitudes, dtype=np.float64) + 180.0) / 360.0
+    y = 0.5 - np.log(np.tan(np.pi / 4 + latitudes / 2)) / (2 * np.pi)
+    return np.clip(x, 0.0, 1.0 - 1e-12), np.clip(y, 0.0, 1.0 - 1e-12)
+
+
+def aggregate(x, y, latitudes, longitudes, zoom, cell_px=60):
+    """تجميع النقاط في خلايا بعرض cell_px بكسل عند مستوى التكبير المحدد؛ يرجع (عرض، طول، عدد) لكل خلية"""
+    cells_per_side = int(256 * 2 ** zoom // cell_px) + 1
+    keys = np.floor(y * cells_per_side).astype(np.int64) * cells_per_side + np.floor(x * cells_per_side).astype(np.int64)
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    # مركز ثقل كل خلية بدلاً من مركزها الهندسي حتى يقع التجمع فوق نقاطه
+    mean_latitudes = np.bincount(inverse, weights=latitudes) / counts
+    mean_longitudes = np.bincount(inverse, weights=longitudes) / counts
+    return mean_latitudes, mean_longitudes, counts
+
+
+class MapBuilder:
+    """خريطة HTML لعدد كبير من النقاط: تجميع مسبق لكل مستوى تكبير وقالب أساسي مخزن يعاد استخدامه"""
+
+    _templates = {}
+
+    def __init__(self, provider="openstreetmap", mode="cluster", cell_px=60, min_zoom=1, max_zoom=16,
+                 zoom_step=2, raw_ratio=0.5, precision=4, cache_dir=None):
+        if provider not in TILE_PROVIDERS:
+            raise ValueError(f"Unknown map provider: {provider} (available: {', '.join(sorted(TILE_PROVIDERS))})")
+        if mode not in MODES:
+            raise ValueError(f"Unknown map mode: {mode} (available: {', '.join(MODES)})")
+        self.provider = provider
+        self.mode = mode
+        self.cell_px = cell_px
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.zoom_step = zoom_step
+        self.raw_ratio = raw_ratio
+        self.precision = precision
+        self.cache_dir = cache_dir
+        self._latitudes = []
+        self._longitudes = []
+        self._labels = []
+
+    def __len__(self):
+        return len(self._latitudes)
+
+    def add(self, latitude, longitude, label=None):
+        """إضافة نقطة واحدة (النقاط بلا إحداثيات تُتجاهل)"""
+        if latitude is None or longitude is None:
+            return
+        self._latitudes.append(float(latitude))
+        self._longitudes.append(float(longitude))
+        self._labels.append(label)
+
+    def add_rows(self, rows, label_field="ip_address"):
+        """إضافة صفوف نتائج (قواميس بحقول latitude و longitude) كتلك التي يكتبها bulk_lookup"""
+        for row in rows:
+            latitude, longitude = row.get("latitude"), row.get("longitude")
+            if latitude in (None, "") or longitude in (None, ""):
+                continue
+            self.add(latitude, longitude, row.get(label_field) or row.get("target"))
+
+    def clear(self):
+        self._latitudes.clear()
+        self._longitudes.clear()
+        self._labels.clear()
+
+    def levels(self):
+        """مستويات التجميع: لكل مستوى تكبير قائمة خلايا [عرض، طول، عدد]، وآخرها النقاط المفردة مع تسمياتها"""
+        latitudes = np.asarray(self._latitudes, dtype=np.float64)
+        longitudes = np.asarray(self._longitudes, dtype=np.float64)
+        x, y = mercator(latitudes, longitudes)
+        levels = []
+        previous = None
+        # نقاط كثيرة تشترك في مركز المدينة نفسه فيبقى التجميع مفيداً حتى max_zoom: تُرسم مفردة بعده
+        raw_zoom = self.max_zoom + 1
+        for zoom in range(self.min_zoom, self.max_zoom + 1, self.zoom_step):
+            cell_latitudes, cell_longitudes, counts = aggregate(x, y, latitudes, longitudes, zoom, self.cell_px)
+            if len(counts) >= self.raw_ratio * len(latitudes):
+                # التجميع لم يعد يوفر شيئاً: من هنا تُرسم النقاط نفسها
+                raw_zoom = zoom
+                break
+            if len(counts) == previous:
+                continue
+            previous = len(counts)
+            levels.append({"zoom": zoom, "cells": self._cells(cell_latitudes, cell_longitudes, counts)})
+        if not levels:
+            raw_zoom = self.min_zoom
+        if self.mode == "heatmap":
+            cells = self._cells(latitudes, longitudes, np.ones(len(latitudes), dtype=np.int64))
+        else:
+            cells = [cell + [label] for cell, label in zip(
+                self._cells(latitudes, longitudes, np.ones(len(latitudes), dtype=np.int64)), self._labels)]
+        levels.append({"zoom": raw_zoom, "cells": cells})
+        return levels
+
+    def _cells(self, latitudes, longitudes, counts):
+        return [list(cell) for cell in zip(np.round(latitudes, self.precision).tolist(),
+                                           np.round(longitudes, self.precision).tolist(), counts.tolist())]
+
+    def data(self, zoom_start=None):
+        """بيانات الخريطة التي تُحقن في القالب"""
+        if not self._latitudes:
+            return None
+        data = {"mode": self.mode, "levels": self.levels()}
+        if zoom_start is not None:
+            data["view"] = [self._latitudes[0], self._longitudes[0], zoom_start]
+        else:
+            data["bounds"] = [[min(self._latitudes), min(self._longitudes)],
+                              [max(self._latitudes), max(self._longitudes)]]
+        return data
+
+    def template(self):
+        """قالب HTML الأساسي (بلاطات + Leaflet + سكربت العرض) يُبنى بـ folium مرة واحدة لكل مزود ونمط"""
+        key = (self.provider, self.mode == "heatmap")
+        template = self._templates.get(key)
+        if template is not None:
+            return template
+
+        path = None
+        if self.cache_dir:
+            digest = hashlib.sha1(repr(key).encode("utf-8") + CLIENT_SCRIPT.encode("utf-8")).hexdigest()[:12]
+            path = os.path.join(self.cache_dir, f"base_map_{self.provider}_{self.mode}_{digest}.html")
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    template = f.read()
+
+        if template is None:
+            template = self._build_template()
+            if path:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(template)
+        self._templates[key] = template
+        return template
+
+    def _build_template(self):
+        import folium
+
+        tiles, attr = TILE_PROVIDERS[self.provider]
+        m = folium.Map(location=[20, 0], zoom_start=2, tiles=tiles, attr=attr, prefer_canvas=True)
+        if self.mode == "heatmap":
+            from folium.plugins import HeatMap
+            for name, url in HeatMap.default_js:
+                m.get_root().header.add_child(folium.JavascriptLink(url), name=name)
+        html = m.get_root().render()
+        script = CLIENT_SCRIPT.replace("__MAP__", m.get_name()).replace("__DATA__", DATA_MARKER)
+        head, tail = html.rsplit("</html>", 1)
+        return head + script + "</html>" + tail
+
+    def render(self, zoom_start=None):
+        """HTML الخريطة كاملة؛ zoom_start يثبت العرض على أول نقطة بدلاً من احتواء كل النقاط"""
+        payload = json.dumps(self.data(zoom_start), ensure_ascii=False, separators=(",", ":"))
+        # منع إغلاق وسم السكربت من داخل التسميات
+        payload = payload.replace("</", "<\\/")
+        return self.template().replace(DATA_MARKER, payload, 1)
+
+    def save(self, path, zoom_start=None):
+        with metrics.span("map_render"):
+            html = self.render(zoom_start)
+        with metrics.span("map_write"):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(html)
+        return path
+
+
+def read_rows(path):
+    """قراءة صفوف نتائج bulk_lookup من ملف CSV أو JSON Lines"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith((".jsonl", ".json")):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="إنشاء خريطة مجمعة من نتائج البحث الجماعي")
+    parser.add_argument("results", help="ملف نتائج bulk_lookup (CSV أو JSONL)")
+    parser.add_argument("-o", "--output", default="locations_map.html", help="ملف HTML الناتج")
+    parser.add_argument("--mode", choices=MODES, default="cluster", help="تجميع بعلامات مرقمة أو خريطة حرارية")
+    parser.add_argument("--provider", choices=sorted(TILE_PROVIDERS), default="openstreetmap")
+    parser.add_argument("--cell-px", type=int, default=60, help="حجم خلية التجميع بالبكسل")
+    args = parser.parse_args(argv)
+
+    builder = MapBuilder(args.provider, mode=args.mode, cell_px=args.cell_px)
+    builder.add_rows(read_rows(args.results))
+    if not len(builder):
+        print("No rows with coordinates found", file=sys.stderr)
+        return 1
+    builder.save(args.output)
+    print(f"{len(builder)} points written to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,294 @@
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# حدود فئات المدرج التكراري بالثواني (من 1ms إلى 30s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_SECONDS = "geolocator_stage_seconds"
+STAGE_ERRORS = "geolocator_stage_errors_total"
+CACHE_HITS = "geolocator_cache_hits_total"
+CACHE_MISSES = "geolocator_cache_misses_total"
+SCHEDULER_WAIT = "geolocator_scheduler_wait_seconds"
+SCHEDULER_QUEUE = "geolocator_scheduler_queue_depth"
+SCHEDULER_RETRIES = "geolocator_scheduler_retries_total"
+SCHEDULER_THROTTLED = "geolocator_scheduler_throttled_total"
+QUOTA_USED = "geolocator_quota_used"
+
+HELP = {
+    STAGE_SECONDS: "Time spent in each lookup stage",
+    STAGE_ERRORS: "Stage executions that raised an error",
+    CACHE_HITS: "Cache lookups answered from the cache",
+    CACHE_MISSES: "Cache lookups that missed",
+    SCHEDULER_WAIT: "Time requests waited in the scheduler queue per endpoint and priority",
+    SCHEDULER_QUEUE: "Requests currently waiting for an endpoint",
+    SCHEDULER_RETRIES: "Requests retried after a transient failure",
+    SCHEDULER_THROTTLED: "Responses that asked the client to slow down (429 or rate limited)",
+    QUOTA_USED: "Requests counted against the daily quota today",
+}
+
+
+class Histogram:
+    """مدرج تكراري تراكمي بصيغة Prometheus (عدد لكل حد أعلى، المجموع، العدد)"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            index = len(self.buckets)
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """تقدير النسبة المئوية بالاستيفاء داخل الفئة (كما يفعل histogram_quantile)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            if cumulative + count >= rank and count:
+                if bound == float("inf"):
+                    return lower
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = bound
+        return lower
+
+
+class Trace:
+    """أزمنة مراحل عملية واحدة بالترتيب (لعرض تفصيل الزمن في الواجهة)"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = []
+        self.total = None
+
+    def add(self, stage, seconds):
+        self.stages.append((stage, seconds))
+
+    def breakdown(self):
+        """مجموع زمن كل مرحلة (المراحل المتكررة تُجمع) بترتيب أول ظهور"""
+        totals = {}
+        for stage, seconds in self.stages:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        return totals
+
+    def format(self):
+        parts = [f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in self.breakdown().items()]
+        total = self.total if self.total is not None else time.perf_counter() - self.started
+        parts.append(f"total {total * 1000:.0f}ms")
+        return " | ".join(parts)
+
+
+class _Span:
+    __slots__ = ("registry", "stage", "labels", "started")
+
+    def __init__(self, registry, stage, labels):
+        self.registry = registry
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.started
+        labels = (("stage", self.stage),) + self.labels
+        self.registry.observe(STAGE_SECONDS, seconds, labels)
+        if exc_type is not None:
+            self.registry.inc(STAGE_ERRORS, labels=labels)
+        trace = getattr(self.registry.local, "trace", None)
+        if trace is not None:
+            trace.add(self.stage, seconds)
+        return False
+
+
+class MetricsRegistry:
+    """عدادات ومدرجات تكرارية آمنة بين الخيوط مع إخراج بصيغة Prometheus النصية"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.local = threading.local()
+        self._lock = threading.Lock()
+        self._server = None
+
+    def inc(self, name, value=1, labels=()):
+        key = (name, tuple(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, labels=()):
+        """قيمة لحظية (مثل طول الطابور)"""
+        with self._lock:
+            self.gauges[(name, tuple(labels))] = value
+
+    def observe(self, name, seconds, labels=()):
+        key = (name, tuple(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def span(self, stage, **labels):
+        """قياس زمن كتلة كمرحلة: with metrics.span("dns"): ..."""
+        return _Span(self, stage, tuple(sorted(labels.items())))
+
+    def cache_result(self, cache, hit):
+        self.inc(CACHE_HITS if hit else CACHE_MISSES, labels=(("cache", cache),))
+
+    def trace(self):
+        """تجميع مراحل العملية الجارية في هذا الخيط: with metrics.trace() as trace: ..."""
+        return _TraceContext(self)
+
+    def stage_summary(self):
+        """ملخص لكل مرحلة (مجمّع عبر بقية التسميات): العدد، الأخطاء، المتوسط، p50، p95"""
+        merged, errors = {}, {}
+        with self._lock:
+            for (name, labels), histogram in self.histograms.items():
+                if name != STAGE_SECONDS:
+                    continue
+                stage = labels[0][1]
+                total = merged.setdefault(stage, Histogram(self.buckets))
+                total.counts = [a + b for a, b in zip(total.counts, histogram.counts)]
+                total.sum += histogram.sum
+                total.count += histogram.count
+                errors[stage] = errors.get(stage, 0) + self.counters.get((STAGE_ERRORS, labels), 0)
+        return {stage: {"count": histogram.count, "errors": errors[stage], "mean": histogram.sum / histogram.count,
+                        "p50": histogram.quantile(0.5), "p95": histogram.quantile(0.95)}
+                for stage, histogram in merged.items()}
+
+    def render(self):
+        """كل المقاييس بصيغة Prometheus النصية"""
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            histograms = sorted(self.histograms.items())
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} counter"]
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), value in gauges:
+            if name not in seen:
+                seen.add(name)
+                lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} gauge"]
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            if name not in seen:
+                seen.add(name)
+                lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} histogram"]
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """كتابة المقاييس في ملف (مثلاً لمجمّع textfile في node_exporter) بشكل ذري"""
+        import tempfile
+        # ملف مؤقت فريد لكل كاتب: عدة خيوط (أو عمليات) قد تكتب الملف نفسه في الوقت ذاته
+        handle, partial = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.",
+                                           dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(handle, "w", encoding="utf-8") as f:
+                f.write(self.render())
+            # mkstemp ينشئ الملف للمالك فقط؛ مجمّع المقاييس قد يعمل بمستخدم آخر
+            os.chmod(partial, 0o644)
+            os.replace(partial, path)
+        except BaseException:
+            os.unlink(partial)
+            raise
+
+    def serve(self, port=9464, host="127.0.0.1"):
+        """نقطة /metrics محلية في خيط خلفي؛ يرجع الخادم"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                payload = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        self._server = server
+        return server
+
+    @property
+    def address(self):
+        """(المضيف، المنفذ) لنقطة /metrics إن كانت تعمل، وإلا None"""
+        server = self._server
+        return None if server is None else server.server_address[:2]
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+
+class _TraceContext:
+    def __init__(self, registry):
+        self.registry = registry
+        self.trace = Trace()
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = getattr(self.registry.local, "trace", None)
+        self.registry.local.trace = self.trace
+        return self.trace
+
+    def __exit__(self, *exc):
+        self.trace.total = time.perf_counter() - self.trace.started
+        self.registry.local.trace = self.previous
+        return False
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+# السجل المشترك في العملية كلها
+REGISTRY = MetricsRegistry()
+span = REGISTRY.span
+trace = REGISTRY.trace
+cache_result = REGISTRY.cache_result
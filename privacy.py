@@ -0,0 +1,55 @@
+from geo_result import IpLocation
+
+
+class PrivacyPolicy:
+    """ما تكشفه النتيجة وما يُنفذ من مراحل سلسلة تحديد الموقع لمستوى خصوصية واحد
+
+    precision عدد المنازل العشرية للإحداثيات (None بلا تقريب)، و reverse_geocode يحدد طلب
+    Nominatim، و all_ips كشف كل عناوين النطاق، و zoom تكبير الخريطة المعروضة والمصدرة.
+    """
+
+    def __init__(self, name, fields, precision=None, reverse_geocode=True, all_ips=True, zoom=12):
+        self.name = name
+        self.fields = frozenset(fields)
+        self.precision = precision
+        self.reverse_geocode = reverse_geocode
+        self.all_ips = all_ips
+        self.zoom = zoom
+
+    def apply(self, location):
+        """نسخة من النتيجة بالحقول المسموحة فقط وإحداثيات مقربة"""
+        values = {field: getattr(location, field) if field in self.fields else None
+                  for field in IpLocation.FIELDS[1:]}
+        if self.precision is not None:
+            for field in ("latitude", "longitude"):
+                if values[field] is not None:
+                    values[field] = round(values[field], self.precision)
+        return IpLocation(location.ip_address, provider=location.provider, **values)
+
+    def describe(self, location):
+        """عنوان تقريبي من حقول النتيجة المكشوفة بدلاً من البحث العكسي"""
+        parts = [getattr(location, field) for field in ("city", "region", "country") if field in self.fields]
+        return ", ".join(part for part in parts if part) or "تفاصيل العنوان غير متوفرة"
+
+    def __repr__(self):
+        return f"PrivacyPolicy({self.name!r})"
+
+
+# منخفض: السلسلة كاملة؛ متوسط: حتى المدينة (~11 كم) بلا بحث عكسي؛ مرتفع: الدولة والمنطقة فقط (~111 كم)
+LEVELS = {
+    "low": PrivacyPolicy("low", IpLocation.FIELDS, zoom=12),
+    "medium": PrivacyPolicy("medium", ("country", "region", "city", "latitude", "longitude", "time_zone", "isp"),
+                            precision=1, reverse_geocode=False, zoom=10),
+    "high": PrivacyPolicy("high", ("country", "region", "latitude", "longitude", "time_zone"),
+                          precision=0, reverse_geocode=False, all_ips=False, zoom=5),
+}
+
+
+def get_policy(level):
+    """سياسة مستوى الخصوصية من اسمه (low/medium/high) أو سياسة جاهزة؛ None تعني السلسلة كاملة"""
+    if isinstance(level, PrivacyPolicy):
+        return level
+    try:
+        return LEVELS[level or "low"]
+    except KeyError:
+        raise ValueError(f"Unknown privacy level: {level!r} (expected one of {', '.join(LEVELS)})") from None
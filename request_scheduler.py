@@ -0,0 +1,362 @@
+import heapq
+import itertools
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+from rate_limit import TokenBucket
+
+# فئات الأولوية: الأصغر يُخدم أولاً (بحث المستخدم في الواجهة قبل المهام الجماعية)
+INTERACTIVE, NORMAL, BULK = range(3)
+PRIORITIES = ("interactive", "normal", "bulk")
+
+# حدود الخدمات الخارجية الافتراضية: معدل مستمر (طلب/ثانية)، دفعة قصوى، وحصة يومية (None بلا حد)
+ENDPOINTS = {
+    # DB-IP المجاني (DbIpCity بمفتاح free و dbipapi بمفتاح free) يشتركان في حصة يومية واحدة
+    "dbip": {"rate": 1.0, "burst": 5, "daily_limit": 1000},
+    # سياسة Nominatim: طلب واحد في الثانية كحد أقصى
+    "nominatim": {"rate": 1.0, "burst": 1, "daily_limit": None},
+    "ipify": {"rate": 5.0, "burst": 5, "daily_limit": None},
+    # ip-api.com: 45 طلباً في الدقيقة
+    "ipapi": {"rate": 0.75, "burst": 15, "daily_limit": None},
+    # ipwho.is: نحو 10000 طلب شهرياً
+    "ipwhois": {"rate": 1.0, "burst": 5, "daily_limit": 330},
+}
+
+# أسماء أخطاء عابرة تستحق إعادة المحاولة (تُطابق بالاسم حتى لا نستورد requests و geopy هنا)
+TRANSIENT_ERRORS = {"Timeout", "ConnectionError", "TimeoutError", "GeocoderTimedOut", "GeocoderUnavailable"}
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class QuotaExceeded(RuntimeError):
+    """نفدت الحصة اليومية لنقطة خارجية؛ لا يُرسل الطلب"""
+
+
+def today():
+    """اليوم الحالي بتوقيت UTC (الحصص اليومية تُصفّر عنده)"""
+    return time.strftime("%Y-%m-%d", time.gmtime())
+
+
+class QuotaLedger:
+    """عدد الطلبات اليومية ودلو المعدل لكل نقطة في SQLite: يبقى بعد إعادة التشغيل ويُشارك بين العمليات"""
+
+    def __init__(self, path, keep_days=30):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS quota_usage ("
+            "endpoint TEXT NOT NULL, day TEXT NOT NULL, used INTEGER NOT NULL, PRIMARY KEY (endpoint, day))")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_state ("
+            "endpoint TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+        cutoff = time.strftime("%Y-%m-%d", time.gmtime(time.time() - keep_days * 86400))
+        self._conn.execute("DELETE FROM quota_usage WHERE day < ?", (cutoff,))
+
+    def consume(self, endpoint, limit=None, day=None):
+        """احتساب طلب واحد؛ يرجع False دون احتساب إن بلغت النقطة حدها اليومي"""
+        if limit is not None and limit <= 0:
+            return False
+        with self._lock:
+            # زيادة ذرية في SQLite حتى لا تتجاوز عمليتان معاً الحد
+            cursor = self._conn.execute(
+                "INSERT INTO quota_usage (endpoint, day, used) VALUES (?, ?, 1) "
+                "ON CONFLICT (endpoint, day) DO UPDATE SET used = used + 1 WHERE ? IS NULL OR used < ?",
+                (endpoint, day or today(), limit, limit))
+            return cursor.rowcount > 0
+
+    def reserve(self, endpoint, rate, burst=1):
+        """حجز رمز من دلو مشترك بين كل العمليات التي تستخدم الملف؛ يرجع المدة الواجب انتظارها قبل الطلب
+
+        الرصيد قد يصبح سالباً: كل حجز يأخذ الموعد التالي المتاح فتتوزع الطلبات على المعدل مهما تعددت العمليات.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT tokens, updated FROM rate_state WHERE endpoint = ?",
+                                         (endpoint,)).fetchone()
+                tokens = burst if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+                tokens -= 1
+                self._conn.execute(
+                    "INSERT INTO rate_state (endpoint, tokens, updated) VALUES (?, ?, ?) "
+                    "ON CONFLICT (endpoint) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                    (endpoint, tokens, now))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return max(0.0, -tokens / rate)
+
+    def used(self, endpoint, day=None):
+        with self._lock:
+            row = self._conn.execute("SELECT used FROM quota_usage WHERE endpoint = ? AND day = ?",
+                                     (endpoint, day or today())).fetchone()
+        return row[0] if row else 0
+
+    def usage(self, day=None):
+        """النقطة -> عدد طلبات اليوم"""
+        with self._lock:
+            return dict(self._conn.execute("SELECT endpoint, used FROM quota_usage WHERE day = ? ORDER BY endpoint",
+                                           (day or today(),)).fetchall())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class Endpoint:
+    """حالة نقطة خارجية واحدة: دلو الرموز، طابور الانتظار حسب الأولوية، والإحصاءات"""
+
+    def __init__(self, name, rate=None, burst=1, daily_limit=None):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.daily_limit = daily_limit
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.condition = threading.Condition()
+        self.queue = []
+        self.paused_until = 0.0
+        self.exhausted_day = None
+        self.waits = {}
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def depth(self):
+        """عدد المنتظرين لكل فئة أولوية"""
+        counts = [0] * len(PRIORITIES)
+        for priority, _ in self.queue:
+            counts[priority] += 1
+        return dict(zip(PRIORITIES, counts))
+
+    def delay(self):
+        """المدة حتى يُسمح بالطلب التالي (توقف بعد 429 أو انتظار رمز)"""
+        paused = self.paused_until - time.monotonic()
+        return max(paused, self.bucket.delay() if self.bucket is not None else 0.0, 0.0)
+
+    def pause(self, seconds):
+        """إيقاف كل الطلبات لهذه النقطة مؤقتاً (بعد أن طلبت الخدمة التمهل)"""
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.condition.notify_all()
+
+
+class RequestScheduler:
+    """مجدول مركزي للطلبات الخارجية: دلو رموز لكل نقطة، حصص يومية دائمة، أولويات، وإعادة محاولة بتراجع عشوائي
+
+    المعدل والحصة اليومية مشتركان بين العمليات عبر ملف quota_path (الواجهة و bulk_lookup و geo_server معاً
+    لا يتجاوزون طلباً واحداً في الثانية إلى Nominatim)؛ ترتيب الأولويات داخل العملية الواحدة فقط.
+    """
+
+    def __init__(self, endpoints=None, quota_path="geolocator_quota.sqlite", default_priority=NORMAL,
+                 max_retries=3, backoff=0.5, max_backoff=30.0):
+        configs = dict(ENDPOINTS)
+        configs.update(endpoints or {})
+        self.endpoints = {name: Endpoint(name, **config) for name, config in configs.items()}
+        self.ledger = QuotaLedger(quota_path or ":memory:")
+        self.default_priority = _level(default_priority)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.local = threading.local()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def endpoint(self, name):
+        """حالة النقطة؛ النقاط غير المعروفة بلا حد معدل ولا حصة لكنها تُحصى"""
+        endpoint = self.endpoints.get(name)
+        if endpoint is None:
+            with self._lock:
+                endpoint = self.endpoints.setdefault(name, Endpoint(name))
+        return endpoint
+
+    @contextmanager
+    def priority(self, level):
+        """أولوية طلبات هذا الخيط داخل الكتلة: with scheduler.priority(INTERACTIVE): ..."""
+        previous = getattr(self.local, "priority", None)
+        self.local.priority = _level(level)
+        try:
+            yield
+        finally:
+            self.local.priority = previous
+
+    def current_priority(self):
+        priority = getattr(self.local, "priority", None)
+        return self.default_priority if priority is None else priority
+
+    def acquire(self, name, priority=None):
+        """انتظار دور الطلب (الأولوية ثم ترتيب الوصول) ورمز من دلو النقطة، ثم احتسابه من الحصة اليومية"""
+        endpoint = self.endpoint(name)
+        priority = self.current_priority() if priority is None else _level(priority)
+        day = today()
+        if endpoint.exhausted_day == day:
+            endpoint.rejected += 1
+            raise QuotaExceeded(f"Daily quota of {endpoint.daily_limit} requests for {name} is used up")
+
+        started = time.monotonic()
+        entry = (priority, next(self._sequence))
+        with metrics.span("rate_limit_wait", endpoint=name), endpoint.condition:
+            heapq.heappush(endpoint.queue, entry)
+            self._publish_depth(endpoint)
+            endpoint.condition.notify_all()
+            try:
+                while True:
+                    if endpoint.queue[0] == entry:
+                        delay = endpoint.delay()
+                        if delay <= 0 and (endpoint.bucket is None or endpoint.bucket.try_acquire()):
+                            break
+                        endpoint.condition.wait(max(delay, 0.001))
+                    else:
+                        endpoint.condition.wait()
+                if endpoint.rate:
+                    # موعد الطلب في الدلو المشترك مع العمليات الأخرى؛ يبقى أول الطابور حتى يحين
+                    deadline = time.monotonic() + self.ledger.reserve(name, endpoint.rate, endpoint.burst)
+                    while time.monotonic() < deadline:
+                        endpoint.condition.wait(deadline - time.monotonic())
+            finally:
+                endpoint.queue.remove(entry)
+                heapq.heapify(endpoint.queue)
+                self._publish_depth(endpoint)
+                endpoint.condition.notify_all()
+                self._record_wait(endpoint, priority, time.monotonic() - started)
+
+        if not self.ledger.consume(name, endpoint.daily_limit, day):
+            endpoint.exhausted_day = day
+            endpoint.rejected += 1
+            raise QuotaExceeded(f"Daily quota of {endpoint.daily_limit} requests for {name} is used up")
+        endpoint.requests += 1
+        metrics.REGISTRY.set(metrics.QUOTA_USED, self.ledger.used(name, day), labels=(("endpoint", name),))
+
+    def call(self, name, fn, *args, priority=None, **kwargs):
+        """تنفيذ طلب خارجي عبر المجدول مع إعادة المحاولة للأخطاء العابرة"""
+        endpoint = self.endpoint(name)
+        attempt = 0
+        while True:
+            self.acquire(name, priority)
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                retryable, retry_after, throttled = _retry_hint(e)
+                if throttled:
+                    endpoint.throttled += 1
+                    metrics.REGISTRY.inc(metrics.SCHEDULER_THROTTLED, labels=(("endpoint", name),))
+                if not retryable or attempt >= self.max_retries:
+                    endpoint.failures += 1
+                    raise
+                attempt += 1
+                endpoint.retries += 1
+                metrics.REGISTRY.inc(metrics.SCHEDULER_RETRIES, labels=(("endpoint", name),))
+                delay = self.backoff_delay(attempt, retry_after)
+                if throttled:
+                    # التمهل يشمل كل المنتظرين على النقطة، لا هذا الطلب وحده
+                    endpoint.pause(delay)
+                else:
+                    time.sleep(delay)
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """تراجع أسي بنصف عشوائي حتى لا تعيد الطلبات المحاولة معاً؛ Retry-After من الخدمة له الأسبقية"""
+        if retry_after:
+            return min(self.max_backoff, retry_after) + random.uniform(0, self.backoff)
+        ceiling = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    def _publish_depth(self, endpoint):
+        for priority, count in endpoint.depth().items():
+            metrics.REGISTRY.set(metrics.SCHEDULER_QUEUE, count,
+                                 labels=(("endpoint", endpoint.name), ("priority", priority)))
+
+    def _record_wait(self, endpoint, priority, seconds):
+        histogram = endpoint.waits.get(priority)
+        if histogram is None:
+            histogram = endpoint.waits[priority] = metrics.Histogram()
+        histogram.observe(seconds)
+        metrics.REGISTRY.observe(metrics.SCHEDULER_WAIT, seconds,
+                                 labels=(("endpoint", endpoint.name), ("priority", PRIORITIES[priority])))
+
+    def stats(self):
+        """لكل نقطة: طول الطابور لكل أولوية، أزمنة الانتظار، العدادات، واستهلاك الحصة اليومية"""
+        usage = self.ledger.usage()
+        stats = {}
+        for name, endpoint in list(self.endpoints.items()):
+            with endpoint.condition:
+                queue = endpoint.depth()
+                waits = {PRIORITIES[priority]: {"count": histogram.count, "mean": histogram.sum / histogram.count,
+                                                "p50": histogram.quantile(0.5), "p95": histogram.quantile(0.95)}
+                         for priority, histogram in sorted(endpoint.waits.items())}
+            stats[name] = {"queue": queue, "wait": waits, "requests": endpoint.requests,
+                           "retries": endpoint.retries, "throttled": endpoint.throttled,
+                           "failures": endpoint.failures, "rejected": endpoint.rejected,
+                           "quota_used": usage.get(name, 0), "daily_limit": endpoint.daily_limit,
+                           "paused": max(0.0, endpoint.paused_until - time.monotonic())}
+        return stats
+
+    def summary(self):
+        """سطر مختصر لكل نقطة مستخدمة (للواجهة وملخص الأدوات)"""
+        lines = []
+        for name, stats in self.stats().items():
+            if not stats["requests"] and not stats["rejected"] and not any(stats["queue"].values()):
+                continue
+            limit = stats["daily_limit"]
+            quota = f"{stats['quota_used']}/{limit}" if limit is not None else str(stats["quota_used"])
+            waits = " ".join(f"{priority} p95 {wait['p95'] * 1000:.0f}ms" for priority, wait in stats["wait"].items())
+            lines.append(f"{name}: quota {quota} | queued {sum(stats['queue'].values())} | "
+                         f"retries {stats['retries']} | 429 {stats['throttled']} | {waits}")
+        return "\n".join(lines)
+
+    def close(self):
+        self.ledger.close()
+
+
+def _level(priority):
+    return PRIORITIES.index(priority) if isinstance(priority, str) else int(priority)
+
+
+def _retry_after(value):
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_hint(error):
+    """(هل يُعاد الطلب، Retry-After بالثواني إن وُجد، هل طلبت الخدمة التمهل)"""
+    names = {cls.__name__ for cls in type(error).__mro__}
+    response = getattr(error, "response", None)
+    # أخطاء requests تحمل الرد، وأخطاء المزودين المترجمة (ProviderError) تحمل الرمز مباشرة
+    status = getattr(response, "status_code", getattr(error, "status_code", None))
+    if status is not None:
+        retry_after = _retry_after(getattr(response, "headers", {}).get("Retry-After"))
+        return status in RETRY_STATUSES, retry_after, status == 429
+    if "GeocoderRateLimited" in names:
+        return True, _retry_after(getattr(error, "retry_after", None)), True
+    return bool(names & TRANSIENT_ERRORS), None, False
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="استهلاك الحصص اليومية للخدمات الخارجية")
+    parser.add_argument("--quota", default="geolocator_quota.sqlite", help="ملف الحصص")
+    parser.add_argument("--day", default=None, help="اليوم (YYYY-MM-DD بتوقيت UTC، افتراضياً اليوم)")
+    args = parser.parse_args(argv)
+
+    ledger = QuotaLedger(args.quota)
+    usage = ledger.usage(args.day)
+    ledger.close()
+    for name in sorted(set(ENDPOINTS) | set(usage)):
+        limit = ENDPOINTS.get(name, {}).get("daily_limit")
+        print(f"{name}: {usage.get(name, 0)}" + (f"/{limit}" if limit is not None else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -0,0 +1,292 @@
+import argparse
+import csv
+import ipaddress
+import json
+import queue
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+import metrics
+from geo_result import IpLocation
+
+COLUMNS = ("id", "created", "target") + IpLocation.FIELDS + ("provider", "address", "all_ips")
+_STOP = object()
+
+
+def _packed(ip):
+    """العنوان كبايتات (4 لـ IPv4 و16 لـ IPv6) حتى تكون مقارنة النطاقات ترتيباً ثنائياً بسيطاً"""
+    # inet_pton أسرع بكثير من ipaddress عند كتابة دفعات كبيرة
+    try:
+        return 4, socket.inet_pton(socket.AF_INET, ip)
+    except OSError:
+        return 6, socket.inet_pton(socket.AF_INET6, ip)
+
+
+def make_record(location, target=None, address=None, all_ips=None, created=None):
+    """سجل نتيجة واحدة للتخزين من IpLocation أو من صف قاموس (مثل صفوف bulk_lookup)"""
+    data = location.to_dict() if isinstance(location, IpLocation) else dict(location)
+    record = {field: data.get(field) for field in IpLocation.FIELDS}
+    record["provider"] = data.get("provider")
+    record["target"] = target or data.get("target") or record["ip_address"]
+    record["address"] = address if address is not None else data.get("address")
+    record["all_ips"] = list(all_ips) if all_ips is not None else data.get("all_ips")
+    record["created"] = created if created is not None else data.get("created") or time.time()
+    return record
+
+
+def render_report(record):
+    """النص المعروض للمستخدم (وفي ملفات التقارير) لسجل نتيجة مخزن"""
+    lines = [f"⦿ عنوان IP: {record['ip_address']}"]
+    if record.get("all_ips"):
+        lines.append(f"⦿ كل عناوين النطاق: {', '.join(record['all_ips'])}")
+    lines += [
+        f"⦿ الدولة: {record['country']}",
+        f"⦿ المنطقة: {record['region']}",
+        f"⦿ المدينة: {record['city']}",
+        f"⦿ الإحداثيات: {record['latitude']}, {record['longitude']}",
+        f"⦿ المنطقة الزمنية: {record['time_zone']}",
+        f"⦿ مزود الخدمة: {record['isp'] or 'غير معروف'}",
+    ]
+    text = "\n".join(lines)
+    if record.get("address") is not None:
+        text += f"\n\n⦿ العنوان المقدر:\n{record['address']}"
+    return text
+
+
+def parse_time(value):
+    """وقت من ثوانٍ منذ 1970 أو تاريخ ISO (مثل 2024-05-01 أو 2024-05-01T12:00)"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+class ResultStore:
+    """سجل دائم لنتائج تحديد الموقع على SQLite (WAL) مع كاتب خلفي يجمع الإضافات في دفعات"""
+
+    def __init__(self, path="geolocator_results.sqlite", batch_size=1000, max_pending=10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.written = 0
+        self.batches = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "id INTEGER PRIMARY KEY, created REAL NOT NULL, target TEXT, ip_address TEXT, "
+            "ip_version INTEGER, ip_packed BLOB, country TEXT, region TEXT, city TEXT, latitude REAL, "
+            "longitude REAL, time_zone TEXT, isp TEXT, provider TEXT, address TEXT, all_ips TEXT)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_ip ON results(ip_version, ip_packed)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_country ON results(country, created)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_created ON results(created)")
+        # طابور محدود: عند امتلائه ينتظر المُضيف بدلاً من تراكم الذاكرة
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._writer = threading.Thread(target=self._write_loop, name="result-store", daemon=True)
+        self._writer.start()
+
+    def add(self, record):
+        """إضافة سجل (من make_record) للكتابة في الخلفية"""
+        self._pending.put(record)
+
+    def add_many(self, records):
+        for record in records:
+            self._pending.put(record)
+
+    def flush(self):
+        """الانتظار حتى تُكتب كل السجلات المضافة"""
+        self._pending.join()
+
+    def _write_loop(self):
+        while True:
+            item = self._pending.get()
+            batch = [item]
+            # كل ما تراكم أثناء الكتابة السابقة يدخل في معاملة واحدة (دفعات أكبر كلما زاد الضغط)
+            while item is not _STOP and len(batch) < self.batch_size:
+                try:
+                    item = self._pending.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+            records = [record for record in batch if record is not _STOP]
+            try:
+                if records:
+                    self._insert(records)
+            except Exception as e:
+                self.last_error = e
+                print(f"Error writing results: {e}")
+            finally:
+                for _ in batch:
+                    self._pending.task_done()
+            if len(records) < len(batch):
+                return
+
+    def _insert(self, records):
+        rows = []
+        for record in records:
+            try:
+                version, packed = _packed(record["ip_address"])
+            except (OSError, TypeError):
+                version, packed = None, None
+            all_ips = record.get("all_ips")
+            rows.append((record.get("created") or time.time(), record.get("target"), record.get("ip_address"),
+                         version, packed, record.get("country"), record.get("region"), record.get("city"),
+                         record.get("latitude"), record.get("longitude"), record.get("time_zone"),
+                         record.get("isp"), record.get("provider"), record.get("address"),
+                         json.dumps(all_ips) if all_ips is not None else None))
+        with self._lock, metrics.span("store_write"):
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO results (created, target, ip_address, ip_version, ip_packed, country, region, "
+                    "city, latitude, longitude, time_zone, isp, provider, address, all_ips) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        self.written += len(rows)
+        self.batches += 1
+
+    def _where(self, ip=None, prefix=None, country=None, since=None, until=None):
+        clauses, params = [], []
+        if ip is not None:
+            address = ipaddress.ip_address(ip)
+            clauses.append("ip_version = ? AND ip_packed = ?")
+            params += [address.version, address.packed]
+        if prefix is not None:
+            network = ipaddress.ip_network(prefix, strict=False)
+            clauses.append("ip_version = ? AND ip_packed BETWEEN ? AND ?")
+            params += [network.version, network.network_address.packed, network.broadcast_address.packed]
+        if country is not None:
+            clauses.append("country = ?")
+            params.append(country)
+        if since is not None:
+            clauses.append("created >= ?")
+            params.append(parse_time(since))
+        if until is not None:
+            clauses.append("created < ?")
+            params.append(parse_time(until))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def iter_query(self, ip=None, prefix=None, country=None, since=None, until=None, limit=None, newest_first=False):
+        """السجلات المطابقة لكل الشروط المحددة (العنوان، الشبكة، الدولة، الفترة الزمنية)"""
+        where, params = self._where(ip, prefix, country, since, until)
+        sql = (f"SELECT {', '.join(COLUMNS)} FROM results{where} "
+               f"ORDER BY created {'DESC' if newest_first else 'ASC'}, id")
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        for row in rows:
+            record = dict(zip(COLUMNS, row))
+            if record["all_ips"] is not None:
+                record["all_ips"] = json.loads(record["all_ips"])
+            yield record
+
+    def query(self, **filters):
+        return list(self.iter_query(**filters))
+
+    def batch(self, **filters):
+        """السجلات المطابقة كدفعة عمودية مضغوطة للتحليل (انظر geo_batch.py)"""
+        from geo_batch import GeoResultBatch
+        return GeoResultBatch.from_rows(self.iter_query(**filters))
+
+    def latest(self, ip):
+        """آخر نتيجة مخزنة للعنوان أو None"""
+        records = self.query(ip=ip, limit=1, newest_first=True)
+        return records[0] if records else None
+
+    def count(self, **filters):
+        where, params = self._where(**filters)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM results{where}", params).fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def export_csv(self, path, **filters):
+        """تصدير السجلات المطابقة إلى CSV وإرجاع عددها"""
+        count = 0
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            for record in self.iter_query(**filters):
+                if record["all_ips"] is not None:
+                    record["all_ips"] = " ".join(record["all_ips"])
+                writer.writerow(record)
+                count += 1
+        return count
+
+    def export_parquet(self, path, **filters):
+        """تصدير السجلات المطابقة إلى Parquet (يتطلب pyarrow) وإرجاع عددها"""
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+        records = self.query(**filters)
+        columns = {column: [record[column] for record in records] for column in COLUMNS}
+        pq.write_table(pa.table(columns), path)
+        return len(records)
+
+    def export(self, path, **filters):
+        """تصدير حسب امتداد الملف (.parquet أو CSV)"""
+        if path.endswith(".parquet"):
+            return self.export_parquet(path, **filters)
+        return self.export_csv(path, **filters)
+
+    def stats(self):
+        return {"entries": len(self), "written": self.written, "batches": self.batches,
+                "pending": self._pending.unfinished_tasks}
+
+    def close(self):
+        """كتابة ما تبقى ثم إغلاق قاعدة البيانات"""
+        if self._writer.is_alive():
+            self._pending.put(_STOP)
+            self._writer.join()
+        with self._lock:
+            self._conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="استعلام سجل نتائج تحديد الموقع وتصديره")
+    parser.add_argument("store", nargs="?", default="geolocator_results.sqlite", help="ملف سجل النتائج")
+    parser.add_argument("--ip", help="عنوان IP محدد")
+    parser.add_argument("--prefix", help="شبكة مثل 8.8.8.0/24 أو 2001:db8::/32")
+    parser.add_argument("--country", help="اسم أو رمز الدولة كما خزنه المزود")
+    parser.add_argument("--since", help="من تاريخ (ISO) أو ثوانٍ منذ 1970")
+    parser.add_argument("--until", help="حتى تاريخ (ISO) أو ثوانٍ منذ 1970")
+    parser.add_argument("--limit", type=int, help="الحد الأقصى لعدد السجلات")
+    parser.add_argument("-o", "--output", help="تصدير إلى CSV أو .parquet بدلاً من طباعة التقارير")
+    args = parser.parse_args(argv)
+
+    filters = {"ip": args.ip, "prefix": args.prefix, "country": args.country,
+               "since": args.since, "until": args.until, "limit": args.limit}
+    store = ResultStore(args.store)
+    try:
+        if args.output:
+            count = store.export(args.output, **filters)
+            print(f"{count} records exported to {args.output}", file=sys.stderr)
+        else:
+            for record in store.iter_query(**filters):
+                print(f"# {datetime.fromtimestamp(record['created']).isoformat(timespec='seconds')} "
+                      f"{record['target']}")
+                print(render_report(record))
+                print()
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import metrics
+from lookup_cache import SqliteCache
+from rate_limit import TokenBucket
+
+
+class ReverseGeocoder:
+    """خدمة بحث عكسي عن العناوين مع ذاكرة مؤقتة حسب الإحداثيات المقربة وتنظيم معدل الطلبات"""
+
+    def __init__(self, user_agent="geo_locator_app", precision=3, cache=None, rate=1.0,
+                 memory_entries=1024, domain=None, scheme=None, timeout=10):
+        self.precision = precision
+        self.memory_entries = memory_entries
+        self.timeout = timeout
+        self._options = {"user_agent": user_agent}
+        if domain:
+            self._options["domain"] = domain
+        if scheme:
+            self._options["scheme"] = scheme
+        self._geolocator = None
+        # سياسة Nominatim العامة: طلب واحد في الثانية تقريباً
+        self.bucket = TokenBucket(rate, capacity=1)
+        # مجدول مشترك (request_scheduler) يحل محل الدلو الخاص عند تعيينه
+        self.scheduler = None
+        self._memory = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.cache = None
+        self.set_cache(cache)
+        self.requests = 0
+
+    @property
+    def geolocator(self):
+        """كائن Nominatim واحد طوال عمر الخدمة، يُنشأ عند أول طلب فعلي"""
+        if self._geolocator is None:
+            from geopy.geocoders import Nominatim
+            self._geolocator = Nominatim(**self._options)
+        return self._geolocator
+
+    def set_cache(self, cache):
+        """تعيين ذاكرة مؤقتة دائمة (مسار ملف SQLite أو كائن) أو None"""
+        if self.cache is not None and self.cache is not cache:
+            self.cache.close()
+        if isinstance(cache, str):
+            cache = SqliteCache(cache, table="reverse_geocode", max_entries=50000, ttl=30 * 24 * 3600) if cache else None
+        self.cache = cache
+
+    def key(self, latitude, longitude):
+        """تقريب الإحداثيات إلى الدقة المحددة (3 منازل ≈ 110 متر)"""
+        return f"{float(latitude):.{self.precision}f},{float(longitude):.{self.precision}f}"
+
+    def _remember(self, key, address):
+        with self._lock:
+            self._memory[key] = address
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def reverse(self, latitude, longitude):
+        """إرجاع العنوان المقدر للإحداثيات أو None إن لم يوجد"""
+        key = self.key(latitude, longitude)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                metrics.cache_result("reverse_memory", True)
+                return self._memory[key]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+        if not owner:
+            # طلب جارٍ لنفس الخلية: ننتظر نتيجته
+            return future.result()
+
+        try:
+            address = self._fetch(key)
+            future.set_result(address)
+            return address
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _fetch(self, key):
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            metrics.cache_result("reverse", cached is not None)
+            if cached is not None:
+                self._remember(key, cached["address"])
+                return cached["address"]
+
+        if self.scheduler is not None:
+            location = self.scheduler.call("nominatim", self._request, key)
+        else:
+            with metrics.span("rate_limit_wait"):
+                self.bucket.acquire()
+            location = self._request(key)
+        address = location.address if location else None
+        self._remember(key, address)
+        if self.cache is not None:
+            self.cache.set(key, {"address": address})
+        return address
+
+    def _request(self, key):
+        self.requests += 1
+        with metrics.span("nominatim"):
+            return self.geolocator.reverse(key, timeout=self.timeout)
+
+    def reverse_many(self, coordinates):
+        """بحث عكسي لعدة إحداثيات مع إزالة التكرار حسب الخلية المقربة"""
+        results = {}
+        for latitude, longitude in coordinates:
+            key = self.key(latitude, longitude)
+            if key not in results:
+                results[key] = self.reverse(latitude, longitude)
+        return [results[self.key(latitude, longitude)] for latitude, longitude in coordinates]
@@ -0,0 +1,375 @@
+import sys
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180.0
+# فهرس بهذا العدد من النقاط أو أقل (مراكز بيانات، مناطق) يُبحث فيه بضرب المتجهات مباشرة دون الشبكة
+SMALL_INDEX = 256
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """مسافة الدائرة العظمى بالكيلومتر (متجهة على مصفوفات NumPy)"""
+    lat1 = np.radians(lat1)
+    lat2 = np.radians(lat2)
+    dlat = lat2 - lat1
+    dlon = np.radians(np.asarray(lon2, dtype=np.float64) - np.asarray(lon1, dtype=np.float64))
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def unit_vectors(latitudes, longitudes):
+    """النقاط كمتجهات وحدة ثلاثية الأبعاد: الأقرب على الكرة هو الأكبر في الضرب النقطي"""
+    latitudes = np.radians(np.asarray(latitudes, dtype=np.float64))
+    longitudes = np.radians(np.asarray(longitudes, dtype=np.float64))
+    cos = np.cos(latitudes)
+    return np.column_stack((cos * np.cos(longitudes), cos * np.sin(longitudes), np.sin(latitudes)))
+
+
+def _ranges(begins, ends):
+    """كل المواضع في المديات [begins[i], ends[i]) متتالية في مصفوفة واحدة دون حلقة"""
+    counts = ends - begins
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    return np.repeat(begins - np.cumsum(counts) + counts, counts) + np.arange(total)
+
+
+def _circle_bbox(latitude, longitude, radius_km):
+    """أصغر صندوق (جنوب، غرب، شمال، شرق) يحوي دائرة المسافة؛ كل خطوط الطول إن احتوت الدائرة قطباً"""
+    angular = radius_km / EARTH_RADIUS_KM
+    span = np.degrees(angular)
+    south, north = latitude - span, latitude + span
+    if south <= -90.0 or north >= 90.0 or angular >= np.pi / 2:
+        return max(south, -90.0), -180.0, min(north, 90.0), 180.0
+    width = np.degrees(np.arcsin(min(1.0, np.sin(angular) / np.cos(np.radians(latitude)))))
+    if width >= 180.0:
+        return south, -180.0, north, 180.0
+    west = (longitude - width + 180.0) % 360.0 - 180.0
+    east = (longitude + width + 180.0) % 360.0 - 180.0
+    return south, west, north, east
+
+
+def _chunks(costs, budget):
+    """تقسيم الاستعلامات إلى مجموعات متتالية لا يتجاوز مجموع تكلفتها الميزانية (لتقييد الذاكرة)"""
+    if not len(costs):
+        return
+    groups = np.cumsum(costs) // max(1, budget)
+    edges = np.flatnonzero(np.diff(groups)) + 1
+    begin = 0
+    for end in list(edges) + [len(costs)]:
+        yield slice(begin, end)
+        begin = end
+
+
+class _GridLevel:
+    """مستوى واحد من الشبكة: النقاط مرتبة حسب الخلية مع جدول بدايات الخلايا"""
+
+    def __init__(self, latitudes, longitudes, cell_deg):
+        self.cell_deg = float(cell_deg)
+        self.rows = int(np.ceil(180.0 / self.cell_deg))
+        self.cols = int(np.ceil(360.0 / self.cell_deg))
+        rows, cols = self.rows_cols(latitudes, longitudes)
+        cells = rows * self.cols + cols
+        order = np.argsort(cells, kind="stable")
+        self.ids = order.astype(np.int32)
+        self.latitudes = latitudes[order]
+        self.longitudes = longitudes[order]
+        # الخلية c تشغل المدى [starts[c], starts[c + 1]) في المصفوفات المرتبة
+        self.starts = np.searchsorted(cells[order], np.arange(self.rows * self.cols + 1)).astype(np.int64)
+
+    def rows_cols(self, latitudes, longitudes):
+        rows = np.clip(((np.asarray(latitudes, dtype=np.float64) + 90.0) // self.cell_deg).astype(np.int64),
+                       0, self.rows - 1)
+        cols = ((np.asarray(longitudes, dtype=np.float64) + 180.0) // self.cell_deg).astype(np.int64) % self.cols
+        return rows, cols
+
+    def window(self, rows, cols, radius):
+        """خلايا النافذة (2r+1)² حول كل استعلام: مصفوفتا (الخلايا، الصلاحية) بشكل (استعلامات، خلايا)"""
+        row_offsets = np.arange(-radius, radius + 1)
+        col_offsets = np.arange(-radius, radius + 1) if 2 * radius + 1 < self.cols else np.arange(self.cols)
+        dr, dc = np.meshgrid(row_offsets, col_offsets, indexing="ij")
+        cell_rows = rows[:, None] + dr.ravel()[None, :]
+        cell_cols = (cols[:, None] + dc.ravel()[None, :]) % self.cols
+        valid = (cell_rows >= 0) & (cell_rows < self.rows)
+        cells = np.where(valid, cell_rows * self.cols + cell_cols, 0)
+        return cells, valid
+
+    def counts(self, cells, valid):
+        return np.where(valid, self.starts[cells + 1] - self.starts[cells], 0)
+
+    def candidates(self, cells, valid):
+        """كل النقاط في خلايا النافذة: (رقم الاستعلام، موضع النقطة في المصفوفات المرتبة)"""
+        counts = self.counts(cells, valid).ravel()
+        begins = self.starts[cells].ravel()
+        query = np.repeat(np.arange(cells.shape[0]), cells.shape[1])
+        total = int(counts.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.repeat(query, counts), _ranges(begins, begins + counts)
+
+    def box(self, south, west, north, east):
+        """مواضع النقاط في خلايا الصندوق (تشمل نقاطاً قرب حوافه تُستبعد بالفحص الدقيق)"""
+        (row_south, row_north), (col_west, col_east) = self.rows_cols([south, north], [west, east])
+        rows = np.arange(row_south, row_north + 1)
+        if east - west >= 360.0 - self.cell_deg or (west > east and col_west <= col_east):
+            # يشمل عبوراً لخط التاريخ يبدأ وينتهي في العمود نفسه: الجزءان يتداخلان فيُقرأ الصف كله مرة واحدة
+            segments = [(0, self.cols - 1)]
+        elif col_west <= col_east and west <= east:
+            segments = [(col_west, col_east)]
+        else:
+            # صندوق يعبر خط التاريخ: جزء حتى آخر عمود وجزء من أول عمود
+            segments = [(col_west, self.cols - 1), (0, col_east)]
+        begins = np.concatenate([self.starts[rows * self.cols + first] for first, _ in segments])
+        ends = np.concatenate([self.starts[rows * self.cols + last + 1] for _, last in segments])
+        return _ranges(begins, ends)
+
+    def bound_km(self, latitudes, radius):
+        """أدنى مسافة ممكنة لأي نقطة خارج النافذة، لضمان صحة أقرب نتيجة"""
+        span = radius * self.cell_deg
+        if span >= 180.0:
+            return np.full(len(latitudes), np.inf)
+        # شمالاً/جنوباً: فرق العرض وحده لا يقل عن span، وشرقاً/غرباً: المسافة إلى خط الطول الحدّي
+        across = np.arcsin(np.cos(np.radians(latitudes)) * np.sin(np.radians(min(span, 90.0))))
+        return np.minimum(span * KM_PER_DEGREE, across * EARTH_RADIUS_KM)
+
+
+class GridIndex:
+    """فهرس مكاني متعدد المستويات بشبكات خطوط الطول/العرض مخزنة في مصفوفات مضغوطة"""
+
+    def __init__(self, latitudes, longitudes, cell_deg=1.0, level_factor=4, budget=4_000_000):
+        latitudes = np.asarray(latitudes, dtype=np.float32).ravel()
+        longitudes = np.asarray(longitudes, dtype=np.float32).ravel()
+        # النقاط بلا إحداثيات (NaN) لا تُفهرس؛ النتائج تعيد أرقامها الأصلية في المدخلات
+        valid = np.isfinite(latitudes) & np.isfinite(longitudes)
+        self.ids = None if valid.all() else np.flatnonzero(valid)
+        if self.ids is not None:
+            latitudes, longitudes = latitudes[valid], longitudes[valid]
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.budget = budget
+        # مستويات من الأدق إلى الأخشن: الاستعلامات البعيدة عن أي نقطة تنتقل إلى مستوى أخشن
+        self.levels = []
+        size = float(cell_deg)
+        while True:
+            self.levels.append(_GridLevel(latitudes, longitudes, size))
+            if size * level_factor > 30.0:
+                break
+            size *= level_factor
+
+    def __len__(self):
+        return len(self.latitudes)
+
+    def nearest(self, latitudes, longitudes):
+        """أقرب نقطة لكل استعلام: (أرقام النقاط الأصلية، المسافات بالكيلومتر)؛ -1 إن كان الفهرس فارغاً"""
+        latitudes = np.atleast_1d(np.asarray(latitudes, dtype=np.float64))
+        longitudes = np.atleast_1d(np.asarray(longitudes, dtype=np.float64))
+        indices = np.full(len(latitudes), -1, dtype=np.int64)
+        distances = np.full(len(latitudes), np.inf)
+        if len(self) == 0 or len(latitudes) == 0:
+            return indices, distances
+
+        if len(self) <= SMALL_INDEX:
+            self._nearest_dot(latitudes, longitudes, indices, distances)
+            return self._original(indices), distances
+
+        pending = np.arange(len(latitudes))
+        for level in self.levels:
+            if not len(pending):
+                break
+            self._nearest_level(level, latitudes, longitudes, pending, indices, distances)
+            bound = level.bound_km(latitudes[pending], 1)
+            pending = pending[distances[pending] > bound]
+
+        if len(pending):
+            self._nearest_brute_force(latitudes, longitudes, pending, indices, distances)
+        return self._original(indices), distances
+
+    def _original(self, positions):
+        """تحويل مواضع النقاط المفهرسة إلى أرقامها في المدخلات الأصلية (-1 يبقى كما هو)"""
+        if self.ids is None:
+            return positions
+        return np.where(positions >= 0, self.ids[np.maximum(positions, 0)], -1)
+
+    def within_box(self, south, west, north, east):
+        """أرقام النقاط داخل صندوق (جنوب، غرب، شمال، شرق)؛ الغرب أكبر من الشرق يعني عبور خط التاريخ"""
+        level = self.levels[0]
+        positions = level.box(south, west, north, east)
+        latitudes, longitudes = level.latitudes[positions], level.longitudes[positions]
+        inside = (latitudes >= south) & (latitudes <= north)
+        if east - west >= 360.0:
+            pass
+        elif west <= east:
+            inside &= (longitudes >= west) & (longitudes <= east)
+        else:
+            inside &= (longitudes >= west) | (longitudes <= east)
+        return self._original(np.sort(level.ids[positions[inside]]).astype(np.int64))
+
+    def within_radius(self, latitude, longitude, radius_km):
+        """النقاط على مسافة radius_km أو أقل: (الأرقام، المسافات بالكيلومتر) مرتبة من الأقرب"""
+        level = self.levels[0]
+        positions = level.box(*_circle_bbox(float(latitude), float(longitude), float(radius_km)))
+        distances = haversine_km(latitude, longitude, level.latitudes[positions], level.longitudes[positions])
+        inside = np.flatnonzero(distances <= radius_km)
+        order = inside[np.argsort(distances[inside], kind="stable")]
+        return self._original(level.ids[positions[order]].astype(np.int64)), distances[order]
+
+    def k_nearest(self, latitude, longitude, k):
+        """أقرب k نقطة لنقطة واحدة: (الأرقام، المسافات) مرتبة من الأقرب
+
+        أول مستوى تحوي نافذته k نقطة يعطي حداً أعلى لمسافة النقطة رقم k، ثم بحث بنصف القطر هذا يضمن الدقة.
+        """
+        if k <= 0 or not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        limit = np.inf
+        if k < len(self):
+            for level in self.levels:
+                rows, cols = level.rows_cols([latitude], [longitude])
+                cells, valid = level.window(rows, cols, 1)
+                if level.counts(cells, valid).sum() >= k:
+                    _, positions = level.candidates(cells, valid)
+                    distances = haversine_km(latitude, longitude, level.latitudes[positions],
+                                             level.longitudes[positions])
+                    limit = float(np.partition(distances, k - 1)[k - 1])
+                    break
+        if np.isinf(limit):
+            distances = haversine_km(latitude, longitude, self.latitudes, self.longitudes)
+            order = np.argsort(distances, kind="stable")[:k]
+            return self._original(order.astype(np.int64)), distances[order]
+        indices, distances = self.within_radius(latitude, longitude, limit)
+        return indices[:k], distances[:k]
+
+    def distances(self, latitude, longitude):
+        """مسافة كل نقطة مفهرسة عن نقطة واحدة بالكيلومتر: (الأرقام، المسافات) بترتيب المدخلات"""
+        distances = haversine_km(latitude, longitude, self.latitudes, self.longitudes)
+        return self._original(np.arange(len(self))), distances
+
+    def _nearest_level(self, level, latitudes, longitudes, pending, indices, distances):
+        rows, cols = level.rows_cols(latitudes[pending], longitudes[pending])
+        cells, valid = level.window(rows, cols, 1)
+        costs = level.counts(cells, valid).sum(axis=1)
+        for part in _chunks(costs, self.budget):
+            query, positions = level.candidates(cells[part], valid[part])
+            if not len(query):
+                continue
+            targets = pending[part][query]
+            dist = haversine_km(latitudes[targets], longitudes[targets],
+                                level.latitudes[positions], level.longitudes[positions])
+            # المرشحون مجمّعون حسب الاستعلام: أصغر مسافة لكل مجموعة ثم أول موضع يساويها
+            _, starts, sizes = np.unique(query, return_index=True, return_counts=True)
+            minimum = np.minimum.reduceat(dist, starts)
+            hits = np.flatnonzero(dist == np.repeat(minimum, sizes))
+            best = hits[np.unique(query[hits], return_index=True)[1]]
+            indices[targets[best]] = level.ids[positions[best]]
+            distances[targets[best]] = dist[best]
+
+    def _nearest_dot(self, latitudes, longitudes, indices, distances):
+        points = unit_vectors(self.latitudes, self.longitudes)
+        step = max(1, self.budget // len(self))
+        for begin in range(0, len(latitudes), step):
+            part = slice(begin, begin + step)
+            best = (unit_vectors(latitudes[part], longitudes[part]) @ points.T).argmax(axis=1)
+            indices[part] = best
+            # المسافة الدقيقة للنقطة المختارة فقط (arccos غير دقيق للمسافات القصيرة)
+            distances[part] = haversine_km(latitudes[part], longitudes[part],
+                                           self.latitudes[best], self.longitudes[best])
+
+    def _nearest_brute_force(self, latitudes, longitudes, pending, indices, distances):
+        step = max(1, self.budget // len(self))
+        for begin in range(0, len(pending), step):
+            targets = pending[begin:begin + step]
+            dist = haversine_km(latitudes[targets][:, None], longitudes[targets][:, None],
+                                self.latitudes[None, :], self.longitudes[None, :])
+            best = dist.argmin(axis=1)
+            indices[targets] = best
+            distances[targets] = dist[np.arange(len(targets)), best]
+
+
+def _load_batch(path):
+    from geo_batch import GeoResultBatch
+    if path.endswith((".sqlite", ".db")):
+        from result_store import ResultStore
+        store = ResultStore(path)
+        try:
+            return store.batch()
+        finally:
+            store.close()
+    from map_builder import read_rows
+    return GeoResultBatch.from_rows(read_rows(path))
+
+
+def _read_regions(path):
+    import csv
+    names, latitudes, longitudes = [], [], []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            names.append(row["name"])
+            latitudes.append(float(row["latitude"]))
+            longitudes.append(float(row["longitude"]))
+    return names, latitudes, longitudes
+
+
+def main(argv=None):
+    import argparse
+    import csv
+    import time
+
+    parser = argparse.ArgumentParser(description="استعلامات مكانية على نتائج البحث: نصف قطر، صندوق، الأقرب، والتجميع حسب أقرب منطقة")
+    parser.add_argument("results", help="ملف نتائج bulk_lookup (CSV أو JSONL) أو سجل نتائج SQLite (.sqlite)")
+    parser.add_argument("--near", help="نقطة المركز LAT,LON")
+    parser.add_argument("--radius", type=float, help="النتائج على مسافة لا تزيد عن هذا العدد من الكيلومترات من --near")
+    parser.add_argument("-k", "--nearest", type=int, help="أقرب N نتيجة من --near")
+    parser.add_argument("--bbox", help="النتائج داخل صندوق SOUTH,WEST,NORTH,EAST")
+    parser.add_argument("--regions", help="ملف CSV بأعمدة name,latitude,longitude لتجميع النتائج حسب أقرب منطقة")
+    args = parser.parse_args(argv)
+
+    batch = _load_batch(args.results)
+    started = time.perf_counter()
+    batch.spatial_index()
+    built = time.perf_counter() - started
+    started = time.perf_counter()
+    if args.regions:
+        names, latitudes, longitudes = _read_regions(args.regions)
+        nearest, distances = batch.nearest(latitudes, longitudes)
+        elapsed = time.perf_counter() - started
+        located = nearest >= 0
+        counts = np.bincount(nearest[located], minlength=len(names))
+        totals = np.bincount(nearest[located], weights=distances[located], minlength=len(names))
+        writer = csv.writer(sys.stdout)
+        writer.writerow(("region", "results", "mean_km"))
+        for index in np.argsort(-counts, kind="stable").tolist():
+            if counts[index]:
+                writer.writerow((names[index], int(counts[index]), f"{totals[index] / counts[index]:.1f}"))
+        print(f"{int(located.sum())} results grouped in {elapsed * 1000:.1f}ms", file=sys.stderr)
+        return 0
+
+    if args.bbox:
+        south, west, north, east = (float(value) for value in args.bbox.split(","))
+        indices, distances = batch.spatial_index().within_box(south, west, north, east), None
+    elif args.near and (args.radius is not None or args.nearest):
+        latitude, longitude = (float(value) for value in args.near.split(","))
+        if args.nearest:
+            indices, distances = batch.k_nearest(latitude, longitude, args.nearest)
+            if args.radius is not None:
+                keep = distances <= args.radius
+                indices, distances = indices[keep], distances[keep]
+        else:
+            indices, distances = batch.within_radius(latitude, longitude, args.radius)
+    else:
+        parser.error("one of --bbox, --regions or --near with --radius/--nearest is required")
+    elapsed = time.perf_counter() - started
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(("ip_address", "country", "city", "latitude", "longitude", "distance_km"))
+    for position, index in enumerate(indices.tolist()):
+        location = batch[index]
+        distance = "" if distances is None else f"{distances[position]:.1f}"
+        writer.writerow((location.ip_address, location.country or "", location.city or "",
+                         location.latitude, location.longitude, distance))
+    print(f"{len(indices)} of {len(batch)} results in {elapsed * 1000:.1f}ms "
+          f"(index built in {built * 1000:.0f}ms)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
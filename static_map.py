@@ -0,0 +1,314 @@
+import argparse
+import io
+import math
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import metrics
+from map_builder import MAX_MERCATOR_LATITUDE, TILE_PROVIDERS, read_rows
+from rate_limit import TokenBucket
+
+TILE_SIZE = 256
+TILE_URLS = {"openstreetmap": "https://tile.openstreetmap.org/{z}/{x}/{y}.png"}
+TILE_URLS.update({name: url for name, (url, _) in TILE_PROVIDERS.items() if url.startswith("http")})
+# حد تنزيل البلاطات لكل مزود (بلاطة/ثانية)؛ سياسة استخدام بلاطات OpenStreetMap تمنع التنزيل الكثيف
+TILE_RATES = {"openstreetmap": 2.0}
+ATTRIBUTIONS = {"openstreetmap": "© OpenStreetMap contributors", "google": "Google", "mapbox": "© Mapbox © OpenStreetMap"}
+
+
+def world_pixel(latitude, longitude, zoom):
+    """موقع النقطة بالبكسل في خريطة العالم عند مستوى التكبير (إسقاط ميركاتور للويب)"""
+    latitude = math.radians(max(-MAX_MERCATOR_LATITUDE, min(MAX_MERCATOR_LATITUDE, float(latitude))))
+    scale = TILE_SIZE * 2 ** zoom
+    x = (float(longitude) + 180.0) / 360.0 * scale
+    y = (0.5 - math.log(math.tan(math.pi / 4 + latitude / 2)) / (2 * math.pi)) * scale
+    return x, y
+
+
+class TileCache:
+    """بلاطات خرائط على القرص (directory/z/x/y.png): كل بلاطة ناقصة تُجلب مرة واحدة ثم يعاد استخدامها"""
+
+    def __init__(self, directory="tile_cache", url=TILE_URLS["openstreetmap"], user_agent="geo_locator_app",
+                 timeout=10, rate=None, memory_tiles=256, max_workers=8):
+        # url=None يعني العمل دون اتصال: البلاطات من المجلد فقط
+        self.directory = directory
+        self.url = url
+        self.timeout = timeout
+        self.headers = {"User-Agent": user_agent}
+        if rate is None:
+            rate = next((TILE_RATES[name] for name in TILE_RATES if TILE_URLS[name] == url), None)
+        self.bucket = TokenBucket(rate, capacity=max(1, int(rate))) if rate else None
+        self.memory_tiles = memory_tiles
+        self._memory = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._session = None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tiles")
+        self.hits = 0
+        self.downloads = 0
+        self.missing = 0
+
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+            self._session.headers.update(self.headers)
+        return self._session
+
+    def path(self, z, x, y):
+        return os.path.join(self.directory, str(z), str(x), f"{y}.png")
+
+    def get(self, z, x, y):
+        """صورة البلاطة (PIL) أو None إن تعذر الحصول عليها"""
+        key = (z, x, y)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+        if not owner:
+            # نفس البلاطة مطلوبة لتصدير آخر جارٍ: ننتظره بدلاً من تنزيلها مرتين
+            return future.result()
+
+        try:
+            tile = self._load(z, x, y)
+            future.set_result(tile)
+            return tile
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def get_many(self, keys):
+        """جلب عدة بلاطات بالتوازي؛ يرجع قاموساً من (z, x, y) إلى الصورة أو None"""
+        futures = {key: self._executor.submit(self.get, *key) for key in keys}
+        return {key: future.result() for key, future in futures.items()}
+
+    def _load(self, z, x, y):
+        from PIL import Image
+
+        path = self.path(z, x, y)
+        if os.path.exists(path):
+            with self._lock:
+                self.hits += 1
+            with open(path, "rb") as f:
+                data = f.read()
+        else:
+            data = self._download(z, x, y)
+            if data is None:
+                # البلاطة الناقصة تُتذكر أيضاً حتى لا يُعاد طلبها في كل تصدير
+                self._remember((z, x, y), None)
+                with self._lock:
+                    self.missing += 1
+                return None
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # كتابة ذرية حتى لا تقرأ عملية أخرى بلاطة نصف مكتوبة
+            partial = f"{path}.{threading.get_ident()}.part"
+            with open(partial, "wb") as f:
+                f.write(data)
+            os.replace(partial, path)
+
+        tile = Image.open(io.BytesIO(data)).convert("RGB")
+        self._remember((z, x, y), tile)
+        return tile
+
+    def _remember(self, key, tile):
+        with self._lock:
+            self._memory[key] = tile
+            while len(self._memory) > self.memory_tiles:
+                self._memory.popitem(last=False)
+
+    def _download(self, z, x, y):
+        if not self.url:
+            return None
+        if self.bucket is not None:
+            self.bucket.acquire()
+        try:
+            with metrics.span("tile_download"):
+                response = self.session.get(self.url.format(z=z, x=x, y=y), timeout=self.timeout)
+                response.raise_for_status()
+        except Exception as e:
+            print(f"Error downloading tile {z}/{x}/{y}: {e}", file=sys.stderr)
+            return None
+        with self._lock:
+            self.downloads += 1
+        return response.content
+
+    def stats(self):
+        return {"hits": self.hits, "downloads": self.downloads, "missing": self.missing,
+                "memory_tiles": len(self._memory)}
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        if self._session is not None:
+            self._session.close()
+
+
+class StaticMapRenderer:
+    """تصدير خريطة PNG بدون متصفح: تركيب البلاطات من الذاكرة المؤقتة ثم رسم العلامات فوقها"""
+
+    def __init__(self, tiles, width=800, height=600, attribution=ATTRIBUTIONS["openstreetmap"],
+                 marker_radius=8, max_zoom=18):
+        self.tiles = tiles
+        self.width = width
+        self.height = height
+        self.attribution = attribution
+        self.marker_radius = marker_radius
+        self.max_zoom = max_zoom
+
+    def fit_zoom(self, points, padding=40):
+        """أكبر مستوى تكبير تظهر فيه كل النقاط داخل الصورة"""
+        for zoom in range(self.max_zoom, -1, -1):
+            pixels = [world_pixel(latitude, longitude, zoom) for latitude, longitude in points]
+            xs, ys = [x for x, _ in pixels], [y for _, y in pixels]
+            if max(xs) - min(xs) <= self.width - 2 * padding and max(ys) - min(ys) <= self.height - 2 * padding:
+                return zoom
+        return 0
+
+    def render(self, points, zoom=None):
+        """صورة PIL للخريطة؛ المركز منتصف النقاط والتكبير يُحسب تلقائياً إن لم يُحدد"""
+        from PIL import Image, ImageDraw, ImageFont
+
+        points = [(float(latitude), float(longitude)) for latitude, longitude in points]
+        if not points:
+            raise ValueError("No points to draw")
+        if zoom is None:
+            zoom = 12 if len(points) == 1 else self.fit_zoom(points)
+
+        pixels = [world_pixel(latitude, longitude, zoom) for latitude, longitude in points]
+        center_x = (min(x for x, _ in pixels) + max(x for x, _ in pixels)) / 2
+        center_y = (min(y for _, y in pixels) + max(y for _, y in pixels)) / 2
+        left = center_x - self.width / 2
+        top = center_y - self.height / 2
+
+        tiles_per_side = 2 ** zoom
+        first_x, last_x = int(left // TILE_SIZE), int((left + self.width) // TILE_SIZE)
+        first_y = max(0, int(top // TILE_SIZE))
+        last_y = min(tiles_per_side - 1, int((top + self.height) // TILE_SIZE))
+        # الطول الجغرافي يلتف حول العالم، العرض لا
+        placements = [(tile_x, tile_y, (zoom, tile_x % tiles_per_side, tile_y))
+                      for tile_x in range(first_x, last_x + 1) for tile_y in range(first_y, last_y + 1)]
+        tiles = self.tiles.get_many({key for _, _, key in placements})
+
+        image = Image.new("RGB", (self.width, self.height), (221, 221, 221))
+        for tile_x, tile_y, key in placements:
+            tile = tiles.get(key)
+            if tile is not None:
+                image.paste(tile, (int(round(tile_x * TILE_SIZE - left)), int(round(tile_y * TILE_SIZE - top))))
+
+        draw = ImageDraw.Draw(image)
+        radius = self.marker_radius
+        for x, y in pixels:
+            x, y = x - left, y - top
+            draw.ellipse((x - radius, y - radius, x + radius, y + radius),
+                         fill=(220, 53, 69), outline=(255, 255, 255), width=2)
+        if self.attribution:
+            try:
+                font = ImageFont.load_default(size=11)
+            except TypeError:  # Pillow < 10.1: خط نقطي بحجم ثابت
+                font = ImageFont.load_default()
+            text_width = draw.textlength(self.attribution, font=font)
+            box = (self.width - text_width - 8, self.height - 16, self.width, self.height)
+            draw.rectangle(box, fill=(255, 255, 255))
+            draw.text((box[0] + 4, box[1] + 2), self.attribution, fill=(51, 51, 51), font=font)
+        return image
+
+    def export(self, points, path, zoom=None):
+        """حفظ الخريطة كملف PNG وإرجاع مساره"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with metrics.span("map_render"):
+            image = self.render(points, zoom)
+        with metrics.span("map_write"):
+            image.save(path, "PNG", optimize=False)
+        return path
+
+    def export_many(self, jobs, max_workers=4):
+        """تصدير عدة خرائط بالتوازي؛ jobs قائمة (نقاط، مسار)، والنتيجة لكل مهمة المسار أو الاستثناء"""
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="export") as executor:
+            futures = [executor.submit(self.export, points, path) for points, path in jobs]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+def create_renderer(provider="openstreetmap", directory="tile_cache", url=None, offline=False, rate=None, **kwargs):
+    """مُصدِّر بذاكرة بلاطات منفصلة لكل مزود؛ url يستبدل رابط المزود (مثل خادم بلاطات محلي)
+
+    rate حد التنزيل بالبلاطات في الثانية؛ افتراضياً حد المزود في TILE_RATES.
+    """
+    if provider not in TILE_URLS:
+        raise ValueError(f"Unknown map provider: {provider} (available: {', '.join(sorted(TILE_URLS))})")
+    tiles = TileCache(os.path.join(directory, provider), url=None if offline else url or TILE_URLS[provider],
+                      rate=rate)
+    return StaticMapRenderer(tiles, attribution=ATTRIBUTIONS.get(provider), **kwargs)
+
+
+def parse_point(value):
+    latitude, longitude = value.split(",")
+    return float(latitude), float(longitude)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="تصدير خرائط PNG من ذاكرة بلاطات محلية بدون متصفح")
+    parser.add_argument("points", nargs="*", type=parse_point, help="نقاط بصيغة LAT,LON (كلها على خريطة واحدة)")
+    parser.add_argument("-o", "--output", default="location_map.png", help="ملف PNG أو مجلد الإخراج مع --each")
+    parser.add_argument("--results", help="ملف نتائج bulk_lookup (CSV أو JSONL) بدلاً من النقاط")
+    parser.add_argument("--each", action="store_true", help="خريطة مستقلة لكل صف من --results (بالتوازي)")
+    parser.add_argument("--provider", choices=sorted(TILE_URLS), default="openstreetmap")
+    parser.add_argument("--tiles-dir", default="tile_cache", help="مجلد ذاكرة البلاطات")
+    parser.add_argument("--tile-url", help="رابط بلاطات بديل بصيغة .../{z}/{x}/{y}.png (مثل خادم محلي)")
+    parser.add_argument("--offline", action="store_true", help="استخدام البلاطات الموجودة في المجلد فقط")
+    parser.add_argument("--tile-rate", type=float,
+                        help="الحد الأقصى لتنزيل البلاطات في الثانية (افتراضياً 2 لـ OpenStreetMap)")
+    parser.add_argument("--zoom", type=int, help="مستوى التكبير (يُحسب تلقائياً إن لم يُحدد)")
+    parser.add_argument("--size", default="800x600", help="أبعاد الصورة WIDTHxHEIGHT")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="عدد الخرائط المصدرة بالتوازي")
+    args = parser.parse_args(argv)
+
+    width, height = (int(value) for value in args.size.lower().split("x"))
+    renderer = create_renderer(args.provider, args.tiles_dir, args.tile_url, args.offline, args.tile_rate,
+                               width=width, height=height)
+    points = list(args.points)
+    rows = []
+    if args.results:
+        rows = [row for row in read_rows(args.results) if row.get("latitude") not in (None, "")]
+        points += [(row["latitude"], row["longitude"]) for row in rows]
+    if not points:
+        parser.error("no points given")
+
+    if args.each:
+        jobs = [([(row["latitude"], row["longitude"])],
+                 os.path.join(args.output, f"map_{row.get('ip_address') or index}.png".replace(":", "_")))
+                for index, row in enumerate(rows)]
+        results = renderer.export_many(jobs, max_workers=max(1, args.workers))
+        failed = [result for result in results if isinstance(result, Exception)]
+        for error in failed:
+            print(f"Error exporting map: {error}", file=sys.stderr)
+        print(f"{len(results) - len(failed)} maps written to {args.output}", file=sys.stderr)
+    else:
+        renderer.export(points, args.output, zoom=args.zoom)
+        print(f"map written to {args.output}", file=sys.stderr)
+    print(f"tiles: {renderer.tiles.stats()}", file=sys.stderr)
+    renderer.tiles.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
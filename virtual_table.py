@@ -0,0 +1,273 @@
+import tkinter as tk
+from tkinter import ttk
+
+import numpy as np
+
+from geo_batch import ENCODED_COLUMNS
+from ip_array import IpArray
+
+# أعمدة جدول نتائج الدفعة: (العمود في GeoResultBatch، العنوان، العرض)
+BATCH_COLUMNS = (
+    ("ip_address", "العنوان", 130),
+    ("country", "الدولة", 110),
+    ("region", "المنطقة", 110),
+    ("city", "المدينة", 110),
+    ("latitude", "خط العرض", 80),
+    ("longitude", "خط الطول", 80),
+    ("isp", "مزود الخدمة", 150),
+    ("provider", "المصدر", 70),
+)
+ENCODED = dict(ENCODED_COLUMNS)
+# الأعمدة النصية التي يبحث فيها مربع التصفية
+SEARCH_COLUMNS = ("country", "region", "city", "isp")
+
+
+def compute_order(columns, values, sort_column=None, descending=False, search=""):
+    """فهارس الصفوف الظاهرة بعد التصفية والترتيب (تعمل في خيط خلفي على نسخة من الأعمدة)
+
+    التصفية تطابق النص مع قيم القواميس (آلاف القيم) ثم تختار الرموز بـ isin، والترتيب النصي
+    يرتب القاموس مرة واحدة ثم يرتب الصفوف حسب رتبة رمزها؛ لا يُفك أي صف.
+    """
+    rows = len(columns["latitude"])
+    if search:
+        needle = search.casefold()
+        mask = np.zeros(rows, bool)
+        for name in SEARCH_COLUMNS:
+            codes = [code for code, value in enumerate(values[name]) if value and needle in value.casefold()]
+            if codes:
+                mask |= np.isin(columns[name], codes)
+        selected = np.flatnonzero(mask)
+    else:
+        selected = np.arange(rows)
+    if sort_column is None:
+        return selected
+
+    sign = -1 if descending else 1
+    if sort_column == "ip_address":
+        order = np.lexsort((columns["ip_low"][selected], columns["ip_high"][selected],
+                            columns["ip_version"][selected]))
+        if descending:
+            order = order[::-1]
+    elif sort_column in ENCODED:
+        names = values[sort_column]
+        ranked = sorted(range(1, len(names)), key=lambda code: names[code].casefold())
+        rank = np.zeros(len(names), np.int64)
+        rank[ranked] = np.arange(len(ranked))
+        codes = columns[sort_column][selected]
+        key = rank[codes] * sign
+        # القيم الفارغة (الرمز 0) في آخر الجدول بأي اتجاه
+        key[codes == 0] = len(names)
+        order = np.argsort(key, kind="stable")
+    else:
+        key = columns[sort_column][selected].astype(np.float64) * sign
+        order = np.argsort(np.where(np.isnan(key), np.inf, key), kind="stable")
+    return selected[order]
+
+
+class BatchView:
+    """عرض GeoResultBatch للجدول: ترتيب وتصفية كمصفوفة فهارس فقط، وفك القيم للصفوف الظاهرة وحدها"""
+
+    def __init__(self, batch):
+        self.batch = batch
+        # None تعني كل الصفوف بترتيب وصولها
+        self.order = None
+        self.sort_column = None
+        self.descending = False
+        self.search = ""
+        self.columns = batch.columns
+
+    @property
+    def active(self):
+        return self.sort_column is not None or bool(self.search)
+
+    def refresh(self):
+        """قراءة الأعمدة بعد إضافة صفوف جديدة (في خيط Tk)"""
+        self.columns = self.batch.columns
+        if not self.active:
+            self.order = None
+
+    def snapshot(self):
+        """نسخة ثابتة من الأعمدة والقواميس لحساب الترتيب في الخلفية بينما تصل صفوف جديدة"""
+        values = {name: list(dictionary.values) for name, dictionary in self.batch.dictionaries.items()}
+        return self.columns, values
+
+    def __len__(self):
+        return len(self.columns["latitude"]) if self.order is None else len(self.order)
+
+    @property
+    def rows(self):
+        """عدد صفوف الدفعة كلها (قبل التصفية)"""
+        return len(self.columns["latitude"])
+
+    def index(self, position):
+        """رقم الصف في الدفعة للموضع الظاهر"""
+        return position if self.order is None else int(self.order[position])
+
+    def indices(self, start=0, stop=None):
+        """أرقام صفوف الدفعة لمجال من المواضع الظاهرة"""
+        stop = len(self) if stop is None else stop
+        return np.arange(start, stop) if self.order is None else self.order[start:stop]
+
+    def row(self, position):
+        """قيم الصف الظاهر كنصوص للعرض"""
+        index = self.index(position)
+        columns = self.columns
+        values = []
+        for name, _, _ in BATCH_COLUMNS:
+            if name == "ip_address":
+                ips = IpArray(columns["ip_version"], columns["ip_high"], columns["ip_low"])
+                values.append(ips.format(index) or "")
+            elif name in ENCODED:
+                values.append(self.batch.dictionaries[name].decode(columns[name][index]) or "")
+            else:
+                value = columns[name][index]
+                values.append("" if np.isnan(value) else f"{value:.4f}")
+        return values
+
+
+class VirtualTable(ttk.Frame):
+    """جدول افتراضي: عناصر Treeview بعدد الأسطر المرئية فقط تُعاد تعبئتها عند التمرير مهما كان عدد الصفوف
+
+    التحديد محفوظ كقناع على صفوف الدفعة (لا على العناصر) فيبقى صحيحاً بعد التمرير والترتيب والتصفية.
+    """
+
+    def __init__(self, master, columns, model=None, on_sort=None, on_select=None):
+        super().__init__(master)
+        self.model = model
+        self.on_select = on_select
+        self.first = 0
+        self.anchor = None
+        self.selected = np.zeros(0, bool)
+        self.slots = []
+        self.row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+
+        self.tree = ttk.Treeview(self, columns=[name for name, _, _ in columns], show="headings", selectmode="none")
+        for name, heading, width in columns:
+            self.tree.heading(name, text=heading, command=(lambda name=name: on_sort(name)) if on_sort else "")
+            self.tree.column(name, width=width, stretch=True)
+        self.tree.tag_configure("selected", background="#cce4ff")
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.on_scroll)
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+
+        self.tree.bind("<Configure>", lambda event: self.render())
+        self.tree.bind("<MouseWheel>", lambda event: self.scroll(-1 if event.delta > 0 else 1, "units", 3))
+        self.tree.bind("<Button-4>", lambda event: self.scroll(-1, "units", 3))
+        self.tree.bind("<Button-5>", lambda event: self.scroll(1, "units", 3))
+        self.tree.bind("<Button-1>", lambda event: self.click(event, "set"))
+        self.tree.bind("<Control-Button-1>", lambda event: self.click(event, "toggle"))
+        self.tree.bind("<Shift-Button-1>", lambda event: self.click(event, "range"))
+        self.tree.bind("<Prior>", lambda event: self.scroll(-1, "pages"))
+        self.tree.bind("<Next>", lambda event: self.scroll(1, "pages"))
+        self.tree.bind("<Home>", lambda event: self.scroll_to(0))
+        self.tree.bind("<End>", lambda event: self.scroll_to(len(self)))
+        self.tree.bind("<Control-a>", lambda event: self.select_all())
+
+    def __len__(self):
+        return len(self.model) if self.model is not None else 0
+
+    @property
+    def visible(self):
+        """عدد الأسطر التي تتسع لها مساحة الجدول الحالية (بعد سطر العناوين)"""
+        height = self.tree.winfo_height()
+        return max(1, height // self.row_height - 1)
+
+    def set_model(self, model):
+        self.model = model
+        self.first = 0
+        self.anchor = None
+        self.selected = np.zeros(model.rows if model is not None else 0, bool)
+        self.render()
+
+    def render(self):
+        """تعبئة العناصر الظاهرة من النموذج وتحديث شريط التمرير"""
+        visible = self.visible
+        while len(self.slots) < visible:
+            self.slots.append(self.tree.insert("", "end", iid=str(len(self.slots))))
+        while len(self.slots) > visible:
+            self.tree.delete(self.slots.pop())
+        if self.model is not None and len(self.selected) < self.model.rows:
+            self.selected = np.concatenate([self.selected, np.zeros(self.model.rows - len(self.selected), bool)])
+
+        total = len(self)
+        self.first = max(0, min(self.first, total - visible))
+        for slot, item in enumerate(self.slots):
+            position = self.first + slot
+            if position < total:
+                tags = ("selected",) if self.selected[self.model.index(position)] else ()
+                self.tree.item(item, values=self.model.row(position), tags=tags)
+            else:
+                self.tree.item(item, values=(), tags=())
+        if total:
+            self.scrollbar.set(self.first / total, min(1.0, (self.first + visible) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def on_scroll(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * len(self)))
+        else:
+            self.scroll(int(amount), unit)
+
+    def scroll(self, amount, unit="units", step=1):
+        self.scroll_to(self.first + amount * (self.visible if unit == "pages" else step))
+        return "break"
+
+    def scroll_to(self, position):
+        self.first = position
+        self.render()
+        return "break"
+
+    def position_at(self, y):
+        """الموضع الظاهر تحت مؤشر الفأرة أو None"""
+        item = self.tree.identify_row(y)
+        if not item:
+            return None
+        position = self.first + int(item)
+        return position if position < len(self) else None
+
+    def click(self, event, mode):
+        # النقر على العناوين يبقى لأمر الترتيب
+        if self.tree.identify_region(event.x, event.y) == "heading":
+            return None
+        position = self.position_at(event.y)
+        if position is None:
+            return "break"
+        index = self.model.index(position)
+        if mode == "toggle":
+            self.selected[index] = not self.selected[index]
+            self.anchor = position
+        elif mode == "range" and self.anchor is not None:
+            self.selected[:] = False
+            start, stop = sorted((self.anchor, position))
+            self.selected[self.model.indices(start, stop + 1)] = True
+        else:
+            self.selected[:] = False
+            self.selected[index] = True
+            self.anchor = position
+        self.tree.focus_set()
+        self.selection_changed()
+        return "break"
+
+    def select_all(self):
+        """تحديد كل الصفوف الظاهرة بعد التصفية"""
+        if self.model is not None:
+            self.selected[self.model.indices()] = True
+            self.selection_changed()
+        return "break"
+
+    def clear_selection(self):
+        self.selected[:] = False
+        self.anchor = None
+        self.selection_changed()
+
+    def selection_changed(self):
+        self.render()
+        if self.on_select is not None:
+            self.on_select(int(self.selected.sum()))
+
+    def selected_indices(self):
+        """أرقام صفوف الدفعة المحددة"""
+        return np.flatnonzero(self.selected)
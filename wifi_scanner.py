@@ -0,0 +1,197 @@
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from collections import deque
+
+
+def network(ssid, bssid, signal, channel):
+    """سجل شبكة واحدة في لقطة المسح"""
+    return {"ssid": ssid or "", "bssid": bssid, "signal": signal, "channel": channel}
+
+
+class CellScanSource:
+    """مسح حقيقي عبر مكتبة wifi (Linux، يحتاج عادة صلاحيات root)"""
+
+    def __init__(self, interface="wlan0"):
+        self.interface = interface
+
+    def scan(self):
+        from wifi import Cell
+        return [network(cell.ssid, cell.address, cell.signal, cell.channel) for cell in Cell.all(self.interface)]
+
+
+class FakeScanSource:
+    """شبكات وهمية بإشارات تتغير عشوائياً (للتجربة على أجهزة بلا Wi-Fi)"""
+
+    def __init__(self, networks=8, seed=None):
+        self.random = random.Random(seed)
+        self.networks = {}
+        for index in range(networks):
+            self._add(index)
+        self.next_index = networks
+
+    def _add(self, index):
+        bssid = "02:00:00:00:{:02x}:{:02x}".format(index // 256 % 256, index % 256)
+        self.networks[bssid] = network(f"fake-{index}", bssid, self.random.randint(-90, -35),
+                                       self.random.choice((1, 6, 11, 36, 44, 149)))
+
+    def scan(self):
+        for record in self.networks.values():
+            record["signal"] = max(-100, min(-20, record["signal"] + self.random.randint(-4, 4)))
+        # ظهور واختفاء شبكات من حين لآخر
+        if self.networks and self.random.random() < 0.1:
+            del self.networks[self.random.choice(list(self.networks))]
+        if self.random.random() < 0.1:
+            self._add(self.next_index)
+            self.next_index += 1
+        return [dict(record) for record in self.networks.values()]
+
+
+class ReplayScanSource:
+    """إعادة تشغيل لقطات مسجلة بصيغة JSON Lines (كما يحفظها WifiScanner.save)"""
+
+    def __init__(self, path, loop=True):
+        self.path = path
+        self.loop = loop
+        with open(path, encoding="utf-8") as f:
+            self.snapshots = [json.loads(line)["networks"] for line in f if line.strip()]
+        if not self.snapshots:
+            raise ValueError(f"No snapshots in {path}")
+        self.position = 0
+
+    def scan(self):
+        if self.position >= len(self.snapshots):
+            if not self.loop:
+                raise EOFError(f"Replay of {self.path} finished")
+            self.position = 0
+        snapshot = self.snapshots[self.position]
+        self.position += 1
+        return [dict(record) for record in snapshot]
+
+
+def make_source(spec):
+    """مصدر المسح من نص الإعداد: اسم واجهة (wlan0) أو fake أو replay:PATH"""
+    spec = (spec or "wlan0").strip()
+    if spec == "fake":
+        return FakeScanSource()
+    if spec.startswith("replay:"):
+        return ReplayScanSource(spec[len("replay:"):])
+    return CellScanSource(spec)
+
+
+def diff(previous, current):
+    """الفرق بين لقطتين حسب BSSID: (مضافة، متغيرة، محذوفة)"""
+    added = [bssid for bssid in current if bssid not in previous]
+    changed = [bssid for bssid in current if bssid in previous and current[bssid] != previous[bssid]]
+    removed = [bssid for bssid in previous if bssid not in current]
+    return added, changed, removed
+
+
+class WifiScanner:
+    """خيط مسح دوري واحد يحفظ آخر اللقطات في حلقة محدودة يقرأ منها الجدول والرسم معاً"""
+
+    def __init__(self, source, interval=5.0, history=120):
+        self.source = source
+        self.interval = interval
+        self.history = deque(maxlen=history)
+        self.version = 0
+        self.errors = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="wifi-scanner", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.scan_once()
+            except EOFError:
+                break
+            except Exception as e:
+                self.last_error = e
+                print(f"Error scanning Wi-Fi networks: {e}")
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def scan_once(self):
+        """مسح واحد وإضافته إلى السجل؛ يرجع اللقطة (الوقت، قاموس BSSID -> الشبكة)"""
+        # مسح واحد في كل مرة حتى لو طُلب يدوياً أثناء المسح الدوري
+        with self._scan_lock:
+            try:
+                networks = self.source.scan()
+            except Exception:
+                self.errors += 1
+                raise
+            snapshot = (time.time(), {record["bssid"]: record for record in networks})
+            with self._lock:
+                self.history.append(snapshot)
+                self.version += 1
+        return snapshot
+
+    def latest(self):
+        with self._lock:
+            return self.history[-1] if self.history else None
+
+    def snapshots(self):
+        with self._lock:
+            return list(self.history)
+
+    def series(self, bssids=None):
+        """سلاسل الإشارة عبر الزمن: BSSID -> (الأوقات، الإشارات) من اللقطات المحفوظة"""
+        series = {}
+        for timestamp, networks in self.snapshots():
+            for bssid, record in networks.items():
+                if bssids is None or bssid in bssids:
+                    times, signals = series.setdefault(bssid, ([], []))
+                    times.append(timestamp)
+                    signals.append(record["signal"])
+        return series
+
+    def save(self, path):
+        """حفظ اللقطات بصيغة JSON Lines قابلة لإعادة التشغيل عبر ReplayScanSource"""
+        with open(path, "w", encoding="utf-8") as f:
+            for timestamp, networks in self.snapshots():
+                f.write(json.dumps({"time": timestamp, "networks": list(networks.values())}, ensure_ascii=False) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="مسح دوري للشبكات اللاسلكية وتسجيل اللقطات")
+    parser.add_argument("--source", default="wlan0", help="واجهة لاسلكية أو fake أو replay:PATH")
+    parser.add_argument("--interval", type=float, default=5.0, help="الفاصل بين عمليات المسح بالثواني")
+    parser.add_argument("--count", type=int, default=10, help="عدد عمليات المسح")
+    parser.add_argument("-o", "--output", help="حفظ اللقطات بصيغة JSONL لإعادة تشغيلها لاحقاً")
+    args = parser.parse_args(argv)
+
+    scanner = WifiScanner(make_source(args.source), interval=args.interval, history=args.count)
+    for index in range(args.count):
+        timestamp, networks = scanner.scan_once()
+        strongest = max(networks.values(), key=lambda record: record["signal"], default=None)
+        print(f"{time.strftime('%H:%M:%S', time.localtime(timestamp))} {len(networks)} networks"
+              + (f", strongest {strongest['ssid']} ({strongest['signal']} dBm)" if strongest else ""))
+        if index + 1 < args.count:
+            time.sleep(args.interval)
+    if args.output:
+        scanner.save(args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,28 @@
-import requests
-import socket
 import webbrowser
 import os
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-from ip2geotools.databases.noncommercial import DbIpCity
-from geopy.geocoders import Nominatim
-import folium
 import json
-from wifi import Cell, Scheme
 import platform
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+import time
+
+# الوحدات الثقيلة (الخرائط، matplotlib، wifi، numpy، geopy، ip2geotools) تُحمَّل عند أول استخدام
+import metrics
+from geo_providers import build_provider
+from geo_service import GeoService
+from geo_result import IpLocation
+from gui_tasks import TaskRunner
+from privacy import get_policy
+from lookup_cache import GeoLookupCache
+from request_scheduler import INTERACTIVE, RequestScheduler
+from result_store import ResultStore, make_record, render_report
+from reverse_geocoder import ReverseGeocoder
+from wifi_scanner import WifiScanner, diff, make_source
+
+# عدد الشبكات الأقوى المرسومة في مخطط الإشارة عبر الزمن
+WIFI_PLOT_LINES = 8
+# أقصى عدد صفوف ينقلها كل فحص من البحث الجماعي إلى الجدول حتى لا تتجمد الواجهة
+BATCH_ROWS_PER_TICK = 20000
 
 class AdvancedGeoLocator:
     def __init__(self, master):
@@ -19,6 +30,47 @@ class AdvancedGeoLocator:
         master.title("أداة تحديد الموقع الجغرافي المتقدمة - v2.0")
         master.geometry("800x600")
         
+        # متغيرات التطبيق (يجب تحميل الإعدادات قبل بناء التبويبات)
+        self.last_location = None
+        self.last_ip = None
+        self.last_record = None
+        self.last_policy = None
+        self.settings = {
+            "privacy_level": "medium",
+            "map_provider": "openstreetmap",
+            "save_reports": True,
+            "report_folder": "reports",
+            "ip_database": "",
+            "gazetteer": "",
+            "providers": "dbip",
+            "cache_enabled": True,
+            "cache_prefix_aggregation": True,
+            "wifi_source": "wlan0",
+            "wifi_interval": 5.0,
+            "metrics_file": "",
+            "metrics_port": 0
+        }
+        self.load_settings()
+        self.online_geocoder = ReverseGeocoder("advanced_geo_locator")
+        # بحث الواجهة يتقدم على المهام الجماعية في الطابور، والحصة اليومية مشتركة معها عبر ملف الحصص
+        self.scheduler = RequestScheduler(default_priority=INTERACTIVE)
+        self.service = GeoService(user_agent="advanced_geo_locator", reverse_geocoder=self.online_geocoder,
+                                  scheduler=self.scheduler)
+        self.apply_ip_database()
+        self.apply_provider()
+        self.apply_cache()
+        self.apply_gazetteer()
+        self.apply_metrics()
+        
+        # العمليات البطيئة (الشبكة والمسح) تعمل في الخلفية حتى لا تتجمد الواجهة
+        self.tasks = TaskRunner(master, max_workers=4, on_change=self.update_progress)
+        self.lookup_seq = 0
+        self.shown_seq = 0
+        self.static_map = None
+        # سجل النتائج المنظم: الكتابة في خيط خلفي على دفعات
+        self.results = ResultStore("geolocator_results.sqlite")
+        master.protocol("WM_DELETE_WINDOW", self.on_close)
+        
         # تحذير قانوني
         self.create_warning_frame()
         
@@ -29,9 +81,17 @@ class AdvancedGeoLocator:
         self.tab_basic = ttk.Frame(self.notebook)
         self.create_basic_tab()
         
-        # تبويب الشبكات اللاسلكية
+        # تبويب الشبكات اللاسلكية (يُبنى عند فتحه أول مرة)
         self.tab_wifi = ttk.Frame(self.notebook)
-        self.create_wifi_tab()
+        self.wifi_tab_built = False
+        self.wifi_scanner = None
+        self.wifi_version = 0
+        self.wifi_shown = {}
+        
+        # تبويب نتائج الدفعة (يُبنى عند فتحه أول مرة)
+        self.tab_batch = ttk.Frame(self.notebook)
+        self.batch_tab_built = False
+        self.batch_job = None
         
         # تبويب الإعدادات
         self.tab_settings = ttk.Frame(self.notebook)
@@ -39,19 +99,10 @@ class AdvancedGeoLocator:
         
         self.notebook.add(self.tab_basic, text="تحديد الموقع")
         self.notebook.add(self.tab_wifi, text="الشبكات اللاسلكية")
+        self.notebook.add(self.tab_batch, text="نتائج الدفعة")
         self.notebook.add(self.tab_settings, text="الإعدادات")
         self.notebook.pack(expand=True, fill="both")
-        
-        # متغيرات التطبيق
-        self.last_location = None
-        self.last_ip = None
-        self.settings = {
-            "privacy_level": "medium",
-            "map_provider": "openstreetmap",
-            "save_reports": True,
-            "report_folder": "reports"
-        }
-        self.load_settings()
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
         
     def create_warning_frame(self):
         """إنشاء إطار التحذير القانوني"""
@@ -84,6 +135,14 @@ class AdvancedGeoLocator:
         self.current_ip_btn = ttk.Button(input_frame, text="موقعي الحالي", command=self.locate_current)
         self.current_ip_btn.grid(row=0, column=3, padx=5, pady=5)
         
+        # شريط التقدم وزر الإلغاء للعمليات الجارية في الخلفية
+        self.progress = ttk.Progressbar(input_frame, mode="indeterminate", length=150)
+        self.progress.grid(row=1, column=0, columnspan=2, sticky="ew", padx=5, pady=5)
+        self.progress_label = ttk.Label(input_frame, text="")
+        self.progress_label.grid(row=1, column=2, padx=5, pady=5)
+        self.cancel_btn = ttk.Button(input_frame, text="إلغاء", command=self.cancel_tasks, state="disabled")
+        self.cancel_btn.grid(row=1, column=3, padx=5, pady=5)
+        
         # إطار النتائج
         result_frame = ttk.LabelFrame(self.tab_basic, text="نتائج الموقع")
         result_frame.pack(fill="both", expand=True, padx=10, pady=5)
@@ -104,8 +163,19 @@ class AdvancedGeoLocator:
         self.export_map_btn = ttk.Button(map_frame, text="تصدير الخريطة", command=self.export_map, state="disabled")
         self.export_map_btn.pack(side="left", padx=5, pady=5)
     
+    def on_tab_changed(self, event):
+        """بناء تبويبي الشبكات اللاسلكية ونتائج الدفعة عند اختيارهما أول مرة"""
+        if not self.wifi_tab_built and self.notebook.select() == str(self.tab_wifi):
+            self.create_wifi_tab()
+        if not self.batch_tab_built and self.notebook.select() == str(self.tab_batch):
+            self.create_batch_tab()
+    
     def create_wifi_tab(self):
         """إنشاء واجهة تبويب الشبكات اللاسلكية"""
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        
+        self.wifi_tab_built = True
         # إطار معلومات الشبكة
         wifi_info_frame = ttk.LabelFrame(self.tab_wifi, text="معلومات الشبكات القريبة")
         wifi_info_frame.pack(fill="both", expand=True, padx=10, pady=5)
@@ -117,20 +187,70 @@ class AdvancedGeoLocator:
         self.wifi_tree.heading("Channel", text="القناة")
         self.wifi_tree.pack(fill="both", expand=True, padx=5, pady=5)
         
-        scan_btn = ttk.Button(wifi_info_frame, text="مسح الشبكات", command=self.scan_wifi_networks)
-        scan_btn.pack(pady=5)
+        self.scan_btn = ttk.Button(wifi_info_frame, text="بدء المسح الدوري", command=self.scan_wifi_networks)
+        self.scan_btn.pack(side="left", padx=5, pady=5)
+        self.wifi_status = ttk.Label(wifi_info_frame, text="")
+        self.wifi_status.pack(side="left", padx=5, pady=5)
         
-        # إطار تحليل الشبكة
+        # إطار تحليل الشبكة: الإشارة عبر الزمن، تُحدَّث الخطوط فقط فوق خلفية محفوظة (blitting)
         analysis_frame = ttk.LabelFrame(self.tab_wifi, text="تحليل الشبكة")
         analysis_frame.pack(fill="both", expand=True, padx=10, pady=5)
         
-        self.figure = plt.Figure(figsize=(6, 4), dpi=100)
+        self.figure = Figure(figsize=(6, 4), dpi=100)
         self.ax = self.figure.add_subplot(111)
+        self.ax.set_xlim(-self.wifi_window(), 0)
+        self.ax.set_ylim(-100, -20)
+        self.ax.set_xlabel('الثواني الماضية')
+        self.ax.set_ylabel('قوة الإشارة (dBm)')
+        self.ax.set_title('قوة إشارات الشبكات اللاسلكية عبر الزمن')
+        self.signal_lines = {}
+        self.plot_background = None
         self.canvas = FigureCanvasTkAgg(self.figure, analysis_frame)
+        self.canvas.mpl_connect("draw_event", self.capture_plot_background)
         self.canvas.get_tk_widget().pack(fill="both", expand=True)
         
-        analyze_btn = ttk.Button(analysis_frame, text="تحليل الإشارات", command=self.analyze_signals)
+        analyze_btn = ttk.Button(analysis_frame, text="مسح الآن", command=self.analyze_signals)
         analyze_btn.pack(pady=5)
+        
+        self.master.after(500, self.poll_wifi)
+    
+    def create_batch_tab(self):
+        """إنشاء تبويب نتائج الدفعة: جدول افتراضي يعرض الأسطر الظاهرة فقط مهما بلغ عدد النتائج"""
+        from geo_batch import GeoResultBatch
+        from virtual_table import BATCH_COLUMNS, BatchView, VirtualTable
+        
+        self.batch_tab_built = True
+        self.batch = GeoResultBatch()
+        self.batch_view = BatchView(self.batch)
+        self.batch_view_busy = False
+        self.batch_view_dirty = False
+        self.batch_search_after = None
+        self.batch_errors = 0
+        self.batch_selected = 0
+        
+        control_frame = ttk.LabelFrame(self.tab_batch, text="بحث جماعي")
+        control_frame.pack(fill="x", padx=10, pady=5)
+        
+        ttk.Button(control_frame, text="فتح ملف أهداف", command=self.start_batch).grid(row=0, column=0, padx=5, pady=5)
+        self.batch_stop_btn = ttk.Button(control_frame, text="إيقاف", command=self.stop_batch, state="disabled")
+        self.batch_stop_btn.grid(row=0, column=1, padx=5, pady=5)
+        self.batch_status = ttk.Label(control_frame, text="")
+        self.batch_status.grid(row=0, column=2, columnspan=3, padx=5, pady=5, sticky="w")
+        
+        ttk.Label(control_frame, text="تصفية:").grid(row=1, column=0, padx=5, pady=5)
+        self.batch_search = ttk.Entry(control_frame, width=30)
+        self.batch_search.grid(row=1, column=1, padx=5, pady=5)
+        self.batch_search.bind("<KeyRelease>", self.on_batch_search)
+        ttk.Button(control_frame, text="تحديد الكل", command=lambda: self.batch_table.select_all()).grid(row=1, column=2, padx=5, pady=5)
+        ttk.Button(control_frame, text="مسح التحديد", command=lambda: self.batch_table.clear_selection()).grid(row=1, column=3, padx=5, pady=5)
+        self.batch_map_btn = ttk.Button(control_frame, text="عرض المحدد على الخريطة", command=self.show_batch_map, state="disabled")
+        self.batch_map_btn.grid(row=1, column=4, padx=5, pady=5)
+        
+        table_frame = ttk.LabelFrame(self.tab_batch, text="النتائج (انقر العنوان للترتيب، Ctrl و Shift للتحديد المتعدد)")
+        table_frame.pack(fill="both", expand=True, padx=10, pady=5)
+        self.batch_table = VirtualTable(table_frame, BATCH_COLUMNS, self.batch_view,
+                                        on_sort=self.sort_batch, on_select=self.on_batch_select)
+        self.batch_table.pack(fill="both", expand=True, padx=5, pady=5)
     
     def create_settings_tab(self):
         """إنشاء واجهة تبويب الإعدادات"""
@@ -154,18 +274,73 @@ class AdvancedGeoLocator:
                                   values=["openstreetmap", "google", "mapbox"], state="readonly")
         map_options.grid(row=0, column=1, padx=5, pady=5)
         
+        # إعدادات الشبكات اللاسلكية
+        wifi_frame = ttk.LabelFrame(self.tab_settings, text="إعدادات المسح اللاسلكي")
+        wifi_frame.pack(fill="x", padx=10, pady=5)
+        
+        ttk.Label(wifi_frame, text="مصدر المسح (wlan0 أو fake أو replay:ملف):").grid(row=0, column=0, padx=5, pady=5)
+        self.wifi_source = tk.StringVar(value=self.settings["wifi_source"])
+        ttk.Entry(wifi_frame, textvariable=self.wifi_source, width=20).grid(row=0, column=1, padx=5, pady=5)
+        ttk.Label(wifi_frame, text="الفاصل (ثوانٍ):").grid(row=0, column=2, padx=5, pady=5)
+        self.wifi_interval = tk.DoubleVar(value=self.settings["wifi_interval"])
+        ttk.Spinbox(wifi_frame, from_=1, to=300, textvariable=self.wifi_interval, width=6).grid(row=0, column=3, padx=5, pady=5)
+        
         # إعدادات التقارير
         report_frame = ttk.LabelFrame(self.tab_settings, text="إعدادات التقارير")
         report_frame.pack(fill="x", padx=10, pady=5)
         
         self.save_reports = tk.BooleanVar(value=self.settings["save_reports"])
-        ttk.Checkbutton(report_frame, text="حفظ التقارير تلقائياً", variable=self.save_reports).grid(row=0, column=0, padx=5, pady=5)
+        ttk.Checkbutton(report_frame, text="حفظ النتائج في السجل تلقائياً", variable=self.save_reports).grid(row=0, column=0, padx=5, pady=5)
+        ttk.Button(report_frame, text="تصدير السجل...", command=self.export_results).grid(row=0, column=2, padx=5, pady=5)
         
         ttk.Label(report_frame, text="مسار حفظ التقارير:").grid(row=1, column=0, padx=5, pady=5)
         self.report_folder = tk.StringVar(value=self.settings["report_folder"])
         ttk.Entry(report_frame, textvariable=self.report_folder, width=30).grid(row=1, column=1, padx=5, pady=5)
         ttk.Button(report_frame, text="استعراض...", command=self.browse_folder).grid(row=1, column=2, padx=5, pady=5)
         
+        # إعدادات مصدر البيانات
+        data_frame = ttk.LabelFrame(self.tab_settings, text="مصدر بيانات الموقع")
+        data_frame.pack(fill="x", padx=10, pady=5)
+        
+        ttk.Label(data_frame, text="قاعدة بيانات IP المحلية:").grid(row=0, column=0, padx=5, pady=5)
+        self.ip_database = tk.StringVar(value=self.settings["ip_database"])
+        ttk.Entry(data_frame, textvariable=self.ip_database, width=30).grid(row=0, column=1, padx=5, pady=5)
+        ttk.Button(data_frame, text="استعراض...", command=self.browse_ip_database).grid(row=0, column=2, padx=5, pady=5)
+        
+        ttk.Label(data_frame, text="ملف الأماكن (GeoNames) للعناوين:").grid(row=3, column=0, padx=5, pady=5)
+        self.gazetteer = tk.StringVar(value=self.settings["gazetteer"])
+        ttk.Entry(data_frame, textvariable=self.gazetteer, width=30).grid(row=3, column=1, padx=5, pady=5)
+        ttk.Button(data_frame, text="استعراض...", command=self.browse_gazetteer).grid(row=3, column=2, padx=5, pady=5)
+        
+        ttk.Label(data_frame, text="المزودون (مثل dbip,ipapi):").grid(row=4, column=0, padx=5, pady=5)
+        self.providers = tk.StringVar(value=self.settings["providers"])
+        ttk.Entry(data_frame, textvariable=self.providers, width=30).grid(row=4, column=1, padx=5, pady=5)
+        
+        self.cache_enabled = tk.BooleanVar(value=self.settings["cache_enabled"])
+        ttk.Checkbutton(data_frame, text="تخزين النتائج مؤقتاً", variable=self.cache_enabled).grid(row=1, column=0, padx=5, pady=5)
+        self.cache_prefix_aggregation = tk.BooleanVar(value=self.settings["cache_prefix_aggregation"])
+        ttk.Checkbutton(data_frame, text="تجميع حسب الشبكة (/24، /48)", variable=self.cache_prefix_aggregation).grid(row=1, column=1, padx=5, pady=5)
+        ttk.Button(data_frame, text="مسح الذاكرة المؤقتة", command=self.clear_cache).grid(row=1, column=2, padx=5, pady=5)
+        
+        self.cache_stats_label = ttk.Label(data_frame, text="")
+        self.cache_stats_label.grid(row=2, column=0, columnspan=3, padx=5, pady=5)
+        self.update_cache_stats()
+        
+        # مقاييس الأداء
+        metrics_frame = ttk.LabelFrame(self.tab_settings, text="مقاييس الأداء (Prometheus)")
+        metrics_frame.pack(fill="x", padx=10, pady=5)
+        
+        ttk.Label(metrics_frame, text="ملف المقاييس:").grid(row=0, column=0, padx=5, pady=5)
+        self.metrics_file = tk.StringVar(value=self.settings["metrics_file"])
+        ttk.Entry(metrics_frame, textvariable=self.metrics_file, width=30).grid(row=0, column=1, padx=5, pady=5)
+        ttk.Label(metrics_frame, text="منفذ /metrics (0 للتعطيل):").grid(row=0, column=2, padx=5, pady=5)
+        self.metrics_port = tk.IntVar(value=self.settings["metrics_port"])
+        ttk.Spinbox(metrics_frame, from_=0, to=65535, textvariable=self.metrics_port, width=7).grid(row=0, column=3, padx=5, pady=5)
+        
+        self.metrics_label = ttk.Label(metrics_frame, text="", justify="left")
+        self.metrics_label.grid(row=1, column=0, columnspan=4, padx=5, pady=5, sticky="w")
+        ttk.Button(metrics_frame, text="تحديث", command=self.update_metrics_summary).grid(row=2, column=0, padx=5, pady=5)
+        
         # زر حفظ الإعدادات
         save_btn = ttk.Button(self.tab_settings, text="حفظ الإعدادات", command=self.save_settings)
         save_btn.pack(pady=10)
@@ -176,6 +351,124 @@ class AdvancedGeoLocator:
         if folder:
             self.report_folder.set(folder)
     
+    def export_results(self):
+        """تصدير سجل النتائج كاملاً إلى CSV أو Parquet (في الخلفية)"""
+        path = filedialog.asksaveasfilename(defaultextension=".csv",
+                                            filetypes=[("CSV", "*.csv"), ("Parquet", "*.parquet")])
+        if not path:
+            return
+        self.results.flush()
+        self.tasks.submit(
+            ("export_results", path), self.results.export, path,
+            on_success=lambda count: messagebox.showinfo("تم", f"تم تصدير {count} نتيجة إلى:\n{path}"),
+            on_error=lambda e: messagebox.showerror("خطأ", f"تعذر تصدير السجل: {str(e)}")
+        )
+    
+    def browse_ip_database(self):
+        """اختيار ملف قاعدة بيانات نطاقات IP المحلية"""
+        path = filedialog.askopenfilename(filetypes=[("IP range database", "*.bin"), ("All files", "*.*")])
+        if path:
+            self.ip_database.set(path)
+    
+    def apply_ip_database(self):
+        """استخدام قاعدة البيانات المحلية إن حُددت وإلا المزود البعيد"""
+        try:
+            self.service.set_ip_database(self.settings["ip_database"] or None)
+        except Exception as e:
+            self.service.set_ip_database(None)
+            messagebox.showerror("خطأ", f"تعذر فتح قاعدة بيانات IP المحلية: {str(e)}")
+    
+    def apply_provider(self):
+        """اختيار المزود البعيد؛ أكثر من مزود يعني طلبات متحوطة وأول إجابة صالحة"""
+        try:
+            self.service.set_provider(build_provider(self.settings["providers"]))
+        except Exception as e:
+            self.service.set_provider(build_provider("dbip"))
+            messagebox.showerror("خطأ", f"إعداد المزودين غير صالح: {str(e)}")
+    
+    def browse_gazetteer(self):
+        """اختيار ملف الأماكن للبحث العكسي المحلي"""
+        path = filedialog.askopenfilename(filetypes=[("GeoNames", "*.txt *.csv *.npz"), ("All files", "*.*")])
+        if path:
+            self.gazetteer.set(path)
+    
+    def apply_gazetteer(self):
+        """البحث العكسي محلياً من ملف الأماكن إن حُدد وإلا عبر Nominatim"""
+        try:
+            if self.settings["gazetteer"]:
+                from gazetteer import OfflineReverseGeocoder
+                self.service.reverse_geocoder = OfflineReverseGeocoder(self.settings["gazetteer"])
+            else:
+                self.service.reverse_geocoder = self.online_geocoder
+        except Exception as e:
+            self.service.reverse_geocoder = self.online_geocoder
+            messagebox.showerror("خطأ", f"تعذر تحميل ملف الأماكن: {str(e)}")
+    
+    def apply_cache(self):
+        """تفعيل أو تعطيل الذاكرة المؤقتة الدائمة لنتائج تحديد الموقع"""
+        try:
+            if self.settings["cache_enabled"]:
+                self.service.set_cache(GeoLookupCache(
+                    "geolocator_cache.sqlite", aggregate=self.settings["cache_prefix_aggregation"]))
+                self.online_geocoder.set_cache("geolocator_cache.sqlite")
+            else:
+                self.service.set_cache(None)
+                self.online_geocoder.set_cache(None)
+        except Exception as e:
+            self.service.set_cache(None)
+            self.online_geocoder.set_cache(None)
+            messagebox.showerror("خطأ", f"تعذر فتح الذاكرة المؤقتة: {str(e)}")
+    
+    def clear_cache(self):
+        """مسح نتائج الذاكرة المؤقتة"""
+        if self.service.cache is not None:
+            self.service.cache.clear()
+        if self.online_geocoder.cache is not None:
+            self.online_geocoder.cache.clear()
+        self.update_cache_stats()
+    
+    def update_cache_stats(self):
+        """عرض إحصاءات الذاكرة المؤقتة"""
+        if self.service.cache is None:
+            self.cache_stats_label.config(text="الذاكرة المؤقتة معطلة")
+            return
+        stats = self.service.cache.stats()
+        self.cache_stats_label.config(
+            text=f"المدخلات: {stats['entries']} | إصابات: {stats['hits']} | إخفاقات: {stats['misses']} "
+                 f"| نسبة الإصابة: {stats['hit_rate']:.0%}")
+    
+    def apply_metrics(self):
+        """تشغيل نقطة /metrics المحلية حسب الإعدادات (أو إيقافها)"""
+        port = int(self.settings["metrics_port"] or 0)
+        address = metrics.REGISTRY.address
+        if address is not None and address[1] == port:
+            return
+        metrics.REGISTRY.stop()
+        if port:
+            try:
+                metrics.REGISTRY.serve(port)
+            except OSError as e:
+                messagebox.showerror("خطأ", f"تعذر تشغيل نقطة المقاييس على المنفذ {port}: {str(e)}")
+    
+    def write_metrics(self):
+        """تحديث ملف المقاييس إن كان محدداً (آمن من أي خيط)"""
+        if self.settings["metrics_file"]:
+            try:
+                metrics.REGISTRY.write(self.settings["metrics_file"])
+            except Exception as e:
+                print(f"Error writing metrics: {e}")
+    
+    def update_metrics_summary(self):
+        """عرض زمن كل مرحلة (الوسيط و p95) وعدد مرات تنفيذها وأخطائها، ثم حالة الحصص والطوابير"""
+        lines = []
+        for stage, summary in sorted(metrics.REGISTRY.stage_summary().items()):
+            lines.append(f"{stage}: {summary['count']} مرة، أخطاء {summary['errors']}، "
+                         f"p50 {summary['p50'] * 1000:.0f}ms، p95 {summary['p95'] * 1000:.0f}ms")
+        scheduler_summary = self.scheduler.summary()
+        if scheduler_summary:
+            lines.append(scheduler_summary)
+        self.metrics_label.config(text="\n".join(lines) or "لا توجد قياسات بعد")
+    
     def load_settings(self):
         """تحميل الإعدادات من ملف"""
         try:
@@ -190,8 +483,24 @@ class AdvancedGeoLocator:
             "privacy_level": self.privacy_level.get(),
             "map_provider": self.map_provider.get(),
             "save_reports": self.save_reports.get(),
-            "report_folder": self.report_folder.get()
+            "report_folder": self.report_folder.get(),
+            "ip_database": self.ip_database.get(),
+            "gazetteer": self.gazetteer.get(),
+            "providers": self.providers.get(),
+            "cache_enabled": self.cache_enabled.get(),
+            "cache_prefix_aggregation": self.cache_prefix_aggregation.get(),
+            "wifi_source": self.wifi_source.get(),
+            "wifi_interval": self.wifi_interval.get(),
+            "metrics_file": self.metrics_file.get(),
+            "metrics_port": self.metrics_port.get()
         })
+        self.apply_ip_database()
+        self.apply_provider()
+        self.apply_cache()
+        self.apply_gazetteer()
+        self.apply_wifi_source()
+        self.apply_metrics()
+        self.update_cache_stats()
         
         try:
             with open('geolocator_settings.json', 'w') as f:
@@ -203,8 +512,7 @@ class AdvancedGeoLocator:
     def get_public_ip(self):
         """الحصول على عنوان IP العام"""
         try:
-            response = requests.get('https://api.ipify.org?format=json', timeout=5)
-            return response.json()['ip']
+            return self.service.get_public_ip()
         except Exception as e:
             messagebox.showerror("خطأ", f"تعذر الحصول على عنوان IP العام: {str(e)}")
             return None
@@ -212,58 +520,79 @@ class AdvancedGeoLocator:
     def get_ip_info(self, ip_or_domain):
         """الحصول على معلومات الموقع من عنوان IP أو النطاق"""
         try:
-            # إذا كان نطاق، نحوله إلى IP
-            if not ip_or_domain.replace('.', '').isdigit():
-                ip_or_domain = socket.gethostbyname(ip_or_domain)
-            
-            response = DbIpCity.get(ip_or_domain, api_key='free')
-            return response
+            return self.service.get_ip_info(ip_or_domain)
         except Exception as e:
             messagebox.showerror("خطأ", f"تعذر تحديد الموقع: {str(e)}")
             return None
     
-    def get_address_details(self, latitude, longitude):
-        """الحصول على تفاصيل العنوان من الإحداثيات"""
+    def get_address_details(self, location, policy=None):
+        """الحصول على تفاصيل العنوان حسب مستوى الخصوصية (بحث عكسي في المستوى المنخفض فقط)"""
         try:
-            geolocator = Nominatim(user_agent="advanced_geo_locator")
-            location = geolocator.reverse(f"{latitude}, {longitude}")
-            return location.address if location else "تفاصيل العنوان غير متوفرة"
+            return self.service.describe(location, policy)
         except Exception as e:
             return f"تعذر الحصول على تفاصيل العنوان: {str(e)}"
     
-    def create_map(self, latitude, longitude):
-        """إنشاء خريطة HTML باستخدام folium"""
+    def create_map(self, latitude, longitude, zoom=12):
+        """إنشاء خريطة HTML من القالب الأساسي المخزن لمزود الخريطة المختار"""
         try:
-            if self.map_provider.get() == "openstreetmap":
-                m = folium.Map(location=[latitude, longitude], zoom_start=12)
-            elif self.map_provider.get() == "google":
-                m = folium.Map(
-                    location=[latitude, longitude], 
-                    zoom_start=12,
-                    tiles="https://mt1.google.com/vt/lyrs=m&x={x}&y={y}&z={z}",
-                    attr="Google"
-                )
-            else:  # mapbox
-                m = folium.Map(
-                    location=[latitude, longitude],
-                    zoom_start=12,
-                    tiles="https://api.mapbox.com/styles/v1/mapbox/streets-v11/tiles/{z}/{x}/{y}?access_token=YOUR_MAPBOX_TOKEN",
-                    attr="Mapbox"
-                )
-            
-            folium.Marker(
-                [latitude, longitude],
-                popup=f"الموقع المقدر: {latitude}, {longitude}",
-                icon=folium.Icon(color='red')
-            ).add_to(m)
+            from map_builder import MapBuilder
             
+            builder = MapBuilder(self.map_provider.get(), cache_dir="map_cache")
+            builder.add(latitude, longitude, f"الموقع المقدر: {latitude}, {longitude}")
             map_file = os.path.join(self.settings["report_folder"], "location_map.html")
-            m.save(map_file)
-            return map_file
+            return builder.save(map_file, zoom_start=zoom)
         except Exception as e:
             messagebox.showerror("خطأ", f"تعذر إنشاء الخريطة: {str(e)}")
             return None
     
+    def update_progress(self, active):
+        """تحديث مؤشر التقدم حسب عدد العمليات الجارية"""
+        if not hasattr(self, "progress"):
+            return
+        if active:
+            self.progress.start(10)
+            self.progress_label.config(text=f"عمليات جارية: {active}")
+            self.cancel_btn.config(state="normal")
+        else:
+            self.progress.stop()
+            self.progress_label.config(text="")
+            self.cancel_btn.config(state="disabled")
+    
+    def on_close(self):
+        """إيقاف العمليات الخلفية وكتابة ما تبقى من النتائج قبل الإغلاق"""
+        if self.batch_job is not None:
+            self.batch_job["stop"].set()
+        self.tasks.close()
+        if self.wifi_scanner is not None:
+            self.wifi_scanner.stop()
+        self.results.close()
+        self.scheduler.close()
+        self.write_metrics()
+        metrics.REGISTRY.stop()
+        self.master.destroy()
+    
+    def cancel_tasks(self):
+        """إلغاء كل العمليات الجارية في الخلفية"""
+        self.tasks.cancel_all()
+        # الاستدعاءات المعلقة أُلغيت: لا نتيجة ستصل للبحث الجماعي أو لحساب ترتيب الجدول
+        if self.batch_job is not None:
+            self.stop_batch()
+            self.batch_job["done"] = True
+        if self.batch_tab_built:
+            self.batch_view_busy = False
+    
+    def lookup_target(self, target, privacy="medium"):
+        """تنفيذ سلسلة تحديد الموقع (تعمل في خيط خلفي دون لمس الواجهة)؛ ترجع السجل وتفصيل الزمن وسياسة الخصوصية
+
+        المراحل تُبنى من مستوى الخصوصية: المتوسط والمرتفع يتخطيان البحث العكسي ويقربان الإحداثيات.
+        """
+        policy = get_policy(privacy)
+        with metrics.trace() as trace:
+            location, all_ips = self.service.locate(target, policy)
+            address = self.get_address_details(location, policy)
+        self.write_metrics()
+        return make_record(location, target=target, address=address, all_ips=all_ips), trace.format(), policy
+    
     def locate_target(self):
         """تحديد الموقع بناء على المدخلات"""
         target = self.ip_entry.get().strip()
@@ -271,140 +600,433 @@ class AdvancedGeoLocator:
             messagebox.showerror("خطأ", "الرجاء إدخال عنوان IP أو نطاق")
             return
         
+        self.lookup_seq += 1
+        seq = self.lookup_seq
+        privacy = self.privacy_level.get()
+        self.tasks.submit(
+            ("locate", target, privacy), self.lookup_target, target, privacy,
+            on_success=lambda result: self.show_lookup_result(seq, *result),
+            on_error=lambda e: messagebox.showerror("خطأ", f"تعذر تحديد الموقع: {str(e)}")
+        )
+    
+    def show_lookup_result(self, seq, record, timing=None, policy=None):
+        """عرض نتيجة تحديد الموقع (النتائج الأقدم من المعروضة حالياً لا تستبدلها)"""
+        if seq < self.shown_seq:
+            return
+        self.shown_seq = seq
+        
         try:
-            self.last_ip = target if target.replace('.', '').isdigit() else socket.gethostbyname(target)
-            self.last_location = self.get_ip_info(target)
-            
-            if not self.last_location:
-                return
-            
-            address = self.get_address_details(self.last_location.latitude, self.last_location.longitude)
-            
-            info = (
-                f"⦿ عنوان IP: {self.last_location.ip_address}\n"
-                f"⦿ الدولة: {self.last_location.country}\n"
-                f"⦿ المنطقة: {self.last_location.region}\n"
-                f"⦿ المدينة: {self.last_location.city}\n"
-                f"⦿ الإحداثيات: {self.last_location.latitude}, {self.last_location.longitude}\n"
-                f"⦿ المنطقة الزمنية: {self.last_location.time_zone}\n"
-                f"⦿ مزود الخدمة: {getattr(self.last_location, 'isp', 'غير معروف')}\n\n"
-                f"⦿ العنوان المقدر:\n{address}"
-            )
+            self.last_record = record
+            self.last_location = IpLocation.from_dict(record)
+            # تكبير الخريطة يتبع المستوى الذي أُنتجت به النتيجة لا الإعداد الحالي
+            self.last_policy = policy or get_policy(None)
+            self.last_ip = self.last_location.ip_address
             
             self.result_text.delete(1.0, tk.END)
-            self.result_text.insert(tk.END, info)
+            self.result_text.insert(tk.END, render_report(record))
+            if timing:
+                self.result_text.insert(tk.END, f"\n\n⏱ {timing}")
             
             self.map_btn.config(state="normal")
             self.save_report_btn.config(state="normal")
             self.export_map_btn.config(state="normal")
+            self.update_cache_stats()
+            self.update_metrics_summary()
             
             if self.save_reports.get():
-                self.save_report()
+                self.results.add(record)
                 
         except Exception as e:
             messagebox.showerror("خطأ", f"حدث خطأ أثناء تحديد الموقع: {str(e)}")
     
     def locate_current(self):
         """تحديد الموقع الحالي للمستخدم"""
-        try:
-            current_ip = self.get_public_ip()
-            if not current_ip:
-                return
-            
-            self.ip_entry.delete(0, tk.END)
-            self.ip_entry.insert(0, current_ip)
-            self.locate_target()
-        except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ أثناء تحديد الموقع الحالي: {str(e)}")
+        self.tasks.submit(
+            "public_ip", self.service.get_public_ip,
+            on_success=self.locate_ip,
+            on_error=lambda e: messagebox.showerror("خطأ", f"تعذر الحصول على عنوان IP العام: {str(e)}")
+        )
+    
+    def locate_ip(self, ip):
+        """وضع العنوان في حقل الإدخال ثم تحديد موقعه"""
+        self.ip_entry.delete(0, tk.END)
+        self.ip_entry.insert(0, ip)
+        self.locate_target()
     
     def show_map(self):
         """عرض الخريطة في المتصفح"""
         if not self.last_location:
             return
         
-        map_file = self.create_map(self.last_location.latitude, self.last_location.longitude)
+        with metrics.trace() as trace:
+            map_file = self.create_map(self.last_location.latitude, self.last_location.longitude,
+                                       self.last_policy.zoom)
+        self.write_metrics()
         if map_file:
+            self.result_text.insert(tk.END, f"\n⏱ الخريطة: {trace.format()}")
             webbrowser.open(f"file://{os.path.abspath(map_file)}")
         else:
             messagebox.showerror("خطأ", "تعذر إنشاء الخريطة")
     
     def save_report(self):
-        """حفظ التقرير في ملف"""
-        if not self.last_location:
+        """حفظ تقرير نصي للنتيجة الحالية (نسخة مقروءة من السجل المخزن)"""
+        if not self.last_record:
             return
         
         try:
+            if not self.save_reports.get():
+                self.results.add(self.last_record)
             if not os.path.exists(self.settings["report_folder"]):
                 os.makedirs(self.settings["report_folder"])
             
+            created = time.localtime(self.last_record["created"])
             report_file = os.path.join(self.settings["report_folder"], 
-                                     f"geo_report_{self.last_ip}_{time.strftime('%Y%m%d_%H%M%S')}.txt")
+                                     f"geo_report_{self.last_ip}_{time.strftime('%Y%m%d_%H%M%S', created)}.txt".replace(":", "_"))
             
-            with open(report_file, 'w', encoding='utf-8') as f:
-                f.write(self.result_text.get(1.0, tk.END))
+            with metrics.span("report_write"), open(report_file, 'w', encoding='utf-8') as f:
+                f.write(render_report(self.last_record) + "\n")
             
             messagebox.showinfo("تم", f"تم حفظ التقرير في:\n{report_file}")
         except Exception as e:
             messagebox.showerror("خطأ", f"تعذر حفظ التقرير: {str(e)}")
     
     def export_map(self):
-        """تصدير الخريطة كصورة"""
+        """تصدير الخريطة كصورة PNG من ذاكرة البلاطات المحلية (في الخلفية)"""
         if not self.last_location:
             return
         
         try:
-            map_file = self.create_map(self.last_location.latitude, self.last_location.longitude)
-            if not map_file:
-                return
-                
-            # هنا يمكن إضافة كود لتحويل HTML إلى صورة باستخدام مكتبات مثل selenium
-            messagebox.showinfo("معلومة", "يجب تطوير هذه الوظيفة لتحويل الخريطة HTML إلى صورة")
+            provider = self.map_provider.get()
+            if self.static_map is None or self.static_map_provider != provider:
+                from static_map import create_renderer
+                self.static_map = create_renderer(provider, "tile_cache")
+                self.static_map_provider = provider
+            
+            image_file = os.path.join(self.settings["report_folder"], f"geo_map_{self.last_ip}.png".replace(":", "_"))
+            points = [(self.last_location.latitude, self.last_location.longitude)]
+            self.tasks.submit(
+                ("export_map", image_file), self.static_map.export, points, image_file, self.last_policy.zoom,
+                on_success=lambda path: messagebox.showinfo("تم", f"تم تصدير الخريطة إلى:\n{path}"),
+                on_error=lambda e: messagebox.showerror("خطأ", f"تعذر تصدير الخريطة: {str(e)}")
+            )
         except Exception as e:
             messagebox.showerror("خطأ", f"تعذر تصدير الخريطة: {str(e)}")
     
-    def scan_wifi_networks(self):
-        """مسح الشبكات اللاسلكية القريبة"""
-        try:
-            if platform.system() != "Linux":
+    def start_batch(self):
+        """تحديد مواقع ملف أهداف في الخلفية؛ النتائج تظهر في الجدول على دفعات أثناء التنفيذ"""
+        if self.batch_job is not None:
+            messagebox.showwarning("تحذير", "يوجد بحث جماعي جارٍ بالفعل")
+            return
+        path = filedialog.askopenfilename(filetypes=[("Targets", "*.txt *.csv"), ("All files", "*.*")])
+        if not path:
+            return
+        
+        import queue
+        import threading
+        from bulk_lookup import QueueResultWriter
+        from geo_batch import GeoResultBatch
+        from virtual_table import BatchView
+        
+        previous = self.batch_view
+        self.batch = GeoResultBatch()
+        self.batch_view = BatchView(self.batch)
+        self.batch_view.sort_column, self.batch_view.descending = previous.sort_column, previous.descending
+        self.batch_view.search = self.batch_search.get().strip()
+        self.batch_table.set_model(self.batch_view)
+        self.batch_errors = 0
+        self.batch_selected = 0
+        self.batch_map_btn.config(state="disabled")
+        
+        rows = queue.Queue()
+        job = self.batch_job = {"rows": rows, "stop": threading.Event(), "done": False, "stats": None}
+        self.batch_stop_btn.config(state="normal")
+        self.tasks.submit(
+            ("batch", path), self.run_batch, path, QueueResultWriter(rows, stop=job["stop"]),
+            self.privacy_level.get(),
+            on_success=lambda stats: self.finish_batch(job, stats),
+            on_error=lambda e: self.finish_batch(job, None, e)
+        )
+        self.update_batch_status()
+        self.master.after(100, lambda: self.poll_batch(job))
+    
+    def run_batch(self, path, writer, privacy="medium"):
+        """تنفيذ البحث الجماعي (في خيط خلفي) بأولوية منخفضة حتى يبقى البحث الفردي سريعاً"""
+        from bulk_lookup import iter_targets, run_bulk
+        from request_scheduler import BULK
+        
+        with open(path, encoding="utf-8") as source:
+            return run_bulk(self.service, iter_targets(source), writer, workers=8, priority=BULK,
+                            privacy=privacy)
+    
+    def stop_batch(self):
+        """إيقاف البحث الجماعي عند الدفعة التالية (النتائج الواصلة تبقى في الجدول)"""
+        if self.batch_job is not None:
+            self.batch_job["stop"].set()
+            self.batch_stop_btn.config(state="disabled")
+    
+    def finish_batch(self, job, stats, error=None):
+        """انتهاء البحث الجماعي؛ ما تبقى في الطابور يُنقل في الفحوص التالية"""
+        from concurrent.futures import CancelledError
+        
+        job["done"] = True
+        job["stats"] = stats
+        if error is not None and not isinstance(error, CancelledError):
+            messagebox.showerror("خطأ", f"تعذر إكمال البحث الجماعي: {str(error)}")
+    
+    def poll_batch(self, job):
+        """نقل الصفوف الواصلة إلى الأعمدة وتحديث الجدول، بحد أقصى لكل فحص"""
+        import queue
+        
+        if self.batch_job is not job:
+            return
+        added = 0
+        while added < BATCH_ROWS_PER_TICK:
+            try:
+                chunk = job["rows"].get_nowait()
+            except queue.Empty:
+                break
+            for row in chunk:
+                if row.get("error"):
+                    self.batch_errors += 1
+                else:
+                    self.batch.add(row)
+            added += len(chunk)
+        if added:
+            self.batch_view.refresh()
+            self.update_batch_view()
+        
+        if job["done"] and job["rows"].empty():
+            self.batch_job = None
+            self.batch_stop_btn.config(state="disabled")
+            self.update_batch_status(job["stats"])
+            self.update_metrics_summary()
+            return
+        self.master.after(100, lambda: self.poll_batch(job))
+    
+    def update_batch_status(self, stats=None):
+        text = (f"النتائج: {len(self.batch)}، الأخطاء: {self.batch_errors}، "
+                f"المعروض: {len(self.batch_view)}، المحدد: {self.batch_selected}")
+        if self.batch_job is not None:
+            text += " — جارٍ..."
+        elif stats is not None:
+            text += f" — اكتمل في {stats.elapsed:.1f} ثانية"
+        self.batch_status.config(text=text)
+    
+    def sort_batch(self, column):
+        """الترتيب حسب العمود (النقر مرة أخرى يعكس الاتجاه)"""
+        view = self.batch_view
+        if view.sort_column == column:
+            view.descending = not view.descending
+        else:
+            view.sort_column, view.descending = column, False
+        self.update_batch_view()
+    
+    def on_batch_search(self, event):
+        """تأجيل التصفية حتى يتوقف الكتابة قليلاً"""
+        if self.batch_search_after is not None:
+            self.master.after_cancel(self.batch_search_after)
+        self.batch_search_after = self.master.after(300, self.apply_batch_search)
+    
+    def apply_batch_search(self):
+        self.batch_search_after = None
+        self.batch_view.search = self.batch_search.get().strip()
+        self.update_batch_view()
+    
+    def update_batch_view(self):
+        """حساب ترتيب وتصفية الجدول في الخلفية (حساب واحد في كل مرة؛ التغييرات خلاله تُجمع في حساب تالٍ)"""
+        from virtual_table import compute_order
+        
+        view = self.batch_view
+        if not view.active:
+            view.order = None
+            self.batch_table.render()
+            self.update_batch_status()
+            return
+        if self.batch_view_busy:
+            self.batch_view_dirty = True
+            return
+        
+        self.batch_view_busy = True
+        self.batch_view_dirty = False
+        columns, values = view.snapshot()
+        settings = (view.sort_column, view.descending, view.search)
+        self.tasks.submit(
+            "batch_view", compute_order, columns, values, *settings,
+            on_success=lambda order: self.show_batch_view(view, order, settings),
+            on_error=lambda e: self.show_batch_view(view, None, settings, e)
+        )
+    
+    def show_batch_view(self, view, order, settings, error=None):
+        self.batch_view_busy = False
+        if error is not None:
+            messagebox.showerror("خطأ", f"تعذر ترتيب النتائج: {str(error)}")
+        elif view is self.batch_view and settings == (view.sort_column, view.descending, view.search):
+            view.order = order
+            self.batch_table.render()
+            self.update_batch_status()
+        if self.batch_view_dirty or view is not self.batch_view:
+            self.update_batch_view()
+    
+    def on_batch_select(self, count):
+        self.batch_selected = count
+        self.batch_map_btn.config(state="normal" if count else "disabled")
+        self.update_batch_status()
+    
+    def show_batch_map(self):
+        """عرض الصفوف المحددة فقط على الخريطة (تُبنى في الخلفية)"""
+        indices = self.batch_table.selected_indices()
+        if not len(indices):
+            return
+        columns = self.batch.columns
+        points = {name: columns[name][indices] for name in ("ip_version", "ip_high", "ip_low", "latitude", "longitude")}
+        map_file = os.path.join(self.settings["report_folder"], "batch_map.html")
+        self.tasks.submit(
+            ("batch_map", map_file), self.build_batch_map, self.map_provider.get(), points, map_file,
+            on_success=lambda path: webbrowser.open(f"file://{os.path.abspath(path)}"),
+            on_error=lambda e: messagebox.showerror("خطأ", f"تعذر إنشاء الخريطة: {str(e)}")
+        )
+    
+    def build_batch_map(self, provider, points, map_file):
+        """خريطة مجمعة لنقاط الصفوف المحددة (في خيط خلفي)"""
+        import numpy as np
+        from ip_array import IpArray
+        from map_builder import MapBuilder
+        
+        # الصفوف الفاشلة إحداثياتها NaN فلا تُرسم
+        located = np.flatnonzero(np.isfinite(points["latitude"]) & np.isfinite(points["longitude"]))
+        if not len(located):
+            raise ValueError("no located rows in the selection")
+        builder = MapBuilder(provider, mode="cluster", cache_dir="map_cache")
+        ips = IpArray(points["ip_version"], points["ip_high"], points["ip_low"])
+        for index in located.tolist():
+            builder.add(float(points["latitude"][index]), float(points["longitude"][index]), ips.format(index))
+        os.makedirs(os.path.dirname(map_file) or ".", exist_ok=True)
+        return builder.save(map_file)
+    
+    def apply_wifi_source(self):
+        """إعادة إنشاء الماسح عند الحاجة التالية بمصدر وفاصل الإعدادات الجديدة"""
+        if self.wifi_scanner is not None:
+            self.wifi_scanner.stop()
+            self.wifi_scanner = None
+            self.wifi_version = 0
+            self.wifi_shown = {}
+            if self.wifi_tab_built:
+                self.wifi_tree.delete(*self.wifi_tree.get_children())
+                self.scan_btn.config(text="بدء المسح الدوري")
+                self.ax.set_xlim(-self.wifi_window(), 0)
+                self.plot_background = None
+    
+    def wifi_window(self):
+        """مدة السجل المعروض في المخطط بالثواني"""
+        return float(self.settings["wifi_interval"]) * 120
+    
+    def get_wifi_scanner(self):
+        """إنشاء الماسح الدوري من الإعدادات عند أول استخدام"""
+        if self.wifi_scanner is None:
+            source = self.settings["wifi_source"]
+            if platform.system() != "Linux" and source != "fake" and not source.startswith("replay:"):
                 messagebox.showwarning("تحذير", "هذه الميزة تعمل بشكل كامل على أنظمة Linux فقط")
-                return
-            
-            self.wifi_tree.delete(*self.wifi_tree.get_children())
-            cells = Cell.all('wlan0')
-            
-            for cell in cells:
-                self.wifi_tree.insert("", "end", values=(
-                    cell.ssid,
-                    cell.address,
-                    cell.signal,
-                    cell.channel
-                ))
-        except Exception as e:
-            messagebox.showerror("خطأ", f"تعذر مسح الشبكات اللاسلكية: {str(e)}")
+                return None
+            try:
+                self.wifi_scanner = WifiScanner(make_source(source), interval=float(self.settings["wifi_interval"]))
+            except Exception as e:
+                messagebox.showerror("خطأ", f"تعذر تهيئة مصدر المسح: {str(e)}")
+                return None
+        return self.wifi_scanner
+    
+    def scan_wifi_networks(self):
+        """بدء أو إيقاف المسح الدوري للشبكات اللاسلكية القريبة"""
+        scanner = self.get_wifi_scanner()
+        if scanner is None:
+            return
+        if scanner.running:
+            scanner.stop()
+            self.scan_btn.config(text="بدء المسح الدوري")
+        else:
+            scanner.start()
+            self.scan_btn.config(text="إيقاف المسح الدوري")
     
     def analyze_signals(self):
-        """تحليل إشارات الشبكات اللاسلكية"""
+        """مسح واحد فوري (يعمل في الخلفية ويحدّث الجدول والمخطط معاً)"""
+        scanner = self.get_wifi_scanner()
+        if scanner is None:
+            return
+        self.tasks.submit(
+            "wifi_scan", scanner.scan_once,
+            on_error=lambda e: messagebox.showerror("خطأ", f"تعذر مسح الشبكات اللاسلكية: {str(e)}")
+        )
+    
+    def poll_wifi(self):
+        """عرض اللقطات الجديدة من الماسح (يعمل في خيط Tk عبر after)"""
+        scanner = self.wifi_scanner
         try:
-            if platform.system() != "Linux":
-                messagebox.showwarning("تحذير", "هذه الميزة تعمل بشكل كامل على أنظمة Linux فقط")
-                return
-            
-            cells = Cell.all('wlan0')
-            if not cells:
-                messagebox.showinfo("معلومة", "لم يتم العثور على شبكات لاسلكية")
-                return
-            
-            self.ax.clear()
+            if scanner is not None:
+                if scanner.version != self.wifi_version:
+                    self.wifi_version = scanner.version
+                    timestamp, networks = scanner.latest()
+                    self.show_wifi_networks(networks)
+                    self.plot_signals()
+                    self.wifi_status.config(
+                        text=f"آخر مسح: {time.strftime('%H:%M:%S', time.localtime(timestamp))} | الشبكات: {len(networks)}")
+                elif scanner.running and scanner.last_error is not None:
+                    self.wifi_status.config(text=f"تعذر المسح: {scanner.last_error}")
+        finally:
+            # خطأ في عرض لقطة واحدة لا يوقف تحديث العرض
+            self.master.after(500, self.poll_wifi)
+    
+    def show_wifi_networks(self, networks):
+        """تحديث الجدول بالفرق عن اللقطة السابقة فقط (إضافة وتعديل وحذف حسب BSSID)"""
+        added, changed, removed = diff(self.wifi_shown, networks)
+        if removed:
+            self.wifi_tree.delete(*removed)
+        for bssid in changed:
+            self.wifi_tree.item(bssid, values=self.wifi_row(networks[bssid]))
+        for bssid in added:
+            self.wifi_tree.insert("", "end", iid=bssid, values=self.wifi_row(networks[bssid]))
+        self.wifi_shown = networks
+    
+    def wifi_row(self, record):
+        return (record["ssid"] or "مخفي", record["bssid"], record["signal"], record["channel"])
+    
+    def capture_plot_background(self, event):
+        """حفظ خلفية المخطط بعد كل رسم كامل ثم رسم الخطوط فوقها"""
+        self.plot_background = self.canvas.copy_from_bbox(self.ax.bbox)
+        for line in self.signal_lines.values():
+            self.ax.draw_artist(line)
+    
+    def plot_signals(self):
+        """رسم قوة إشارات أقوى الشبكات عبر الزمن"""
+        try:
+            networks = self.wifi_shown
+            strongest = sorted(networks, key=lambda bssid: networks[bssid]["signal"], reverse=True)[:WIFI_PLOT_LINES]
+            series = self.wifi_scanner.series(set(strongest))
+            now = time.time()
             
-            ssids = [cell.ssid if cell.ssid else "مخفي" for cell in cells]
-            signals = [cell.signal for cell in cells]
+            redraw = set(strongest) != set(self.signal_lines) or self.plot_background is None
+            if set(strongest) != set(self.signal_lines):
+                # تغيرت مجموعة الشبكات المرسومة: رسم كامل مع وسيلة إيضاح جديدة (نادر)
+                for line in self.signal_lines.values():
+                    line.remove()
+                self.signal_lines = {
+                    bssid: self.ax.plot([], [], label=networks[bssid]["ssid"] or "مخفي", animated=True)[0]
+                    for bssid in strongest
+                }
+                if self.signal_lines:
+                    self.ax.legend(loc="upper left", fontsize=7)
+                elif self.ax.get_legend() is not None:
+                    self.ax.get_legend().remove()
             
-            self.ax.barh(ssids, signals, color='skyblue')
-            self.ax.set_xlabel('قوة الإشارة (dBm)')
-            self.ax.set_title('تحليل قوة إشارات الشبكات اللاسلكية')
+            for bssid, line in self.signal_lines.items():
+                times, signals = series.get(bssid, ([], []))
+                line.set_data([timestamp - now for timestamp in times], signals)
             
-            self.figure.tight_layout()
-            self.canvas.draw()
+            if redraw:
+                self.canvas.draw()
+                return
+            self.canvas.restore_region(self.plot_background)
+            for line in self.signal_lines.values():
+                self.ax.draw_artist(line)
+            self.canvas.blit(self.ax.bbox)
             
         except Exception as e:
             messagebox.showerror("خطأ", f"تعذر تحليل الإشارات: {str(e)}")